@@ -0,0 +1,106 @@
+# coding=utf-8
+
+import time
+
+
+class BenchmarkRecorder:
+    """Collects per-request latencies and wall-clock throughput, bounded by a deadline and an operation budget."""
+
+    def __init__(self, duration: float, max_ops: int):
+        self.duration = duration
+        self.started_at = time.time()
+        self.deadline = time.monotonic() + duration
+        self.max_ops = max_ops
+        self.total = 0
+        self.samples = {}
+        self.counts = {}
+        self.batches = {}
+        self.elapsed = {}
+        self.recorded_at = None
+
+    def running(self):
+        return self.total < self.max_ops and time.monotonic() < self.deadline
+
+    def record(self, operation: str, latency: float, count: int = 1):
+        # a pipelined batch is one latency sample covering count operations
+        self.samples.setdefault(operation, []).append(latency)
+        self.counts[operation] = self.counts.get(operation, 0) + count
+        self.batches[operation] = max(self.batches.get(operation, 1), count)
+        # throughput is charged the wall-clock time since the previous request, client-side
+        # work between requests included, not only the round trip
+        now = time.perf_counter()
+        elapsed = max(now - self.recorded_at, latency) if self.recorded_at is not None else latency
+        self.recorded_at = now
+        self.elapsed[operation] = self.elapsed.get(operation, 0) + elapsed
+        self.total += count
+
+    def summarize(self):
+        operations = {}
+        for operation, samples in self.samples.items():
+            samples.sort()
+            elapsed = self.elapsed[operation]
+            operations[operation] = {
+                'count': self.counts[operation],
+                'ops_per_sec': round(self.counts[operation] / elapsed) if elapsed else 0,
+                # latencies are per request, a request carries batch_size operations
+                'batch_size': self.batches[operation],
+                'latency_ms': {
+                    'p50': percentile(samples, 0.5),
+                    'p95': percentile(samples, 0.95),
+                    'p99': percentile(samples, 0.99),
+                    'max': round(samples[-1] * 1000, 3),
+                },
+            }
+        elapsed = sum(self.elapsed.values())
+        return {
+            'started_at': self.started_at,
+            'ops': self.total,
+            'ops_per_sec': round(self.total / elapsed) if elapsed else 0,
+            'operations': operations,
+        }
+
+
+def percentile(samples: list, ratio: float):
+    # samples are sorted, reported in milliseconds
+    if not samples:
+        return None
+    index = min(len(samples) - 1, int(round(ratio * (len(samples) - 1))))
+    return round(samples[index] * 1000, 3)
+
+
+def compare_proxy(direct: dict, proxied: dict):
+    """What going through the proxy costs, per operation, relative to the direct port."""
+    operations = {}
+    for operation, measured in proxied['operations'].items():
+        baseline = direct['operations'].get(operation)
+        if baseline is None:
+            continue
+        latency, direct_latency = measured['latency_ms'], baseline['latency_ms']
+        operations[operation] = {
+            'ops_per_sec': measured['ops_per_sec'],
+            'throughput_ratio': round(measured['ops_per_sec'] / baseline['ops_per_sec'], 3)
+                                if baseline['ops_per_sec'] else None,
+            'latency_ms': latency,
+            'added_latency_ms': dict(
+                (key, round(latency[key] - direct_latency[key], 3)) for key in ('p50', 'p95', 'p99')),
+        }
+    return {
+        'ops': proxied['ops'],
+        'ops_per_sec': proxied['ops_per_sec'],
+        'throughput_ratio': round(proxied['ops_per_sec'] / direct['ops_per_sec'], 3) if direct['ops_per_sec'] else None,
+        'operations': operations,
+    }
+
+
+def compare_baseline(result: dict, baseline: dict):
+    """Flags every operation whose throughput is below its profile's expectation."""
+    below = []
+    for operation, expected in baseline.items():
+        measured = result['operations'].get(operation)
+        if measured is not None and measured['ops_per_sec'] < expected:
+            below.append(operation)
+    return {
+        'expected_ops_per_sec': baseline,
+        'below_expectation': below,
+        'meets_expectation': not below,
+    }
@@ -0,0 +1,94 @@
+# coding=utf-8
+
+import re
+import heapq
+
+
+SEPARATOR_PATTERN = re.compile(r'([:/|.#])')
+# segments that identify one object rather than a kind of object
+ID_PATTERN = re.compile(
+    r'^(\d+|[0-9a-fA-F]{8,}|[0-9a-fA-F]{8}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{4}-[0-9a-fA-F]{12})$')
+
+
+def make_prefix_pattern(key: str, depth: int):
+    """Folds a key into its pattern, e.g. user:1042:profile -> user:*:profile."""
+    parts = SEPARATOR_PATTERN.split(key)
+    segments = parts[0::2]
+    separators = parts[1::2]
+    if len(segments) == 1:
+        return '*' if ID_PATTERN.match(key) else key
+
+    pattern = []
+    for index, segment in enumerate(segments[:depth]):
+        if index:
+            pattern.append(separators[index - 1])
+        pattern.append('*' if ID_PATTERN.match(segment) else segment)
+    if len(segments) > depth:
+        pattern.append(separators[depth - 1] + '*')
+    return ''.join(pattern)
+
+
+class KeyspaceAggregator:
+    """Streaming per-pattern totals and the largest keys, in bounded memory.
+
+    Patterns are tracked with the space-saving algorithm: once the table is full,
+    the smallest pattern is replaced and its bytes are carried over as an error bound.
+    """
+
+    def __init__(self, max_patterns: int, top_keys: int, depth: int):
+        self.max_patterns = max_patterns
+        self.top_keys = top_keys
+        self.depth = depth
+        self.patterns = {}
+        self.largest = []
+        self.sampled = 0
+        self.sampled_bytes = 0
+
+    def add(self, key: str, size: int, key_type: str, ttl: int):
+        self.sampled += 1
+        self.sampled_bytes += size
+
+        pattern = make_prefix_pattern(key, self.depth)
+        entry = self.patterns.get(pattern)
+        if entry is None:
+            error = 0
+            if len(self.patterns) >= self.max_patterns:
+                smallest = min(self.patterns, key=lambda name: self.patterns[name]['bytes'])
+                error = self.patterns.pop(smallest)['bytes']
+            entry = self.patterns[pattern] = {
+                'pattern': pattern, 'keys': 0, 'bytes': error, 'error': error, 'types': {}, 'persistent': 0,
+            }
+        entry['keys'] += 1
+        entry['bytes'] += size
+        entry['types'][key_type] = entry['types'].get(key_type, 0) + 1
+        if ttl == -1:
+            entry['persistent'] += 1
+
+        item = (size, key, key_type)
+        if len(self.largest) < self.top_keys:
+            heapq.heappush(self.largest, item)
+        elif item > self.largest[0]:
+            heapq.heapreplace(self.largest, item)
+
+    def report(self, scanned: int, total_keys: int, limit: int):
+        # every sampled key stands for scanned / sampled keys, and the scan for the whole keyspace
+        scale = scanned / self.sampled if self.sampled else 0
+        if scanned and total_keys > scanned:
+            scale *= total_keys / scanned
+
+        patterns = sorted(self.patterns.values(), key=lambda entry: entry['bytes'], reverse=True)[:limit]
+        return {
+            'scanned': scanned,
+            'sampled': self.sampled,
+            'total_keys': total_keys,
+            'sampled_bytes': self.sampled_bytes,
+            'estimated_bytes': int(self.sampled_bytes * scale),
+            'patterns': [
+                dict(entry, estimated_keys=int(entry['keys'] * scale), estimated_bytes=int(entry['bytes'] * scale))
+                for entry in patterns
+            ],
+            'largest_keys': [
+                {'key': key, 'bytes': size, 'type': key_type}
+                for size, key, key_type in sorted(self.largest, reverse=True)
+            ],
+        }
@@ -1,13 +1,35 @@
 # coding=utf-8
 
+import os
+import json
+import time
+import uuid
+import zlib
+import base64
+import hashlib
 import random
 import threading
+import contextlib
+from concurrent.futures import ThreadPoolExecutor
 import docker
 
-from ..models.container import ContainerInstance, ContainerStatus
+from ..models.container import ContainerInstance, ContainerStatus, format_timestamp, parse_docker_time
 from framework.conf import settings
+from framework.docker import DockerManager
 from framework.exception import ServiceException
-from framework.utils import check_connection
+from framework.singleflight import SingleFlight
+from framework.utils import check_connection, clone_tree
+from .volume import VolumeManager, StorageTier
+from ..snapshot import iter_snapshot
+from ..benchmark import BenchmarkRecorder, compare_baseline, compare_proxy
+from ..profiles import WorkloadProfile, get_benchmark_baseline
+from .hibernation import HibernationManager, HibernationMode
+from .stats import StatsManager
+from .watch import WatchManager, WatchEvent
+from .idempotency import IdempotencyManager
+from .lease import LeaseManager
+from .health import HealthManager
+from .insights import InsightsManager
 
 
 class BaseManager:
@@ -16,6 +38,31 @@ class BaseManager:
     _instance = None
 
     image_tag = ''
+    storage_type = ''
+    container_port = ''
+    # commands one hibernation sample sends
+    sample_commands = 0
+    # commands one health probe sends
+    ping_commands = 0
+
+    # container events that change what the list endpoint reports
+    inventory_actions = {
+        'create', 'start', 'restart', 'stop', 'die', 'kill', 'oom',
+        'pause', 'unpause', 'rename', 'update', 'destroy',
+    }
+    # container events -> lifecycle events pushed to watchers
+    lifecycle_events = {
+        'create': WatchEvent.CREATED,
+        'start': WatchEvent.RUNNING,
+        'unpause': WatchEvent.RUNNING,
+        'die': WatchEvent.EXITED,
+        'pause': WatchEvent.PAUSED,
+        'destroy': WatchEvent.REMOVED,
+    }
+
+    # creates still in flight per owner, shared by every storage type
+    _quota_mutex = threading.Lock()
+    _quota_pending = {}
 
     def __new__(cls, logger, *args, **kwargs):
         with cls._mutex:
@@ -33,43 +80,688 @@ class BaseManager:
 
     def __init__(self, logger):
         self.logger = logger
-        self.docker_client = None
+        self.docker = DockerManager.instance()
+        self.volume = VolumeManager.instance()
+        self.hibernation = HibernationManager.instance()
+        self.hibernation.register(self)
+        self.collector = StatsManager.instance()
+        self.collector.register(self)
+        self.watch = WatchManager.instance()
+        self.idempotency = IdempotencyManager.instance()
+        self.lease = LeaseManager.instance()
+        self.lease.register(self)
+        self.health = HealthManager.instance()
+        self.health.register(self)
+        self.insights = InsightsManager.instance()
+        self.insights.register(self)
+        self._port_mutex = threading.Lock()
+        self._reserved_ports = {}
+        self._benchmark_mutex = threading.Lock()
+        self._benchmark_slots = threading.BoundedSemaphore(settings.BENCHMARK_CONCURRENCY)
+        self._benchmarking = set()
+
+        self.epoch = uuid.uuid4().hex[:8]
+        self.version = 0
+        self.modified_at = time.time()
+        self.config_tags = {}
+        self._version_mutex = threading.Lock()
+        # concurrent identical reads share one docker / filesystem round trip; a
+        # container object is only shared while in flight, it is mutated by callers
+        self.flights = {
+            'list': SingleFlight(settings.SINGLEFLIGHT_TTL),
+            'get': SingleFlight(),
+            'info': SingleFlight(settings.SINGLEFLIGHT_TTL),
+        }
+        self.docker.subscribe(self.on_docker_event)
+
+    @property
+    def docker_client(self):
+        return self.docker.get_client()
+
+    def on_docker_event(self, event: dict):
+        if event.get('Type') != 'container' or event.get('Action') not in self.inventory_actions:
+            return
+        actor = event.get('Actor') or {}
+        attributes = actor.get('Attributes') or {}
+        if attributes.get('bk.storage') != self.storage_type and attributes.get('image') != self.image_tag:
+            return
+
+        container_id = actor.get('ID', '')[:12]
+        self.touch()
+        if event['Action'] == 'destroy':
+            self.invalidate_config(container_id)
+            self.lease.forget(container_id)
+            self.hibernation.forget(container_id)
+        if event['Action'] in self.lifecycle_events:
+            self.notify(container_id, self.lifecycle_events[event['Action']])
+
+    def notify(self, container_id: str, event_type: str):
+        self.watch.publish(self.storage_type, container_id, event_type)
+
+    def touch(self):
+        with self._version_mutex:
+            self.version += 1
+            self.modified_at = time.time()
+        self.flights['list'].forget()
+
+    def get_list_etag(self, query: str = ''):
+        # the version only tracks changes while the event stream is up
+        if not self.docker.events_live:
+            return None, None
+        tag = f'{self.epoch}.{self.docker.events_generation}.{self.version}.{zlib.crc32(query.encode()):08x}'
+        return f'W/"{tag}"', self.modified_at
+
+    def get_config_etag(self, container_id: str):
+        entry = self.config_tags.get(container_id)
+        if entry is None or not self.docker.events_live or entry[2] != self.docker.events_generation:
+            return None, None
+        return entry[0], entry[1]
+
+    def set_config_etag(self, container_id: str, content: bytes):
+        etag = f'W/"{hashlib.sha1(content).hexdigest()[:20]}"'
+        previous = self.config_tags.get(container_id)
+        modified_at = previous[1] if previous and previous[0] == etag else time.time()
+        self.config_tags[container_id] = (etag, modified_at, self.docker.events_generation)
+        return etag, modified_at
+
+    def invalidate_config(self, container_id: str):
+        self.config_tags.pop(container_id, None)
+        self.flights['info'].forget(container_id)
+
+    def make_instance(self, container):
+        group = container.labels.get('bk.group')
+        return self.build_instance(
+                    container.short_id, container.name, container.ports,
+                    container.status, parse_docker_time(container.attrs['Created']),
+                    group and self.describe_group(self.list_group(group)))
+
+    def make_instance_from_summary(self, item: dict, members: list = None):
+        # the list API reports ports as a flat list, fold it into the inspect layout
+        ports = {}
+        for port in item.get('Ports') or []:
+            key = f"{port['PrivatePort']}/{port['Type']}"
+            if 'PublicPort' not in port:
+                ports.setdefault(key, None)
+                continue
+            if ports.get(key) is None:
+                ports[key] = []
+            ports[key].append({'HostIp': port.get('IP', ''), 'HostPort': str(port['PublicPort'])})
+
+        return self.build_instance(
+                    item['Id'][:12], item['Names'][0].lstrip('/'), ports,
+                    item['State'], item['Created'],
+                    members and self.describe_group(members))
+
+    def build_instance(self, container_id: str, name: str, ports: dict, state: str, created_at: int,
+                       group: dict = None):
         try:
-            self.docker_client = docker.DockerClient(base_url=settings.DOCKER_BASE_URL)
-        except docker.errors.DockerException:
-            self.logger.error('Docker client connection fails.')
-
-    def list(self):
-        containers = []
-        for container in self.docker_client.containers.list(all=True):
-            if self.image_tag not in container.image.tags:
+            status = ContainerStatus(state)
+        except ValueError:
+            status = ContainerStatus.UNKNOWN
+
+        hibernation = self.hibernation.get_state(container_id)
+        if hibernation:
+            status = ContainerStatus.HIBERNATED
+
+        return ContainerInstance(
+                    id=container_id,
+                    name=name,
+                    ports=ports,
+                    status=status,
+                    hibernated_at=hibernation and hibernation['hibernated_at'],
+                    created_at=created_at,
+                    expire_at=self.lease.get_expire_at(container_id),
+                    health=self.health.get_state(container_id),
+                    group=group)
+
+    def list_group(self, group: str):
+        # container summaries of every node in a group, the leader (node 0) first
+        items = self.docker_client.api.containers(all=True, filters={'label': f'bk.group={group}'})
+        return sorted(items, key=lambda item: int(item['Labels'].get('bk.node') or 0))
+
+    def get_group(self, container):
+        # a standalone instance is a group of one
+        group = container.labels.get('bk.group')
+        if not group:
+            return [container]
+        containers = self.docker_client.containers.list(all=True, filters={'label': f'bk.group={group}'})
+        return sorted(containers, key=lambda item: int(item.labels.get('bk.node') or 0))
+
+    def apply_to_group(self, container, apply):
+        group = self.get_group(container)
+        if len(group) == 1:
+            return apply(container)
+
+        # one failing node does not stop the others, every node reports its own outcome
+        nodes = []
+        for member in group:
+            try:
+                result = apply(member)
+            except ServiceException as e:
+                result = {'error': str(e)}
+            nodes.append(dict(result, instance=member.short_id, node=int(member.labels.get('bk.node') or 0)))
+        return {'nodes': nodes}
+
+    def is_group_leader(self, labels: dict):
+        return not labels.get('bk.group') or labels.get('bk.node') == '0'
+
+    def describe_group(self, items: list):
+        items = sorted(items, key=lambda item: int(item['Labels'].get('bk.node') or 0))
+        return {
+            'id': items[0]['Labels']['bk.group'],
+            'nodes': [self.describe_node(item) for item in items],
+        }
+
+    def describe_node(self, item: dict):
+        return {
+            'id': item['Id'][:12],
+            'role': item['Labels'].get('bk.role'),
+            'status': item['State'],
+            'port': int(item['Labels'].get('bk.port') or 0),
+        }
+
+    def get_node_count(self, config: dict):
+        return 1
+
+    def ensure_standalone(self, container):
+        # a copy of one node is no copy of the group
+        if container.labels.get('bk.group'):
+            raise ServiceException('多节点实例不支持该操作')
+
+    def list_containers(self, status: str = None):
+        filters = {'ancestor': self.image_tag}
+        if status:
+            filters['status'] = status
+        return self.docker_client.containers.list(all=True, filters=filters)
+
+    def iter_instances(self, status: ContainerStatus = None, port: int = None,
+                       created_after: float = None, after: tuple = None):
+        # container summaries only, no per-container inspect; keyed by version, so callers
+        # arriving after an event never join (or get the cached result of) a call started before it
+        items = self.flights['list'].do(
+                    f'containers.{self.version}',
+                    lambda: self.docker_client.api.containers(all=True, filters={'ancestor': self.image_tag}))
+        groups = {}
+        for item in items:
+            group = (item.get('Labels') or {}).get('bk.group')
+            if group:
+                groups.setdefault(group, []).append(item)
+
+        for item in sorted(items, key=lambda item: (item['Created'], item['Id'][:12])):
+            labels = item.get('Labels') or {}
+            # a group is listed once, as its leader
+            if not self.is_group_leader(labels):
+                continue
+            if created_after is not None and item['Created'] <= created_after:
                 continue
-            containers.append(ContainerInstance(
-                id=container.short_id,
-                name=container.name,
-                ports=container.ports,
-                status=ContainerStatus(container.status)))
+            if after is not None and (item['Created'], item['Id'][:12]) <= after:
+                continue
+            instance = self.make_instance_from_summary(item, groups.get(labels.get('bk.group')))
+            if status is not None and instance.status != status:
+                continue
+            if port is not None and not instance.has_host_port(port):
+                continue
+            yield instance
+
+    def list(self, **filters):
+        return list(self.iter_instances(**filters))
+
+    def encode_cursor(self, instance):
+        cursor = f'{instance.created_at}:{instance.id}'.encode()
+        return base64.urlsafe_b64encode(cursor).decode().rstrip('=')
+
+    def decode_cursor(self, cursor: str):
+        try:
+            created_at, container_id = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode().split(':')
+            return int(created_at), container_id
+        except ValueError:
+            raise ServiceException('分页游标无效')
+
+    def query(self, cursor: str = None, limit: int = None, **filters):
+        instances = self.list(**filters)
+        total = len(instances)
+        if cursor:
+            after = self.decode_cursor(cursor)
+            instances = [instance for instance in instances if (instance.created_at, instance.id) > after]
 
-        return containers
+        next_cursor = None
+        if limit and len(instances) > limit:
+            instances = instances[:limit]
+            next_cursor = self.encode_cursor(instances[-1])
+        return total, instances, next_cursor
 
-    def get(self, container_id: str = ''):
+    def get(self, container_id: str = '', resume: bool = True):
         try:
-            container = self.docker_client.containers.get(container_id)
+            container = self.flights['get'].do(
+                            container_id, lambda: self.docker_client.containers.get(container_id))
         except docker.errors.NotFound:
             raise ServiceException('容器实例不存在')
 
         if self.image_tag not in container.image.tags:
             raise ServiceException('容器实例与存储资源类型不符')
 
+        # any access to a hibernated instance wakes it up
+        if resume and self.hibernation.resume(container):
+            self.touch()
+            container.reload()
+
         return container
 
-    def create(self, config: dict = dict()):
+    def info(self, container_id: str):
+        return self.flights['info'].do(container_id, lambda: self.read_info(container_id))
+
+    def read_info(self, container_id: str):
         raise NotImplementedError
 
-    def remove(self, container_id: str = ''):
+    def flight_stats(self):
+        return dict((name, flight.report()) for name, flight in self.flights.items())
+
+    def exists(self, container_id: str):
+        try:
+            self.docker_client.containers.get(container_id)
+        except docker.errors.NotFound:
+            return False
+        return True
+
+    def restart(self, container_id: str):
+        container = self.get(container_id, resume=False)
+        container.restart(timeout=settings.HEALTH_RESTART_TIMEOUT)
+
+    async def ping(self, host: str, port: int, password: str = ''):
+        raise NotImplementedError
+
+    def get_insights(self, container_id: str, limit: int = 10):
+        container = self.get(container_id, resume=False)
+        return self.insights.report(container.short_id, limit)
+
+    def collect_insights(self, container, state: dict):
+        raise NotImplementedError
+
+    def benchmark(self, container_id: str, duration: float, proxy: bool = False):
+        if not 0 < duration <= settings.BENCHMARK_MAX_DURATION:
+            raise ServiceException(f'性能测试时长须在0~{settings.BENCHMARK_MAX_DURATION}秒之间')
+
         container = self.get(container_id)
-        container.stop()
-        container.remove()
+        volume_path = self.get_volume_path(container)
+        if volume_path is None:
+            raise ServiceException('容器实例中未发现数据目录')
+        if proxy:
+            self.get_proxy_address()
+
+        with self._benchmark_mutex:
+            if container.short_id in self._benchmarking:
+                raise ServiceException('该实例正在进行性能测试')
+            # the load comes from this host, only a few tests may run at once
+            if not self._benchmark_slots.acquire(blocking=False):
+                raise ServiceException('进行中的性能测试过多，请稍后重试')
+            self._benchmarking.add(container.short_id)
+
+        try:
+            recorder = BenchmarkRecorder(duration, settings.BENCHMARK_MAX_OPS)
+            self.run_benchmark(container, recorder)
+            if proxy:
+                # the same load again through the proxy, right after, so both runs see the same instance state
+                proxy_recorder = BenchmarkRecorder(duration, settings.BENCHMARK_MAX_OPS)
+                self.run_benchmark(container, proxy_recorder, proxy=True)
+        finally:
+            with self._benchmark_mutex:
+                self._benchmarking.discard(container.short_id)
+                self._benchmark_slots.release()
+
+        result = recorder.summarize()
+        profile = self.read_profile(volume_path)
+        result.update(
+            started_at=format_timestamp(result['started_at']),
+            duration=duration,
+            profile=profile.get('profile'),
+            tier=profile.get('tier'),
+            **compare_baseline(result, get_benchmark_baseline(self.storage_type, profile)))
+        if proxy:
+            result['proxy'] = compare_proxy(result, proxy_recorder.summarize())
+        with open(f'{volume_path}/benchmark.json', 'w') as fp:
+            json.dump(result, fp)
+        return result
+
+    def get_benchmark(self, container_id: str):
+        container = self.get(container_id, resume=False)
+        try:
+            with open(f'{self.get_volume_path(container)}/benchmark.json', 'r') as fp:
+                return json.load(fp)
+        except (FileNotFoundError, TypeError, ValueError):
+            return None
+
+    def run_benchmark(self, container, recorder: BenchmarkRecorder, proxy: bool = False):
+        raise NotImplementedError
+
+    def get_proxy_address(self):
+        # the proxy runs in this process, a wildcard listener is reached over loopback
+        port = getattr(settings, f'PROXY_{self.storage_type.upper()}_PORT', 0)
+        if not settings.PROXY_ENABLED or not port:
+            raise ServiceException('代理服务未开启')
+        host = settings.PROXY_HOST
+        return ('127.0.0.1' if host in ('0.0.0.0', '') else host), port
+
+    def renew(self, container_id: str, ttl: int):
+        container = self.get(container_id, resume=False)
+        self.lease.grant(self.storage_type, container.short_id, ttl)
+        self.touch()
+        return self.make_instance(container)
+
+    def extend(self, container_id: str, seconds: int):
+        container = self.get(container_id, resume=False)
+        self.lease.extend(container.short_id, seconds)
+        self.touch()
+        return self.make_instance(container)
+
+    def resume(self, container_id: str = ''):
+        container = self.get(container_id, resume=False)
+        self.hibernation.resume(container)
+        container.reload()
+        return self.make_instance(container)
+
+    def list_stats(self):
+        # every group reports as one entry, summed over its nodes
+        entries, groups = [], {}
+        for entry in self.collector.report(self.storage_type):
+            if entry.get('group'):
+                groups.setdefault(entry['group'], []).append(entry)
+            else:
+                entries.append(entry)
+        entries.extend(self.sum_stats(group, members) for group, members in groups.items())
+        return entries
+
+    def stats(self, container_id: str = '', history: bool = False):
+        container = self.get(container_id, resume=False)
+        group = container.labels.get('bk.group')
+        if not group:
+            return self.collector.get(container.short_id, history)
+
+        nodes = dict((item['Id'][:12], self.collector.get(item['Id'][:12], history)) for item in self.list_group(group))
+        if not any(nodes.values()):
+            return None
+        if history:
+            return {'group': group, 'nodes': nodes}
+        return dict(self.sum_stats(group, [entry for entry in nodes.values() if entry]), nodes=nodes)
+
+    def sum_stats(self, group: str, entries: list):
+        leader = min(entries, key=lambda entry: int(entry.get('node') or 0))
+        total = {'id': leader['id'], 'type': leader['type'], 'group': group, 'node_count': len(entries)}
+        for entry in entries:
+            for key, value in entry.items():
+                if key in ('id', 'type', 'group', 'node'):
+                    continue
+                if key == 'timestamp':
+                    total[key] = max(total.get(key, 0), value)
+                elif isinstance(value, (int, float)):
+                    total[key] = round(total.get(key, 0) + value, 2)
+        return total
+
+    def get_hibernation_mode(self, container):
+        # a stopped container loses its tmpfs, only pausing keeps the data
+        if self.read_profile(self.get_volume_path(container)).get('tier') == StorageTier.TMPFS:
+            return HibernationMode.PAUSE
+        return settings.HIBERNATION_MODE
+
+    def get_host_port(self, container):
+        bindings = container.attrs['HostConfig']['PortBindings'].get(self.container_port) or []
+        for item in bindings:
+            if item.get('HostPort'):
+                return int(item['HostPort'])
+        return 0
+
+    def get_connection(self, container):
+        raise NotImplementedError
+
+    def open_client(self, container):
+        raise NotImplementedError
+
+    def count_commands(self, container):
+        raise NotImplementedError
+
+    def get_volume_path(self, container):
+        volume_path = container.labels.get('bk.volume')
+        if volume_path:
+            return volume_path
+
+        for item in container.attrs['Mounts']:
+            volume_path = self.volume.resolve(item['Source'])
+            if volume_path:
+                return volume_path
+        return None
+
+    def write_profile(self, config: dict, volume_path: str):
+        # kept inside the volume so snapshots and clones carry the budget along
+        profile = dict((key, config.get(key)) for key in ('profile', 'memory', 'cpus', 'tier'))
+        with open(f'{volume_path}/profile.json', 'w') as fp:
+            json.dump(profile, fp)
+
+    def read_profile(self, volume_path: str):
+        try:
+            with open(f'{volume_path}/profile.json', 'r') as fp:
+                return json.load(fp)
+        except (FileNotFoundError, TypeError, ValueError):
+            return {'profile': None, 'memory': 0, 'cpus': 0, 'tier': StorageTier.DISK}
+
+    def load_profile(self, volume_path: str):
+        # profile.json may come from an uploaded snapshot, only keep what the create schema would accept
+        profile = self.read_profile(volume_path)
+        if not isinstance(profile, dict):
+            raise ValueError('profile.json')
+        memory, cpus = profile.get('memory') or 0, profile.get('cpus') or 0
+        if isinstance(memory, bool) or not isinstance(memory, int) or memory < 0:
+            raise ValueError('memory')
+        if isinstance(cpus, bool) or not isinstance(cpus, (int, float)) or cpus < 0:
+            raise ValueError('cpus')
+        return {
+            'profile': WorkloadProfile(profile['profile']).value if profile.get('profile') else None,
+            'memory': memory,
+            'cpus': cpus,
+            'tier': StorageTier(profile.get('tier') or StorageTier.DISK).value,
+        }
+
+    def make_resource_limits(self, config: dict):
+        limits = {}
+        if config.get('memory'):
+            limits['mem_limit'] = config['memory']
+        if config.get('cpus'):
+            limits['nano_cpus'] = int(config['cpus'] * 1e9)
+        return limits
+
+    def make_labels(self, volume_path: str, config: dict = dict()):
+        labels = {
+            'bk.storage': self.storage_type,
+            'bk.volume': volume_path,
+            'bk.memory': str(self.get_memory_budget(config)),
+        }
+        if config.get('owner'):
+            labels['bk.owner'] = config['owner']
+        return labels
+
+    def get_memory_budget(self, config: dict):
+        return config.get('memory') or settings.PROFILE_DEFAULT_MEMORY
+
+    def get_usage(self, owner: str):
+        # counted from the container inventory, across every storage type
+        items = self.docker_client.api.containers(all=True, filters={'label': f'bk.owner={owner}'})
+        return len(items), sum(int((item.get('Labels') or {}).get('bk.memory') or 0) for item in items)
+
+    @contextlib.contextmanager
+    def reserve_quota(self, config: dict):
+        owner = config.get('owner')
+        if not owner or not (settings.QUOTA_MAX_INSTANCES or settings.QUOTA_MAX_MEMORY):
+            yield
+            return
+
+        # usage counts containers, a group takes one per node
+        nodes = self.get_node_count(config)
+        memory = self.get_memory_budget(config) * nodes
+        with self._quota_mutex:
+            count, used = self.get_usage(owner)
+            pending = self._quota_pending.setdefault(owner, [0, 0])
+            if settings.QUOTA_MAX_INSTANCES and count + pending[0] + nodes > settings.QUOTA_MAX_INSTANCES:
+                raise ServiceException(f'实例数量超出配额（{settings.QUOTA_MAX_INSTANCES}）')
+            if settings.QUOTA_MAX_MEMORY and used + pending[1] + memory > settings.QUOTA_MAX_MEMORY:
+                raise ServiceException(f'实例内存总量超出配额（{settings.QUOTA_MAX_MEMORY}）')
+            pending[0] += nodes
+            pending[1] += memory
+
+        try:
+            yield
+        finally:
+            with self._quota_mutex:
+                pending[0] -= nodes
+                pending[1] -= memory
+                if pending[0] <= 0:
+                    self._quota_pending.pop(owner, None)
+
+    def create(self, config: dict = dict(), source: str = None):
+        with self.reserve_quota(config):
+            volume_path = self.volume.allocate(self.storage_type, config.get('tier'))
+            try:
+                # seed the volume with existing data, e.g. a restored snapshot
+                if source:
+                    clone_tree(source, volume_path)
+                    for name in ('snapshot.json', 'benchmark.json'):
+                        if os.path.exists(f'{volume_path}/{name}'):
+                            os.remove(f'{volume_path}/{name}')
+                instance, connection = self.provision(config, volume_path, seeded=bool(source))
+                if config.get('ttl'):
+                    instance.expire_at = self.lease.grant(self.storage_type, instance.id, config['ttl'])
+                return instance, connection
+            except BaseException:
+                self.cleanup(volume_path)
+                raise
+
+    def create_once(self, key: str, config: dict = dict()):
+        fingerprint = hashlib.sha1(json.dumps(config, sort_keys=True).encode()).hexdigest()[:12]
+
+        def recover(container_id):
+            container = self.get(container_id)
+            return self.make_instance(container), self.get_connection(container)
+
+        return self.idempotency.run(
+                    self.storage_type, key, fingerprint,
+                    func=lambda: self.create(dict(config)),
+                    reference=lambda result: result[0].id,
+                    recover=recover)
+
+    def provision(self, config: dict, volume_path: str, seeded: bool = False):
+        raise NotImplementedError
+
+    def load_config(self, volume_path: str):
+        raise NotImplementedError
+
+    def restore(self, source: str, owner: str = None, ttl: int = None):
+        try:
+            with open(f'{source}/snapshot.json', 'r') as fp:
+                metadata = json.load(fp)
+        except (FileNotFoundError, ValueError):
+            raise ServiceException('快照文件缺少元数据')
+        if metadata.get('type') != self.storage_type:
+            raise ServiceException('快照与存储资源类型不符')
+
+        try:
+            config = self.load_config(source)
+        except (TypeError, ValueError):
+            raise ServiceException('快照中的实例配置无效')
+        config['owner'] = owner
+        config['ttl'] = ttl
+        return self.create(config, source=source)
+
+    def clone(self, container_id: str = '', count: int = 1, owner: str = None, ttl: int = None):
+        if not 1 <= count <= settings.CLONE_MAX_COUNT:
+            raise ServiceException(f'克隆数量须在1~{settings.CLONE_MAX_COUNT}之间')
+
+        # one checkpoint feeds every copy, the source is frozen only once
+        with self.checkpoint(container_id) as snapshot_path:
+            config = self.load_config(snapshot_path)
+            config['owner'] = owner
+            config['ttl'] = ttl
+            workers = min(count, settings.CLONE_CONCURRENCY)
+            with ThreadPoolExecutor(max_workers=workers, thread_name_prefix='clone') as executor:
+                # every copy gets its own config, provision() writes the generated password into it
+                futures = [executor.submit(self.create, dict(config), snapshot_path) for _ in range(count)]
+
+            results, errors = [], []
+            for future in futures:
+                try:
+                    results.append(future.result())
+                except Exception as e:
+                    errors.append(e)
+
+        if errors:
+            for instance, _ in results:
+                self.remove(instance.id)
+            raise errors[0]
+        return results
+
+    def export_snapshot(self, container_id: str = '', compression: str = 'none'):
+        # take the checkpoint now so failures surface before the response starts streaming
+        stack = contextlib.ExitStack()
+        snapshot_path = stack.enter_context(self.checkpoint(container_id))
+
+        def generate():
+            with stack:
+                yield from iter_snapshot(snapshot_path, compression)
+
+        return generate()
+
+    @contextlib.contextmanager
+    def consistent_point(self, container):
+        yield {}
+
+    @contextlib.contextmanager
+    def checkpoint(self, container_id: str = ''):
+        container = self.get(container_id)
+        self.ensure_standalone(container)
+        volume_path = self.get_volume_path(container)
+        if volume_path is None:
+            raise ServiceException('容器实例中未发现数据目录')
+        if self.read_profile(volume_path).get('tier') == StorageTier.TMPFS:
+            raise ServiceException('内存存储实例的数据不在数据目录中，无法导出')
+
+        with self.volume.staging(volume_path) as staging_path:
+            # flush to disk first, then freeze the container only for the (reflink) copy,
+            # so the copy is at least crash consistent
+            with self.consistent_point(container) as metadata:
+                container.pause()
+                try:
+                    clone_tree(volume_path, staging_path)
+                finally:
+                    container.unpause()
+
+            metadata.update({
+                'type': self.storage_type,
+                'instance': container.short_id,
+                'image': self.image_tag,
+            })
+            with open(f'{staging_path}/snapshot.json', 'w') as fp:
+                json.dump(metadata, fp)
+            yield staging_path
+
+    def cleanup(self, volume_path: str):
+        # drop whatever a failed create left behind: containers and the volume itself
+        try:
+            for item in self.docker_client.api.containers(all=True, filters={'label': f'bk.volume={volume_path}'}):
+                self.docker_client.api.remove_container(item['Id'], force=True)
+        except (ServiceException, docker.errors.DockerException) as e:
+            self.logger.error(f'Container cleanup for {volume_path} fails: {e}')
+        self.volume.release(volume_path, policy='delete')
+
+    def remove(self, container_id: str = ''):
+        container = self.get(container_id, resume=False)
+        volume_path = self.get_volume_path(container)
+        # a group goes as one unit, its nodes share the volume
+        for member in self.get_group(container):
+            if member.status == 'paused':
+                member.unpause()
+            member.stop()
+            member.remove()
+            self.hibernation.forget(member.short_id)
+            self.lease.forget(member.short_id)
+            self.invalidate_config(member.short_id)
+        if volume_path:
+            self.volume.release(volume_path)
         return True
 
     def generate_random_password(self):
@@ -84,16 +776,22 @@ class BaseManager:
         random.shuffle(password_chars)
         return ''.join(password_chars)
 
-    def generate_random_volume(self):
-        volume_name_chars = random.sample('0123456789abcdef', 6)
-        random.shuffle(volume_name_chars)
-        return ''.join(volume_name_chars)
-
     def pick_random_port(self):
-        max_tries = 10
-        while max_tries > 0:
-            max_tries -= 1
-            port = random.choice(range(10000, 60000))
-            if not check_connection(settings.DOCKER_HOST_IP, port):
-                return port
-        return 0
+        # concurrent creates (e.g. clones) must not be handed the same port
+        # before either container has bound it
+        with self._port_mutex:
+            now = time.monotonic()
+            for port, reserved_at in list(self._reserved_ports.items()):
+                if now - reserved_at > 60:
+                    self._reserved_ports.pop(port)
+
+            max_tries = 10
+            while max_tries > 0:
+                max_tries -= 1
+                port = random.choice(range(10000, 60000))
+                if port in self._reserved_ports:
+                    continue
+                if not check_connection(settings.DOCKER_HOST_IP, port):
+                    self._reserved_ports[port] = now
+                    return port
+            return 0
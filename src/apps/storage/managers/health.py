@@ -0,0 +1,216 @@
+# coding=utf-8
+
+import time
+import random
+import asyncio
+import threading
+
+import docker
+import requests
+
+from framework.conf import settings
+from framework.exception import ServiceException
+from ..models.container import format_timestamp
+from ..protocol import ProtocolError
+from .watch import WatchEvent
+from .volume import StorageTier
+
+
+class HealthStatus:
+    STARTING = 'starting'
+    HEALTHY = 'healthy'
+    UNHEALTHY = 'unhealthy'
+
+
+class RestartPolicy:
+    NEVER = 'never'
+    ON_FAILURE = 'on-failure'
+
+
+class HealthManager:
+
+    _mutex = threading.Lock()
+    _instance = None
+
+    def __new__(cls, logger, *args, **kwargs):
+        with cls._mutex:
+            if cls._instance is None:
+                cls._instance = object.__new__(cls, *args, **kwargs)
+        return cls._instance
+
+    @classmethod
+    def init(cls, logger=None):
+        cls._instance = cls(logger)
+
+    @classmethod
+    def instance(cls):
+        return cls._instance
+
+    def __init__(self, logger):
+        self.logger = logger
+        self.managers = []
+        # container id -> probe address, resolved once per container
+        self.targets = {}
+        self.states = {}
+        self.task = None
+
+    def register(self, manager):
+        self.managers.append(manager)
+
+    def get_state(self, container_id: str):
+        state = self.states.get(container_id)
+        if state is None:
+            return None
+        return {
+            'status': state['status'],
+            'latency': state['latency'],
+            'checked_at': format_timestamp(state['checked_at']),
+            'restarts': state['restarts'],
+            'error': state['error'],
+        }
+
+    async def start(self):
+        self.task = asyncio.ensure_future(self.run())
+
+    async def stop(self):
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    def collect_targets(self):
+        # runs in the executor: a container summary listing, plus one inspect per new container
+        targets, alive = [], set()
+        for manager in self.managers:
+            items = manager.docker_client.api.containers(
+                        filters={'ancestor': manager.image_tag, 'status': 'running'})
+            for item in items:
+                container_id = item['Id'][:12]
+                alive.add(container_id)
+                target = self.targets.get(container_id)
+                if target is None:
+                    container = manager.get(container_id, resume=False)
+                    connection = manager.get_connection(container)
+                    profile = manager.read_profile(manager.get_volume_path(container))
+                    target = self.targets[container_id] = {
+                        'id': container_id,
+                        'manager': manager,
+                        'host': connection.host,
+                        'port': connection.port,
+                        'password': connection.password,
+                        'created_at': item['Created'],
+                        # a restart wipes a tmpfs datadir, such instances are only reported
+                        'restartable': profile.get('tier') != StorageTier.TMPFS,
+                    }
+                targets.append(target)
+
+        # stopped, paused (hibernated) or removed containers are not probed
+        for container_id in list(self.targets):
+            if container_id not in alive:
+                self.targets.pop(container_id, None)
+                self.states.pop(container_id, None)
+        return targets
+
+    async def run(self):
+        loop = asyncio.get_running_loop()
+        semaphore = asyncio.Semaphore(settings.HEALTH_MAX_CONCURRENCY)
+        while True:
+            started_at = loop.time()
+            try:
+                targets = await loop.run_in_executor(None, self.collect_targets)
+            except (ServiceException, docker.errors.DockerException, requests.exceptions.RequestException) as e:
+                self.logger.error(f'Health target collection fails: {e}')
+                targets = []
+
+            # spread the probes over part of the interval instead of a burst every tick
+            spread = settings.HEALTH_INTERVAL * settings.HEALTH_JITTER
+            await asyncio.gather(*[self.probe(target, semaphore, random.uniform(0, spread)) for target in targets])
+            await asyncio.sleep(max(0, settings.HEALTH_INTERVAL - (loop.time() - started_at)))
+
+    async def probe(self, target: dict, semaphore, delay: float):
+        await asyncio.sleep(delay)
+        loop = asyncio.get_running_loop()
+        async with semaphore:
+            manager = target['manager']
+            # probes must not keep an otherwise idle instance from hibernating
+            if manager.ping_commands:
+                manager.hibernation.account(target['id'], manager.ping_commands)
+            started_at = loop.time()
+            try:
+                await asyncio.wait_for(
+                    manager.ping(target['host'], target['port'], target['password']),
+                    settings.HEALTH_PROBE_TIMEOUT)
+            except asyncio.TimeoutError:
+                error = 'probe timeout'
+            except (OSError, ProtocolError, asyncio.IncompleteReadError) as e:
+                error = str(e) or e.__class__.__name__
+            else:
+                error = None
+            latency = round((loop.time() - started_at) * 1000, 2)
+
+        await self.record(target, latency, error)
+
+    async def record(self, target: dict, latency: float, error: str = None):
+        container_id = target['id']
+        if container_id not in self.targets:
+            return
+
+        now = time.time()
+        fresh = container_id not in self.states
+        state = self.states.setdefault(container_id, {
+            'status': HealthStatus.STARTING,
+            'failures': 0,
+            'restarts': 0,
+            'restarted_at': None,
+            'restarting': False,
+        })
+        state.update(latency=latency, checked_at=now, error=error)
+        previous = state['status']
+
+        if error is None:
+            state['failures'] = 0
+            self.set_status(target, state, HealthStatus.HEALTHY, fresh)
+            if previous == HealthStatus.UNHEALTHY:
+                target['manager'].notify(container_id, WatchEvent.HEALTHY)
+            return
+
+        state['failures'] += 1
+        # fresh and just restarted instances get time to load data or finish crash recovery
+        grace_since = max(target['created_at'], state['restarted_at'] or 0)
+        if now - grace_since < settings.HEALTH_START_GRACE and previous != HealthStatus.HEALTHY:
+            self.set_status(target, state, previous, fresh)
+            return
+        if state['failures'] < settings.HEALTH_FAILURE_THRESHOLD:
+            self.set_status(target, state, previous, fresh)
+            return
+
+        self.set_status(target, state, HealthStatus.UNHEALTHY, fresh)
+        if previous != HealthStatus.UNHEALTHY:
+            target['manager'].notify(container_id, WatchEvent.UNHEALTHY)
+            self.logger.warning(f'Instance {container_id} is unhealthy: {error}')
+
+        if settings.HEALTH_RESTART_POLICY == RestartPolicy.ON_FAILURE and target['restartable'] \
+                and not state['restarting']:
+            await self.restart(target, state)
+
+    def set_status(self, target: dict, state: dict, status: str, fresh: bool = False):
+        # the list ETag covers the health status; latency and checked_at change with every
+        # probe without bumping it, so a cached list may show them stale
+        changed = fresh or state['status'] != status
+        state['status'] = status
+        if changed:
+            target['manager'].touch()
+
+    async def restart(self, target: dict, state: dict):
+        state['restarting'] = True
+        try:
+            loop = asyncio.get_running_loop()
+            await loop.run_in_executor(None, target['manager'].restart, target['id'])
+        except (ServiceException, docker.errors.DockerException, requests.exceptions.RequestException) as e:
+            self.logger.error(f'Instance {target["id"]} restart fails: {e}')
+        else:
+            state.update(failures=0, restarted_at=time.time())
+            state['restarts'] += 1
+            self.set_status(target, state, HealthStatus.STARTING)
+            self.logger.info(f'Instance {target["id"]} restarted after failing health probes.')
+        finally:
+            state['restarting'] = False
@@ -0,0 +1,172 @@
+# coding=utf-8
+
+import time
+import threading
+
+import docker
+import requests
+
+from framework.conf import settings
+from framework.exception import ServiceException
+from framework.store import FileStore
+from framework.utils import read_net_dev
+from .watch import WatchEvent
+
+
+class HibernationMode:
+    PAUSE = 'pause'
+    STOP = 'stop'
+
+
+class HibernationManager:
+
+    _mutex = threading.Lock()
+    _instance = None
+
+    def __new__(cls, logger, *args, **kwargs):
+        with cls._mutex:
+            if cls._instance is None:
+                cls._instance = object.__new__(cls, *args, **kwargs)
+        return cls._instance
+
+    @classmethod
+    def init(cls, logger=None):
+        cls._instance = cls(logger)
+
+    @classmethod
+    def instance(cls):
+        return cls._instance
+
+    def __init__(self, logger):
+        self.logger = logger
+        self.managers = []
+        self.samples = {}
+        # container id -> commands the service sent itself (health probes, insight collection)
+        self.own_commands = {}
+        self.store = FileStore('hibernation')
+        self._resume_mutex = threading.Lock()
+        self._account_mutex = threading.Lock()
+
+        if settings.HIBERNATION_ENABLED:
+            self._detector = threading.Thread(target=self.run_detector, name='idle-detector', daemon=True)
+            self._detector.start()
+
+    def register(self, manager):
+        self.managers.append(manager)
+
+    def get_state(self, container_id: str):
+        return self.store.get(container_id)
+
+    def account(self, container_id: str, commands: int):
+        # called before the commands are sent, so the command counter never runs ahead of it
+        with self._account_mutex:
+            self.own_commands[container_id] = self.own_commands.get(container_id, 0) + commands
+
+    def sample(self, manager, container):
+        commands = None
+        try:
+            commands = manager.count_commands(container)
+        except Exception as e:
+            self.logger.debug(f'Instance {container.short_id} command sampling fails: {e}')
+        # read after the counter, everything the counter saw of our own traffic is in it
+        own_commands = self.own_commands.get(container.short_id, 0)
+
+        net_bytes = None
+        try:
+            net_bytes = sum(read_net_dev(container.attrs['State']['Pid']))
+        except (OSError, KeyError, ValueError):
+            pass
+
+        return commands, net_bytes, own_commands
+
+    def is_active(self, manager, previous, current):
+        commands, net_bytes, own_commands = current
+        prev_commands, prev_net_bytes, prev_own_commands = previous
+        # the sampling connection itself shows up in both counters, discount it,
+        # and so do the probes and collectors of the service
+        counted = commands is not None and prev_commands is not None
+        if counted:
+            if commands - prev_commands - (own_commands - prev_own_commands) > manager.sample_commands:
+                return True
+        # our own replies (slowlogs, digests) can outweigh the byte threshold, with a command
+        # count to go by the byte counter only tells for intervals free of our own traffic
+        if counted and own_commands != prev_own_commands:
+            return False
+        if net_bytes is not None and prev_net_bytes is not None:
+            if net_bytes - prev_net_bytes > settings.HIBERNATION_NET_THRESHOLD:
+                return True
+        return False
+
+    def detect(self):
+        now = time.time()
+        alive = set()
+        for manager in self.managers:
+            for container in manager.list_containers(status='running'):
+                container_id = container.short_id
+                alive.add(container_id)
+                if container_id in self.store:
+                    continue
+                # pausing one node of a group fails it over, groups are never hibernated
+                if container.labels.get('bk.group'):
+                    continue
+
+                current = self.sample(manager, container)
+                previous = self.samples.get(container_id)
+                if previous is None or self.is_active(manager, previous[0], current):
+                    self.samples[container_id] = (current, now)
+                    continue
+
+                self.samples[container_id] = (current, previous[1])
+                if now - previous[1] >= settings.HIBERNATION_IDLE_TIMEOUT:
+                    self.hibernate(manager, container)
+
+        for container_id in list(self.samples):
+            if container_id not in alive:
+                self.samples.pop(container_id, None)
+        with self._account_mutex:
+            for container_id in list(self.own_commands):
+                if container_id not in alive:
+                    self.own_commands.pop(container_id, None)
+
+    def run_detector(self):
+        while True:
+            time.sleep(settings.HIBERNATION_SAMPLE_INTERVAL)
+            try:
+                self.detect()
+            except ServiceException:
+                pass
+            except (docker.errors.DockerException, requests.exceptions.RequestException) as e:
+                self.logger.error(f'Idle detection fails: {e}')
+
+    def hibernate(self, manager, container):
+        mode = manager.get_hibernation_mode(container)
+        if mode == HibernationMode.STOP:
+            container.stop()
+        else:
+            container.pause()
+
+        self.samples.pop(container.short_id, None)
+        self.store.set(container.short_id, {'mode': mode, 'hibernated_at': time.time()})
+        manager.touch()
+        manager.notify(container.short_id, WatchEvent.HIBERNATED)
+        self.logger.info(f'Instance {container.short_id} hibernated ({mode}).')
+
+    def resume(self, container):
+        with self._resume_mutex:
+            state = self.store.get(container.short_id)
+            if state is None:
+                return False
+
+            container.reload()
+            if container.status == 'paused':
+                container.unpause()
+            elif container.status in ('created', 'exited'):
+                container.start()
+
+            self.store.pop(container.short_id)
+            self.logger.info(f'Instance {container.short_id} resumed.')
+            return True
+
+    def forget(self, container_id: str):
+        self.samples.pop(container_id, None)
+        self.store.pop(container_id)
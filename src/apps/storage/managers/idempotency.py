@@ -0,0 +1,115 @@
+# coding=utf-8
+
+import time
+import hashlib
+import threading
+from concurrent.futures import Future
+
+from framework.conf import settings
+from framework.exception import ServiceException
+from framework.store import FileStore
+
+
+class IdempotencyState:
+    PENDING = 'p'
+    DONE = 'd'
+    FAILED = 'f'
+
+
+class IdempotencyManager:
+
+    _mutex = threading.Lock()
+    _instance = None
+
+    def __new__(cls, logger, *args, **kwargs):
+        with cls._mutex:
+            if cls._instance is None:
+                cls._instance = object.__new__(cls, *args, **kwargs)
+        return cls._instance
+
+    @classmethod
+    def init(cls, logger=None):
+        cls._instance = cls(logger)
+
+    @classmethod
+    def instance(cls):
+        return cls._instance
+
+    def __init__(self, logger):
+        self.logger = logger
+        # hashed key -> [expire_at, state, fingerprint, reference]
+        self.store = FileStore('idempotency')
+        self.inflight = {}
+        self._inflight_mutex = threading.Lock()
+        self._purged_at = 0
+
+        # a pending key was abandoned by an earlier process, whatever it created may exist by now,
+        # running it again could create a second instance
+        abandoned = dict(
+            (store_key, [entry[0], IdempotencyState.FAILED] + entry[2:])
+            for store_key, entry in self.store.items() if entry[1] == IdempotencyState.PENDING)
+        if abandoned:
+            self.store.update(abandoned)
+
+    def make_key(self, scope: str, key: str):
+        # fixed size entries however long the client's keys are
+        return hashlib.sha256(f'{scope}:{key}'.encode()).hexdigest()[:32]
+
+    def purge(self, now: float):
+        if now - self._purged_at < 60:
+            return
+        self._purged_at = now
+        expired = dict((store_key, None) for store_key, entry in self.store.items() if entry[0] < now)
+        if expired:
+            self.store.update(expired)
+
+    def run(self, scope: str, key: str, fingerprint: str, func, reference, recover):
+        """Runs func at most once per key within the TTL.
+
+        A key that already completed is answered by recover(reference), a key still
+        in flight in this process waits for the running call.
+        """
+        store_key = self.make_key(scope, key)
+        now = time.time()
+        with self._inflight_mutex:
+            self.purge(now)
+            entry = self.store.get(store_key)
+            if entry and entry[0] < now:
+                entry = None
+            if entry and entry[2] != fingerprint:
+                raise ServiceException('幂等键已被其他请求使用')
+
+            future = self.inflight.get(store_key)
+            if future is None and entry and entry[1] != IdempotencyState.DONE:
+                raise ServiceException('该幂等键对应的请求未能完成，请检查实例列表后使用新的幂等键重试')
+            owner, completed = False, None
+            if future is None and entry and entry[1] == IdempotencyState.DONE:
+                completed = entry
+            elif future is None:
+                future = self.inflight[store_key] = Future()
+                owner = True
+                self.store.set(store_key, [
+                    int(now + settings.IDEMPOTENCY_TTL), IdempotencyState.PENDING, fingerprint, None])
+
+        if completed:
+            return recover(completed[3])
+        if not owner:
+            return future.result()
+
+        try:
+            result = func()
+        except BaseException as e:
+            # a failed attempt must not pin the key, the client is expected to retry
+            with self._inflight_mutex:
+                self.inflight.pop(store_key, None)
+                self.store.pop(store_key)
+            future.set_exception(e)
+            raise
+
+        with self._inflight_mutex:
+            self.inflight.pop(store_key, None)
+            self.store.set(store_key, [
+                int(time.time() + settings.IDEMPOTENCY_TTL), IdempotencyState.DONE,
+                fingerprint, reference(result)])
+        future.set_result(result)
+        return result
@@ -0,0 +1,127 @@
+# coding=utf-8
+
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+import docker
+import requests
+
+from framework.conf import settings
+from framework.exception import ServiceException
+from ..models.container import format_timestamp
+
+
+class InsightsManager:
+
+    _mutex = threading.Lock()
+    _instance = None
+
+    def __new__(cls, logger, *args, **kwargs):
+        with cls._mutex:
+            if cls._instance is None:
+                cls._instance = object.__new__(cls, *args, **kwargs)
+        return cls._instance
+
+    @classmethod
+    def init(cls, logger=None):
+        cls._instance = cls(logger)
+
+    @classmethod
+    def instance(cls):
+        return cls._instance
+
+    def __init__(self, logger):
+        self.logger = logger
+        self.managers = []
+        # container id -> cursors and capped offenders, see new_state()
+        self.states = {}
+        # one connection per worker, so this bounds connections opened by the collector
+        self.executor = ThreadPoolExecutor(
+                            max_workers=settings.INSIGHTS_MAX_CONNECTIONS, thread_name_prefix='insights')
+
+        if settings.INSIGHTS_ENABLED:
+            self._collector = threading.Thread(target=self.run_collector, name='insights-collector', daemon=True)
+            self._collector.start()
+
+    def register(self, manager):
+        self.managers.append(manager)
+
+    def new_state(self, storage_type: str):
+        return {
+            'type': storage_type,
+            'cursor': {},
+            'offenders': {},
+            'events': {},
+            'collected_at': None,
+            'error': None,
+        }
+
+    def collect(self):
+        futures, alive = [], set()
+        for manager in self.managers:
+            for container in manager.list_containers():
+                alive.add(container.short_id)
+                if container.status != 'running':
+                    continue
+                state = self.states.get(container.short_id)
+                if state is None:
+                    state = self.states[container.short_id] = self.new_state(manager.storage_type)
+                futures.append(self.executor.submit(self.collect_instance, manager, container, state))
+
+        for future in futures:
+            future.result()
+
+        # hibernated instances keep what was collected, removed ones are dropped
+        for container_id in list(self.states):
+            if container_id not in alive:
+                self.states.pop(container_id, None)
+
+    def collect_instance(self, manager, container, state: dict):
+        try:
+            manager.collect_insights(container, state)
+            state['error'] = None
+        except Exception as e:
+            state['error'] = str(e)
+            self.logger.debug(f'Instance {container.short_id} insight collection fails: {e}')
+        state['collected_at'] = time.time()
+        self.cap(state['offenders'])
+
+    def cap(self, offenders: dict):
+        # keep the heaviest offenders only, memory stays bounded per instance
+        overflow = len(offenders) - settings.INSIGHTS_MAX_ENTRIES
+        if overflow <= 0:
+            return
+        for key, _ in sorted(offenders.items(), key=lambda item: item[1]['total_ms'])[:overflow]:
+            offenders.pop(key, None)
+
+    def run_collector(self):
+        while True:
+            time.sleep(settings.INSIGHTS_INTERVAL)
+            try:
+                self.collect()
+            except ServiceException:
+                pass
+            except (docker.errors.DockerException, requests.exceptions.RequestException) as e:
+                self.logger.error(f'Insight collection fails: {e}')
+
+    def report(self, container_id: str, limit: int = 10):
+        state = self.states.get(container_id)
+        if state is None:
+            return None
+
+        # copied first, the collector may be updating them concurrently
+        offenders = sorted(list(state['offenders'].values()), key=lambda item: item['total_ms'], reverse=True)
+        events = sorted(list(state['events'].values()), key=lambda item: item['max_ms'], reverse=True)
+        return {
+            'collected_at': format_timestamp(state['collected_at']),
+            'error': state['error'],
+            'offenders': [dict(item, last_seen=format_timestamp(item['last_seen'])) for item in offenders[:limit]],
+            'events': [
+                dict(event, last_seen=format_timestamp(event['last_seen']), samples=[
+                    {'time': format_timestamp(timestamp), 'latency_ms': latency}
+                    for timestamp, latency in list(event['samples'])
+                ])
+                for event in events[:limit]
+            ],
+        }
@@ -0,0 +1,138 @@
+# coding=utf-8
+
+import time
+import heapq
+import threading
+
+import docker
+import requests
+
+from framework.conf import settings
+from framework.exception import ServiceException
+from framework.store import FileStore
+from .watch import WatchEvent
+
+
+class LeaseManager:
+
+    _mutex = threading.Lock()
+    _instance = None
+
+    def __new__(cls, logger, *args, **kwargs):
+        with cls._mutex:
+            if cls._instance is None:
+                cls._instance = object.__new__(cls, *args, **kwargs)
+        return cls._instance
+
+    @classmethod
+    def init(cls, logger=None):
+        cls._instance = cls(logger)
+
+    @classmethod
+    def instance(cls):
+        return cls._instance
+
+    def __init__(self, logger):
+        self.logger = logger
+        self.managers = {}
+        # container id -> {'type': storage type, 'expire_at': timestamp}
+        self.store = FileStore('lease')
+        # (due_at, expire_at, container id); renewed leases leave stale items behind,
+        # they are recognised by an expire_at that no longer matches the store
+        self.heap = [(entry['expire_at'], entry['expire_at'], container_id)
+                     for container_id, entry in self.store.items()]
+        heapq.heapify(self.heap)
+        self._condition = threading.Condition()
+
+        self._reaper = threading.Thread(target=self.run_reaper, name='lease-reaper', daemon=True)
+        self._reaper.start()
+
+    def register(self, manager):
+        self.managers[manager.storage_type] = manager
+
+    def get_expire_at(self, container_id: str):
+        entry = self.store.get(container_id)
+        return entry and entry['expire_at']
+
+    def schedule(self, due_at: float, expire_at: float, container_id: str):
+        # caller holds the condition
+        if len(self.heap) > 2 * len(self.store.data) + 64:
+            self.heap = [item for item in self.heap if self.is_current(item)]
+            heapq.heapify(self.heap)
+        earliest = self.heap[0][0] if self.heap else None
+        heapq.heappush(self.heap, (due_at, expire_at, container_id))
+        if earliest is None or due_at < earliest:
+            self._condition.notify()
+
+    def is_current(self, item):
+        entry = self.store.get(item[2])
+        return entry is not None and entry['expire_at'] == item[1]
+
+    def grant(self, storage_type: str, container_id: str, ttl: int):
+        if not 0 < ttl <= settings.LEASE_MAX_TTL:
+            raise ServiceException(f'租约时长须在1~{settings.LEASE_MAX_TTL}秒之间')
+
+        expire_at = time.time() + ttl
+        with self._condition:
+            self.store.set(container_id, {'type': storage_type, 'expire_at': expire_at})
+            self.schedule(expire_at, expire_at, container_id)
+        return expire_at
+
+    def extend(self, container_id: str, seconds: int):
+        with self._condition:
+            entry = self.store.get(container_id)
+            if entry is None:
+                raise ServiceException('实例未设置租约')
+
+            now = time.time()
+            expire_at = max(entry['expire_at'], now) + seconds
+            if expire_at - now > settings.LEASE_MAX_TTL:
+                raise ServiceException(f'租约剩余时长不能超过{settings.LEASE_MAX_TTL}秒')
+            self.store.set(container_id, dict(entry, expire_at=expire_at))
+            self.schedule(expire_at, expire_at, container_id)
+        return expire_at
+
+    def forget(self, container_id: str):
+        # the heap item goes stale and is dropped once it comes due
+        with self._condition:
+            self.store.pop(container_id)
+
+    def next_expired(self):
+        with self._condition:
+            while True:
+                now = time.time()
+                if self.heap and self.heap[0][0] <= now:
+                    item = heapq.heappop(self.heap)
+                    if self.is_current(item):
+                        return item
+                    continue
+                self._condition.wait(self.heap[0][0] - now if self.heap else None)
+
+    def run_reaper(self):
+        while True:
+            _, expire_at, container_id = self.next_expired()
+            entry = self.store.get(container_id)
+            if entry is None:
+                continue
+            # managers register after the reaper starts, leases due at startup wait for them
+            manager = self.managers.get(entry['type'])
+            try:
+                if manager is None:
+                    raise ServiceException('存储资源类型未注册')
+                self.reap(manager, container_id)
+            except (docker.errors.DockerException, requests.exceptions.RequestException, ServiceException) as e:
+                self.logger.error(f'Instance {container_id} reclamation fails: {e}')
+                with self._condition:
+                    if self.is_current((None, expire_at, container_id)):
+                        self.schedule(time.time() + settings.LEASE_RETRY_DELAY, expire_at, container_id)
+
+    def reap(self, manager, container_id: str):
+        try:
+            manager.remove(container_id)
+        except ServiceException:
+            # already gone, nothing left to reclaim
+            if manager.exists(container_id):
+                raise
+        self.forget(container_id)
+        manager.notify(container_id, WatchEvent.EXPIRED)
+        self.logger.info(f'Instance {container_id} expired and removed.')
@@ -3,30 +3,108 @@
 import os
 import stat
 import time
+import uuid
+import random
+import shutil
+import datetime
+import asyncio
+import threading
+import contextlib
 from configparser import ConfigParser
 import docker
+import pymysql
 
 from framework.conf import settings
 from framework.exception import ServiceException
+from framework.utils import clone_tree
 from .base import BaseManager
-from ..models.container import ContainerInstance, ContainerStatus
+from .watch import WatchEvent
+from ..models.container import ContainerStatus
 from ..models.connection import MySQLConnection
+from ..profiles import tune_mysql, get_tmpfs_size
+from ..protocol import ProtocolError, PROBE_CAPABILITIES, authenticate, encode_mysql_packet, parse_error
+from .volume import StorageTier
 
 
 class MySQLManager(BaseManager):
 
     image_tag = 'mysql:latest'
+    storage_type = 'mysql'
+    container_port = '3306/tcp'
+    sample_commands = 1
 
-    def info(self, container_id: str):
+    _template_mutex = threading.Lock()
+
+    # config field -> (option in my.cnf, server variable, changeable at runtime)
+    default_config = {
+        'charset': 'utf8mb4',
+        'binlog_format': 'STATEMENT',
+        'autoinc_lock_mode': 2,
+    }
+
+    config_variables = {
+        'charset': ('character-set-server', 'character_set_server', True),
+        'binlog_format': ('binlog_format', 'binlog_format', True),
+        # read-only at runtime, only a restart picks up a new value
+        'autoinc_lock_mode': ('innodb_autoinc_lock_mode', 'innodb_autoinc_lock_mode', False),
+    }
+
+    def read_info(self, container_id: str):
         container = self.get(container_id)
-        config_path = None
+        config_info = self.read_config(container)
+        config_info['profile'] = self.read_profile(self.get_volume_path(container))
+        return config_info
+
+    def replication(self, container_id: str = ''):
+        # live thread state and lag, kept out of the config document and its ETag
+        container = self.get(container_id, resume=False)
+        group = container.labels.get('bk.group')
+        if not group:
+            raise ServiceException('单节点实例没有复制状态')
+        return self.read_replication(group, self.get_connection(container).password)
+
+    def read_replication(self, group: str, password: str):
+        replication = self.describe_group(self.list_group(group))
+        for node in replication['nodes']:
+            if node['role'] != 'replica':
+                continue
+            try:
+                client = self.connect(node['port'], password)
+            except pymysql.MySQLError as e:
+                node['error'] = str(e)
+                continue
+            try:
+                with client.cursor(pymysql.cursors.DictCursor) as cursor:
+                    cursor.execute('SHOW REPLICA STATUS')
+                    status = cursor.fetchone() or {}
+            except pymysql.MySQLError as e:
+                node['error'] = str(e)
+                continue
+            finally:
+                client.close()
+            # Seconds_Behind_Source is NULL while the applier is stopped
+            node.update(
+                io_running=status.get('Replica_IO_Running') == 'Yes',
+                sql_running=status.get('Replica_SQL_Running') == 'Yes',
+                lag=status.get('Seconds_Behind_Source'),
+                retrieved_gtid_set=status.get('Retrieved_Gtid_Set'),
+                executed_gtid_set=status.get('Executed_Gtid_Set'),
+                error=status.get('Last_IO_Error') or status.get('Last_SQL_Error') or None)
+        return replication
+
+    def get_node_count(self, config: dict):
+        return (config.get('replicas') or 0) + 1
+
+    def get_config_path(self, container):
         for item in container.attrs['Mounts']:
             if item['Destination'] == '/etc/mysql/my.cnf':
-                config_path = item['Source']
-                break
-        if config_path is None:
-            raise ServiceException('容器实例中未发现配置文件')
+                return item['Source']
+        raise ServiceException('容器实例中未发现配置文件')
 
+    def read_config(self, container):
+        return self.parse_config_file(self.get_config_path(container))
+
+    def parse_config_file(self, config_path: str):
         parser = ConfigParser()
         parser.read(config_path)
         config_info = {}
@@ -38,82 +116,550 @@ class MySQLManager(BaseManager):
 
         return config_info
 
-    def generate_config_file(self, config: dict, volume_path: str):
+    def load_config(self, volume_path: str):
+        config = dict(self.default_config)
+        mysqld_info = self.parse_config_file(f'{volume_path}/my.cnf').get('mysqld', {})
+        for key, (option, _, _) in self.config_variables.items():
+            if option in mysqld_info:
+                config[key] = type(config[key])(mysqld_info[option])
+        config.update(self.load_profile(volume_path))
+        return config
+
+    @contextlib.contextmanager
+    def consistent_point(self, container):
+        client = self.open_client(container)
+        try:
+            with client.cursor() as cursor:
+                cursor.execute('FLUSH TABLES WITH READ LOCK')
+                try:
+                    cursor.execute('SHOW BINARY LOG STATUS')
+                except pymysql.MySQLError:
+                    cursor.execute('SHOW MASTER STATUS')
+                row = cursor.fetchone()
+                metadata = {}
+                if row:
+                    metadata = {'binlog_file': row[0], 'binlog_position': row[1], 'gtid_executed': row[4]}
+        except pymysql.MySQLError as e:
+            client.close()
+            raise ServiceException(f'实例数据锁定失败: {e}')
+
+        # writes stay blocked until the copy has been taken
+        try:
+            yield metadata
+        finally:
+            try:
+                with client.cursor() as cursor:
+                    cursor.execute('UNLOCK TABLES')
+            finally:
+                client.close()
+
+    def write_config(self, container, changes: dict):
+        config_path = self.get_config_path(container)
+        parser = ConfigParser()
+        parser.read(config_path)
+        for key, value in changes.items():
+            parser.set('mysqld', key, str(value))
+        with open(config_path, 'w') as fp:
+            parser.write(fp)
+        self.invalidate_config(container.short_id)
+        self.notify(container.short_id, WatchEvent.CONFIG_CHANGED)
+
+    def update_config(self, container_id: str, changes: dict, restart: bool = True):
+        container = self.get(container_id)
+        # the primary and its replicas run the same configuration
+        return self.apply_to_group(container, lambda member: self.set_config(member, changes, restart))
+
+    def set_config(self, container, changes: dict, restart: bool = True):
+        dynamic_changes, static_changes = {}, {}
+        for key, value in changes.items():
+            option, variable, dynamic = self.config_variables[key]
+            if dynamic:
+                dynamic_changes[key] = (option, variable, value)
+            else:
+                static_changes[key] = (option, variable, value)
+
+        applied = []
+        if dynamic_changes:
+            client = self.open_client(container)
+            try:
+                with client.cursor() as cursor:
+                    for key, (option, variable, value) in dynamic_changes.items():
+                        # SET PERSIST also records the value in mysqld-auto.cnf
+                        cursor.execute(f'SET PERSIST {variable} = %s', (value,))
+                        applied.append(key)
+            except pymysql.MySQLError as e:
+                raise ServiceException(f'配置修改失败: {e}')
+            finally:
+                client.close()
+                self.write_config(container, dict(
+                    (option, value) for key, (option, _, value) in dynamic_changes.items() if key in applied))
+
+        restarted, pending = [], []
+        if static_changes:
+            self.write_config(container, dict((option, value) for option, _, value in static_changes.values()))
+            # a restart would wipe a tmpfs datadir, leave it to the caller
+            if self.read_profile(self.get_volume_path(container)).get('tier') == StorageTier.TMPFS:
+                restart = False
+            if restart:
+                container.restart()
+                restarted = list(static_changes)
+            else:
+                pending = list(static_changes)
+
+        return {'applied': applied, 'restarted': restarted, 'pending': pending}
+
+    def get_connection(self, container):
+        password = ''
+        for item in container.attrs['Config']['Env'] or []:
+            if item.startswith('MYSQL_ROOT_PASSWORD='):
+                password = item.split('=', 1)[1]
+                break
+
+        connection = MySQLConnection(
+                        host=settings.DOCKER_HOST_IP,
+                        port=self.get_host_port(container),
+                        username='root',
+                        password=password)
+        group = container.labels.get('bk.group')
+        if group:
+            for item in self.list_group(group):
+                endpoint = f"{settings.DOCKER_HOST_IP}:{item['Labels']['bk.port']}"
+                if item['Labels'].get('bk.role') == 'primary':
+                    connection.writer = endpoint
+                else:
+                    connection.readers.append(endpoint)
+        return connection
+
+    def connect(self, port: int, password: str):
+        return pymysql.connect(
+                    host=settings.DOCKER_HOST_IP,
+                    port=port,
+                    user='root',
+                    password=password,
+                    connect_timeout=settings.STORAGE_CLIENT_TIMEOUT,
+                    read_timeout=settings.STORAGE_CLIENT_TIMEOUT,
+                    write_timeout=settings.STORAGE_CLIENT_TIMEOUT)
+
+    def open_client(self, container, proxy: bool = False):
+        connection = self.get_connection(container)
+        host, port, username = connection.host, connection.port, connection.username
+        if proxy:
+            # the proxy routes on the instance id given as the user name
+            (host, port), username = self.get_proxy_address(), container.short_id
+        # leave autocommit untouched so no extra statement is sent on connect
+        return pymysql.connect(
+                    host=host,
+                    port=port,
+                    user=username,
+                    password=connection.password,
+                    autocommit=None,
+                    connect_timeout=settings.STORAGE_CLIENT_TIMEOUT,
+                    read_timeout=settings.STORAGE_CLIENT_TIMEOUT,
+                    write_timeout=settings.STORAGE_CLIENT_TIMEOUT)
+
+    def count_commands(self, container):
+        client = self.open_client(container)
+        try:
+            with client.cursor() as cursor:
+                cursor.execute("SHOW GLOBAL STATUS LIKE 'Questions'")
+                return int(cursor.fetchone()[1])
+        finally:
+            client.close()
+
+    def run_benchmark(self, container, recorder, proxy: bool = False):
+        client = self.open_client(container, proxy)
+        schema = f'bk_benchmark_{uuid.uuid4().hex[:8]}'
+        value = 'x' * min(settings.BENCHMARK_VALUE_SIZE, 255)
+        try:
+            # every insert commits on its own, so the flush settings of the profile show
+            client.autocommit(True)
+            with client.cursor() as cursor:
+                cursor.execute(f'CREATE DATABASE `{schema}`')
+                cursor.execute(
+                    f'CREATE TABLE `{schema}`.`t` (id INT PRIMARY KEY AUTO_INCREMENT, '
+                    f'k INT NOT NULL, v VARCHAR(255) NOT NULL) ENGINE=InnoDB')
+
+                # inserts for the first half, point selects on what they wrote for the rest
+                inserted = 0
+                insert_until = time.monotonic() + recorder.duration / 2
+                while recorder.running() and time.monotonic() < insert_until:
+                    started_at = time.perf_counter()
+                    cursor.execute(f'INSERT INTO `{schema}`.`t` (k, v) VALUES (%s, %s)',
+                                   (random.randrange(1 << 30), value))
+                    recorder.record('insert', time.perf_counter() - started_at)
+                    inserted += 1
+
+                while recorder.running() and inserted:
+                    started_at = time.perf_counter()
+                    cursor.execute(f'SELECT k, v FROM `{schema}`.`t` WHERE id = %s', (random.randint(1, inserted),))
+                    cursor.fetchone()
+                    recorder.record('select', time.perf_counter() - started_at)
+        except pymysql.MySQLError as e:
+            raise ServiceException(f'性能测试失败: {e}')
+        finally:
+            try:
+                with client.cursor() as cursor:
+                    cursor.execute(f'DROP DATABASE IF EXISTS `{schema}`')
+            except pymysql.MySQLError:
+                pass
+            client.close()
+
+    def collect_insights(self, container, state: dict):
+        client = self.open_client(container)
+        cursor_state = state['cursor']
+        try:
+            # kept out of the hibernation idle check
+            self.hibernation.account(container.short_id, 1)
+            with client.cursor() as cursor:
+                # digests untouched since the last pass are skipped by the cursor; it is a strict
+                # (LAST_SEEN, DIGEST, SCHEMA_NAME) bound, so a batch of rows sharing one LAST_SEEN
+                # is paged through instead of being read again on every pass
+                cursor.execute(
+                    'SELECT SCHEMA_NAME, DIGEST, DIGEST_TEXT, COUNT_STAR, SUM_TIMER_WAIT, MAX_TIMER_WAIT, '
+                    'SUM_ROWS_EXAMINED, SUM_NO_INDEX_USED, LAST_SEEN '
+                    'FROM performance_schema.events_statements_summary_by_digest '
+                    "WHERE DIGEST IS NOT NULL AND (LAST_SEEN, DIGEST, IFNULL(SCHEMA_NAME, '')) > (%s, %s, %s) "
+                    "ORDER BY LAST_SEEN, DIGEST, IFNULL(SCHEMA_NAME, '') LIMIT %s",
+                    (cursor_state.get('last_seen', datetime.datetime(1970, 1, 1)),
+                     cursor_state.get('digest', ''), cursor_state.get('schema', ''), settings.INSIGHTS_DIGEST_BATCH))
+                rows = cursor.fetchall()
+        except pymysql.MySQLError as e:
+            raise ServiceException(f'实例诊断数据采集失败: {e}')
+        finally:
+            client.close()
+
+        for schema, digest, text, count, total_wait, max_wait, rows_examined, no_index_used, last_seen in rows:
+            cursor_state.update(last_seen=last_seen, digest=digest, schema=schema or '')
+            # the collector's own statements
+            if text and 'performance_schema' in text:
+                continue
+            # timers are in picoseconds, counters are cumulative since the server started
+            state['offenders'][digest] = {
+                'digest': digest,
+                'schema': schema,
+                'statement': (text or '')[:256],
+                'count': int(count),
+                'total_ms': round(int(total_wait) / 1e9, 3),
+                'max_ms': round(int(max_wait) / 1e9, 3),
+                'rows_examined': int(rows_examined),
+                'no_index_used': int(no_index_used),
+                'last_seen': last_seen.timestamp(),
+            }
+
+    async def ping(self, host: str, port: int, password: str = ''):
+        # log in and quit like a regular client: mysqld counts connections dropped mid-handshake
+        # against max_connect_errors of the client host, and every probe comes from the same one
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            payload = await authenticate(reader, writer, b'root', password.encode(), PROBE_CAPABILITIES)
+            if payload[:1] == b'\xff':
+                code, message = parse_error(payload)
+                # a rejected password still means the server is up and serving logins
+                if code != 1045:
+                    raise ProtocolError(message)
+                return
+            writer.write(encode_mysql_packet(0, b'\x01'))  # COM_QUIT
+            await writer.drain()
+        finally:
+            writer.close()
+
+    def generate_config_file(self, config: dict, volume_path: str, config_dir: str = None, options: dict = None):
+        # group nodes keep their own my.cnf next to the shared profile
         template_dir = os.path.realpath(os.path.join(os.path.dirname(__file__), os.pardir, 'templates'))
         parser = ConfigParser()
         parser.read(f'{template_dir}/my.cnf')
         parser.set('mysqld', 'character-set-server', config['charset'])
         parser.set('mysqld', 'binlog_format', config['binlog_format'])
-        with open(f'{volume_path}/my.cnf', 'w') as fp:
+        parser.set('mysqld', 'innodb_autoinc_lock_mode', str(config.get('autoinc_lock_mode', 2)))
+        for key, value in dict(tune_mysql(config), **(options or {})).items():
+            parser.set('mysqld', key, str(value))
+        with open(f'{config_dir or volume_path}/my.cnf', 'w') as fp:
             parser.write(fp)
+        self.write_profile(config, volume_path)
 
-    def create(self, config: dict = dict()):
-        password = self.generate_random_password()
+    def make_replication_options(self, index: int):
+        options = {
+            'server-id': index + 1,
+            'gtid_mode': 'ON',
+            'enforce_gtid_consistency': 'ON',
+        }
+        if index:
+            # replicas only serve reads, and apply the primary's commits in parallel, in commit order;
+            # super_read_only waits until the entrypoint / init file has set up the accounts
+            options.update({
+                'read_only': 'ON',
+                'relay_log': '/mysql/logbin/relay',
+                'replica_parallel_workers': settings.MYSQL_REPLICA_PARALLEL_WORKERS,
+                'replica_preserve_commit_order': 'ON',
+            })
+        return options
 
-        max_tries = 3
-        while True:
-            max_tries -= 1
-            if max_tries == 0:
-                raise ServiceException('容器实例存储目录创建失败')
-            volume_name = self.generate_random_volume()
-            volume_path = f'{settings.DOCKER_VOLUME_ROOT}/mysql/{volume_name}'
-            if not os.path.exists(volume_path):
-                break
+    def generate_init_file(self, password: str, volume_path: str):
+        password = password.replace('\\', '\\\\').replace("'", "\\'")
+        statements = [
+            # the password rotation is local to this server, replicas must not see it in the binlog
+            'SET SQL_LOG_BIN = 0;',
+            f"ALTER USER 'root'@'localhost' IDENTIFIED BY '{password}';",
+            f"CREATE USER IF NOT EXISTS 'root'@'%' IDENTIFIED BY '{password}';",
+            f"ALTER USER 'root'@'%' IDENTIFIED BY '{password}';",
+            "GRANT ALL PRIVILEGES ON *.* TO 'root'@'%' WITH GRANT OPTION;",
+        ]
+        with open(f'{volume_path}/init.sql', 'w') as fp:
+            fp.write('\n'.join(statements) + '\n')
 
-        try:
-            os.makedirs(volume_path)
-            os.chmod(volume_path, stat.S_IRWXU | stat.S_IRWXG | stat.S_IRWXO)
-        except PermissionError:
-            raise ServiceException('容器实例存储目录创建失败')
+    def clear_init_file(self, volume_path: str):
+        # mysqld runs the init file on every start, once the password is in place it has done its job;
+        # truncated rather than removed, the bind mount needs the file to exist
+        if os.path.exists(f'{volume_path}/init.sql'):
+            open(f'{volume_path}/init.sql', 'w').close()
 
-        self.generate_config_file(config, volume_path)
+    def get_data_template(self, image, config: dict):
+        image_version = image.id.split(':')[-1][:12]
+        template_name = f"{image_version}-{config['charset']}-{config['binlog_format']}".lower()
+        template_path = f'{settings.DOCKER_VOLUME_ROOT}/mysql/.templates/{template_name}'
+        if os.path.exists(f'{template_path}/.ready'):
+            return template_path
 
-        try:
-            os.makedirs(f'{volume_path}/data')
-            os.chmod(f'{volume_path}/data', stat.S_IRWXU | stat.S_IRWXG | stat.S_IRWXO)
-            os.makedirs(f'{volume_path}/logbin')
-            os.chmod(f'{volume_path}/logbin', stat.S_IRWXU | stat.S_IRWXG | stat.S_IRWXO)
-        except PermissionError:
-            raise ServiceException('容器实例存储目录创建失败')
+        with self._template_mutex:
+            if os.path.exists(f'{template_path}/.ready'):
+                return template_path
+
+            shutil.rmtree(template_path, ignore_errors=True)
+            try:
+                for path in (template_path, f'{template_path}/data', f'{template_path}/logbin'):
+                    os.makedirs(path)
+                    os.chmod(path, stat.S_IRWXU | stat.S_IRWXG | stat.S_IRWXO)
+            except PermissionError:
+                self.logger.error(f'MySQL data template {template_name} directory creation fails.')
+                return None
+
+            # tuning only matters for serving instances, keep the template neutral
+            self.generate_config_file(dict(config, profile=None), template_path)
 
+            # initialize system tables once, bypassing the image entrypoint
+            self.logger.info(f'MySQL data template {template_name} initializing.')
+            options = dict(
+                entrypoint=['mysqld'],
+                command=['--initialize-insecure', '--user=mysql'],
+                volumes={
+                    f'{template_path}/my.cnf': {'bind': '/etc/mysql/my.cnf', 'mode': 'ro'},
+                    f'{template_path}/data': {'bind': '/mysql/data', 'mode': 'rw'},
+                    f'{template_path}/logbin': {'bind': '/mysql/logbin', 'mode': 'rw'},
+                },
+                detach=True)
+            container = self.docker_client.containers.run(image, **options)
+            try:
+                result = container.wait(timeout=settings.MYSQL_TEMPLATE_TIMEOUT)
+            except Exception:
+                result = {'StatusCode': -1}
+            finally:
+                container.remove(force=True)
+
+            if result.get('StatusCode') != 0:
+                self.logger.error(f'MySQL data template {template_name} initialization fails.')
+                shutil.rmtree(template_path, ignore_errors=True)
+                return None
+
+            # every clone must generate its own server uuid on first start
+            if os.path.exists(f'{template_path}/data/auto.cnf'):
+                os.remove(f'{template_path}/data/auto.cnf')
+            open(f'{template_path}/.ready', 'w').close()
+            self.logger.info(f'MySQL data template {template_name} ready.')
+
+        return template_path
+
+    def get_image(self):
         try:
-            image = self.docker_client.images.get(self.image_tag)
+            return self.docker.get_image(self.image_tag)
         except docker.errors.ImageNotFound:
             raise ServiceException('存储资源类型镜像不存在')
 
+    def provision(self, config: dict, volume_path: str, seeded: bool = False):
+        if config.get('replicas'):
+            if seeded:
+                raise ServiceException('多节点实例不支持从快照创建')
+            return self.provision_group(config, volume_path)
+
+        password = self.generate_random_password()
+        image = self.get_image()
+
         port = self.pick_random_port()
         if port == 0:
             raise ServiceException('宿主机暂无可用端口')
 
+        container = self.run_container(
+                        image, config, volume_path, volume_path, port, password,
+                        self.make_labels(volume_path, config), seeded=seeded)
+        time.sleep(3)
+
+        container = self.get(container.short_id)
+        if ContainerStatus(container.status) == ContainerStatus.CREATED:
+            raise ServiceException('容器实例启动失败')
+
+        instance = self.make_instance(container)
+
+        connection = MySQLConnection(
+                        host=settings.DOCKER_HOST_IP,
+                        port=port,
+                        username='root',
+                        password=password)
+        return instance, connection
+
+    def run_container(self, image, config: dict, volume_path: str, config_dir: str, port: int, password: str,
+                      labels: dict, seeded: bool = False, options: dict = None):
+        self.generate_config_file(config, volume_path, config_dir, options)
+        tmpfs_size = get_tmpfs_size(config)
+
+        if not tmpfs_size:
+            try:
+                for path in (f'{config_dir}/data', f'{config_dir}/logbin'):
+                    os.makedirs(path, exist_ok=True)
+                    os.chmod(path, stat.S_IRWXU | stat.S_IRWXG | stat.S_IRWXO)
+            except PermissionError:
+                raise ServiceException('容器实例存储目录创建失败')
+
+        volumes = {
+            f'{config_dir}/my.cnf': {'bind': '/etc/mysql/my.cnf', 'mode': 'ro'},
+        }
+        tmpfs = {}
+        if tmpfs_size:
+            # the entrypoint initializes the in-memory datadir on first start
+            tmpfs = {
+                '/mysql/data': f'size={tmpfs_size * 3 // 4},mode=1777',
+                '/mysql/logbin': f'size={tmpfs_size // 4},mode=1777',
+            }
+        else:
+            volumes[f'{config_dir}/data'] = {'bind': '/mysql/data', 'mode': 'rw'}
+            volumes[f'{config_dir}/logbin'] = {'bind': '/mysql/logbin', 'mode': 'rw'}
+        command = None
+
+        # clone a pre-initialized datadir and only rotate the root password on start,
+        # the entrypoint skips initialization once the datadir is populated
+        template_path = None if seeded or tmpfs else self.get_data_template(image, config)
+        if template_path:
+            clone_tree(f'{template_path}/data', f'{config_dir}/data')
+            clone_tree(f'{template_path}/logbin', f'{config_dir}/logbin')
+        if template_path or seeded:
+            # a copied datadir keeps the source's server uuid and root password
+            if os.path.exists(f'{config_dir}/data/auto.cnf'):
+                os.remove(f'{config_dir}/data/auto.cnf')
+            self.generate_init_file(password, config_dir)
+            volumes[f'{config_dir}/init.sql'] = {'bind': '/mysql/init.sql', 'mode': 'ro'}
+            command = ['mysqld', '--init-file=/mysql/init.sql']
+
         options = dict(
             ports={'3306/tcp': port},
-            volumes={
-                f'{volume_path}/my.cnf': {'bind': '/etc/mysql/my.cnf', 'mode': 'ro'},
-                f'{volume_path}/data': {'bind': '/mysql/data', 'mode': 'rw'},
-                f'{volume_path}/logbin': {'bind': '/mysql/logbin', 'mode': 'rw'},
-            },
+            volumes=volumes,
             environment={'MYSQL_ROOT_PASSWORD': password},
+            labels=labels,
+            tmpfs=tmpfs,
+            **self.make_resource_limits(config),
             #auto_remove=True,
             detach=True,
             tty=True,
             stdin_open=True)
-        container = self.docker_client.containers.create(image, **options)
+        container = self.docker_client.containers.create(image, command=command, **options)
         container.start()
+        return container
+
+    def provision_group(self, config: dict, volume_path: str):
+        replicas = config['replicas']
+        if not 1 <= replicas <= settings.MYSQL_MAX_REPLICAS:
+            raise ServiceException(f'只读副本数须在1~{settings.MYSQL_MAX_REPLICAS}之间')
+
+        password = self.generate_random_password()
+        image = self.get_image()
+
+        # nodes share the volume (and its bk.volume label, so a failed create cleans up every node),
+        # each keeps its own my.cnf and datadir in a directory of its own
+        group = uuid.uuid4().hex[:12]
+        nodes = []
+        for index in range(replicas + 1):
+            port = self.pick_random_port()
+            if port == 0:
+                raise ServiceException('宿主机暂无可用端口')
+
+            config_dir = os.path.join(volume_path, f'node-{index}')
+            os.mkdir(config_dir)
+            os.chmod(config_dir, stat.S_IRWXU | stat.S_IRWXG | stat.S_IRWXO)
+            labels = dict(self.make_labels(volume_path, config), **{
+                'bk.group': group,
+                'bk.node': str(index),
+                'bk.role': 'replica' if index else 'primary',
+                'bk.port': str(port),
+            })
+            container = self.run_container(
+                            image, config, volume_path, config_dir, port, password, labels,
+                            options=self.make_replication_options(index))
+            nodes.append({'id': container.short_id, 'port': port, 'path': config_dir})
         time.sleep(3)
 
-        container = self.get(container.short_id)
-        if ContainerStatus(container.status) == ContainerStatus.CREATED:
-            raise ServiceException('容器实例启动失败')
+        for node in nodes:
+            container = self.get(node['id'])
+            if ContainerStatus(container.status) == ContainerStatus.CREATED:
+                raise ServiceException('容器实例启动失败')
+        self.setup_replication(nodes, password)
 
-        instance = ContainerInstance(
-                    id=container.short_id,
-                    name=container.name,
-                    ports=container.ports,
-                    status=ContainerStatus(container.status))
+        primary = self.get(nodes[0]['id'])
+        instance = self.make_instance(primary)
 
         connection = MySQLConnection(
                         host=settings.DOCKER_HOST_IP,
-                        port=port,
+                        port=nodes[0]['port'],
                         username='root',
-                        password=password)
+                        password=password,
+                        readers=[f"{settings.DOCKER_HOST_IP}:{node['port']}" for node in nodes[1:]])
         return instance, connection
+
+    def wait_connect(self, port: int, password: str, deadline: float):
+        # a fresh datadir takes a while to come up, the entrypoint may even restart mysqld once
+        while True:
+            try:
+                return self.connect(port, password)
+            except pymysql.MySQLError:
+                if time.monotonic() > deadline:
+                    raise ServiceException('实例启动超时')
+                time.sleep(1)
+
+    def setup_replication(self, nodes: list, password: str):
+        deadline = time.monotonic() + settings.MYSQL_REPLICATION_TIMEOUT
+        user, replication_password = settings.MYSQL_REPLICATION_USER, self.generate_random_password()
+        try:
+            # created on the primary, the replicas pick the account up from its binlog
+            client = self.wait_connect(nodes[0]['port'], password, deadline)
+            self.clear_init_file(nodes[0]['path'])
+            try:
+                with client.cursor() as cursor:
+                    cursor.execute("CREATE USER %s@'%%' IDENTIFIED BY %s", (user, replication_password))
+                    cursor.execute("GRANT REPLICATION SLAVE ON *.* TO %s@'%%'", (user,))
+            finally:
+                client.close()
+
+            # GTID auto-positioning streams everything the replica lacks, no binlog coordinates needed
+            for node in nodes[1:]:
+                client = self.wait_connect(node['port'], password, deadline)
+                # with super_read_only persisted below, the account statements would abort the next start
+                self.clear_init_file(node['path'])
+                try:
+                    with client.cursor(pymysql.cursors.DictCursor) as cursor:
+                        cursor.execute(
+                            'CHANGE REPLICATION SOURCE TO SOURCE_HOST = %s, SOURCE_PORT = %s, '
+                            'SOURCE_USER = %s, SOURCE_PASSWORD = %s, '
+                            'SOURCE_AUTO_POSITION = 1, GET_SOURCE_PUBLIC_KEY = 1',
+                            (settings.DOCKER_HOST_IP, nodes[0]['port'], user, replication_password))
+                        cursor.execute('START REPLICA')
+                        while True:
+                            cursor.execute('SHOW REPLICA STATUS')
+                            status = cursor.fetchone() or {}
+                            if status.get('Replica_IO_Running') == 'Yes' and status.get('Replica_SQL_Running') == 'Yes':
+                                break
+                            if time.monotonic() > deadline:
+                                error = status.get('Last_IO_Error') or status.get('Last_SQL_Error') or '复制未启动'
+                                raise ServiceException(f'只读副本复制启动超时: {error}')
+                            time.sleep(0.5)
+                        # from here on not even root writes to the replica, only the applier does
+                        cursor.execute('SET PERSIST super_read_only = ON')
+                finally:
+                    client.close()
+        except pymysql.MySQLError as e:
+            raise ServiceException(f'主从复制配置失败: {e}')
@@ -0,0 +1,309 @@
+# coding=utf-8
+
+import re
+import hmac
+import time
+import asyncio
+import threading
+import itertools
+from dataclasses import dataclass
+
+import docker
+import requests
+
+from framework.conf import settings
+from framework.docker import DockerManager
+from framework.exception import ServiceException
+from .. import protocol
+from ..protocol import ProtocolError
+
+
+@dataclass
+class ProxyRoute:
+
+    storage_type: str = ''
+    instance_id: str = ''
+    host: str = ''
+    port: int = 0
+    password: str = ''
+    expire_at: float = 0
+    active: int = 0
+    total: int = 0
+    errors: int = 0
+    bytes_in: int = 0
+    bytes_out: int = 0
+    setup_time: float = 0
+
+    def to_json(self):
+        return {
+            'type': self.storage_type,
+            'instance': self.instance_id,
+            'backend': f'{self.host}:{self.port}',
+            'active': self.active,
+            'total': self.total,
+            'errors': self.errors,
+            'bytes_in': self.bytes_in,
+            'bytes_out': self.bytes_out,
+            'setup_ms': round(self.setup_time / self.total * 1000, 3) if self.total else None,
+        }
+
+
+class ProxyManager:
+
+    _mutex = threading.Lock()
+    _instance = None
+
+    instance_id_pattern = re.compile(r'^[0-9a-f]{12}$')
+
+    def __new__(cls, logger, *args, **kwargs):
+        with cls._mutex:
+            if cls._instance is None:
+                cls._instance = object.__new__(cls, *args, **kwargs)
+        return cls._instance
+
+    @classmethod
+    def init(cls, logger=None):
+        cls._instance = cls(logger)
+
+    @classmethod
+    def instance(cls):
+        return cls._instance
+
+    def __init__(self, logger):
+        self.logger = logger
+        self.managers = {}
+        self.routes = {}
+        self.servers = []
+        self.connection_ids = itertools.count(1)
+        DockerManager.instance().subscribe(self.on_docker_event)
+
+    def register(self, manager):
+        self.managers[manager.storage_type] = manager
+
+    def on_docker_event(self, event: dict):
+        if event.get('Type') != 'container' or event.get('Action') != 'destroy':
+            return
+        instance_id = (event.get('Actor') or {}).get('ID', '')[:12]
+        for storage_type in self.managers:
+            self.routes.pop((storage_type, instance_id), None)
+
+    async def start(self):
+        listeners = [
+            ('redis', settings.PROXY_REDIS_PORT, self.handle_redis),
+            ('mysql', settings.PROXY_MYSQL_PORT, self.handle_mysql),
+        ]
+        for storage_type, port, handler in listeners:
+            if storage_type not in self.managers or not port:
+                continue
+            server = await asyncio.start_server(handler, settings.PROXY_HOST, port,
+                                                limit=settings.PROXY_BUFFER_SIZE)
+            self.servers.append(server)
+            self.logger.info(f'Proxy for {storage_type} listening on {settings.PROXY_HOST}:{port}.')
+
+    async def stop(self):
+        for server in self.servers:
+            server.close()
+            await server.wait_closed()
+        self.servers = []
+
+    def lookup(self, storage_type: str, instance_id: str, resume: bool = False):
+        manager = self.managers[storage_type]
+        # a hibernated instance is only resumed once the client has proven it knows the password
+        container = manager.get(instance_id, resume=resume)
+        connection = manager.get_connection(container)
+
+        host, port = connection.host, connection.port
+        for network in container.attrs['NetworkSettings']['Networks'].values():
+            if network.get('IPAddress'):
+                host, port = network['IPAddress'], int(manager.container_port.split('/')[0])
+                break
+
+        return host, port, connection.password
+
+    async def resolve(self, storage_type: str, username: bytes):
+        instance_id = username.decode(errors='replace').lower()
+        if not self.instance_id_pattern.match(instance_id):
+            raise ServiceException(f'unknown instance {instance_id}')
+
+        key = (storage_type, instance_id)
+        route = self.routes.get(key)
+        if route is None or route.expire_at < time.monotonic():
+            try:
+                host, port, password = await self.run_lookup(storage_type, instance_id)
+            except ServiceException:
+                self.routes.pop(key, None)
+                raise
+            if route is None:
+                route = self.routes[key] = ProxyRoute(storage_type=storage_type, instance_id=instance_id)
+            route.host, route.port, route.password = host, port, password
+            route.expire_at = time.monotonic() + settings.PROXY_ROUTE_TTL
+        return route
+
+    async def wake(self, route: ProxyRoute):
+        # called after authentication, a resumed container may come back with a new address
+        manager = self.managers[route.storage_type]
+        if manager.hibernation.get_state(route.instance_id) is None:
+            return
+        route.host, route.port, route.password = await self.run_lookup(
+                                                        route.storage_type, route.instance_id, resume=True)
+        route.expire_at = time.monotonic() + settings.PROXY_ROUTE_TTL
+
+    async def run_lookup(self, storage_type: str, instance_id: str, resume: bool = False):
+        loop = asyncio.get_running_loop()
+        try:
+            return await loop.run_in_executor(None, self.lookup, storage_type, instance_id, resume)
+        except (docker.errors.DockerException, requests.exceptions.RequestException) as e:
+            self.logger.error(f'Proxy lookup of {instance_id} fails: {e}')
+            raise ServiceException(f'instance {instance_id} is unavailable')
+
+    async def pipe(self, reader, writer, route: ProxyRoute, inbound: bool):
+        try:
+            while True:
+                data = await reader.read(settings.PROXY_BUFFER_SIZE)
+                if not data:
+                    break
+                writer.write(data)
+                if inbound:
+                    route.bytes_in += len(data)
+                else:
+                    route.bytes_out += len(data)
+                # only wait for the peer when its buffer is above the high-water mark
+                if writer.transport.get_write_buffer_size() > settings.PROXY_BUFFER_SIZE:
+                    await writer.drain()
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+    async def relay(self, client, backend, route: ProxyRoute, started_at: float):
+        client_reader, client_writer = client
+        backend_reader, backend_writer = backend
+        route.active += 1
+        route.total += 1
+        route.setup_time += time.monotonic() - started_at
+        try:
+            await asyncio.gather(
+                self.pipe(client_reader, backend_writer, route, inbound=True),
+                self.pipe(backend_reader, client_writer, route, inbound=False))
+        finally:
+            route.active -= 1
+
+    async def handle_redis(self, reader, writer):
+        started_at = time.monotonic()
+        route = None
+        try:
+            command = await protocol.read_resp_command(reader)
+            if not command:
+                return
+
+            # AUTH <instance_id> <password> or HELLO <ver> AUTH <instance_id> <password>,
+            # the backend only knows the default user so the username is rewritten
+            name = command[0].upper()
+            username = password = None
+            if name == b'AUTH' and len(command) == 3:
+                username, password = command[1], command[2]
+                command = [b'AUTH', command[2]]
+            elif name == b'HELLO':
+                for index, arg in enumerate(command[:-2]):
+                    if arg.upper() == b'AUTH':
+                        username, password = command[index + 1], command[index + 2]
+                        command[index + 1] = b'default'
+                        break
+
+            if username is None:
+                writer.write(b'-NOAUTH Authentication required, use AUTH <instance_id> <password>\r\n')
+                await writer.drain()
+                return
+
+            try:
+                route = await self.resolve('redis', username)
+                if not hmac.compare_digest(password, route.password.encode()):
+                    raise ServiceException('invalid username-password pair')
+                await self.wake(route)
+            except ServiceException as e:
+                writer.write(b'-WRONGPASS %s\r\n' % str(e).encode())
+                await writer.drain()
+                return
+
+            backend = await asyncio.open_connection(route.host, route.port, limit=settings.PROXY_BUFFER_SIZE)
+            backend[1].write(protocol.encode_resp_command(*command))
+            await self.relay((reader, writer), backend, route, started_at)
+        except (ConnectionError, ProtocolError, ValueError, asyncio.IncompleteReadError) as e:
+            if route is not None:
+                route.errors += 1
+            self.logger.debug(f'Redis proxy connection fails: {e}')
+        finally:
+            writer.close()
+
+    def verify_mysql_auth(self, plugin: bytes, scramble: bytes, auth_response: bytes, password: str):
+        expected = protocol.scramble_password(plugin, scramble, password.encode())
+        return hmac.compare_digest(expected, auth_response)
+
+    async def authenticate_mysql_backend(self, reader, writer, response: dict, route: ProxyRoute):
+        return await protocol.authenticate(
+                    reader, writer, b'root', route.password.encode(), response['capabilities'],
+                    response['max_packet_size'], response['charset'], response['database'], response['attributes'])
+
+    async def handle_mysql(self, reader, writer):
+        started_at = time.monotonic()
+        route = None
+        backend_writer = None
+        try:
+            scramble = protocol.generate_scramble()
+            connection_id = next(self.connection_ids) & 0xffffffff
+            writer.write(protocol.encode_mysql_packet(0, protocol.encode_handshake(connection_id, scramble)))
+
+            sequence_id, payload = await protocol.read_mysql_packet(reader)
+            response = protocol.parse_handshake_response(payload)
+            if response['capabilities'] & protocol.CLIENT_SSL:
+                raise ProtocolError('TLS is not supported by the proxy')
+
+            try:
+                route = await self.resolve('mysql', response['username'])
+            except ServiceException as e:
+                writer.write(protocol.encode_mysql_packet(sequence_id + 1, protocol.encode_error(1045, str(e), b'28000')))
+                await writer.drain()
+                return
+
+            # the proxy knows the root password, so it checks the client itself and
+            # logs in to the backend on its behalf with the backend's own scramble
+            plugin = response['plugin'] or protocol.CACHING_SHA2_PASSWORD
+            if not self.verify_mysql_auth(plugin, scramble, response['auth_response'], route.password):
+                writer.write(protocol.encode_mysql_packet(sequence_id + 1, protocol.encode_error(
+                    1045, f"Access denied for user '{route.instance_id}'", b'28000')))
+                await writer.drain()
+                return
+
+            try:
+                await self.wake(route)
+            except ServiceException as e:
+                writer.write(protocol.encode_mysql_packet(sequence_id + 1, protocol.encode_error(1045, str(e), b'28000')))
+                await writer.drain()
+                return
+
+            backend_reader, backend_writer = await asyncio.open_connection(
+                route.host, route.port, limit=settings.PROXY_BUFFER_SIZE)
+            result = await self.authenticate_mysql_backend(backend_reader, backend_writer, response, route)
+
+            sequence_id += 1
+            if result[:1] == b'\x00' and plugin == protocol.CACHING_SHA2_PASSWORD:
+                writer.write(protocol.encode_mysql_packet(sequence_id, b'\x01\x03'))
+                sequence_id += 1
+            writer.write(protocol.encode_mysql_packet(sequence_id, result))
+            if result[:1] != b'\x00':
+                await writer.drain()
+                return
+
+            await self.relay((reader, writer), (backend_reader, backend_writer), route, started_at)
+        except (ConnectionError, ProtocolError, ValueError, IndexError, asyncio.IncompleteReadError) as e:
+            if route is not None:
+                route.errors += 1
+            self.logger.debug(f'MySQL proxy connection fails: {e}')
+        finally:
+            if backend_writer is not None:
+                backend_writer.close()
+            writer.close()
+
+    def report(self):
+        # routes are dropped from the docker event thread
+        return [route.to_json() for route in list(self.routes.values())]
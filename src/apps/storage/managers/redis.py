@@ -3,30 +3,113 @@
 import os
 import stat
 import time
+import uuid
+import random
+import asyncio
+import threading
+import contextlib
+from collections import deque
 import jinja2
 import docker
+import redis
 
 from framework.conf import settings
 from framework.exception import ServiceException
 from .base import BaseManager
-from ..models.container import ContainerInstance, ContainerStatus
+from .watch import WatchEvent
+from ..models.container import ContainerStatus
 from ..models.connection import RedisConnection
+from ..profiles import tune_redis, get_tmpfs_size
+from ..keyspace import KeyspaceAggregator
+from ..protocol import ProtocolError, encode_resp_command, read_resp_reply
+
+
+CLUSTER_SLOTS = 16384
+
+
+def decode_reply(reply):
+    return reply.decode() if isinstance(reply, bytes) else reply
+
+
+def parse_cluster_info(reply):
+    # CLUSTER INFO replies with key:value lines
+    if isinstance(reply, dict):
+        return reply
+    return dict(line.split(':', 1) for line in decode_reply(reply).splitlines() if ':' in line)
 
 
 class RedisManager(BaseManager):
 
     image_tag = 'redis:latest'
+    storage_type = 'redis'
+    container_port = '6379/tcp'
+    sample_commands = 2
+    ping_commands = 2
+
+    _report_mutex = threading.Lock()
+    _reporting = set()
 
-    def info(self, container_id: str):
+    default_config = {
+        'maxmemory': 0,
+        'maxclients': 10000,
+        'appendfsync': 'everysec',
+    }
+
+    def read_info(self, container_id: str):
         container = self.get(container_id)
-        config_path = None
+        config_info = self.read_config(container)
+        config_info['profile'] = self.read_profile(self.get_volume_path(container))
+        return config_info
+
+    def cluster(self, container_id: str = ''):
+        # live cluster state and slot coverage, kept out of the config document and its ETag
+        container = self.get(container_id, resume=False)
+        group = container.labels.get('bk.group')
+        if not group:
+            raise ServiceException('单节点实例没有集群状态')
+        return dict(self.describe_group(self.list_group(group)), state=self.read_cluster_state(container))
+
+    def read_cluster_state(self, container):
+        client = self.open_client(container)
+        try:
+            cluster_info = parse_cluster_info(client.execute_command('CLUSTER', 'INFO'))
+        except redis.RedisError:
+            return None
+        finally:
+            client.close()
+        return dict((key, cluster_info.get(key)) for key in (
+                    'cluster_state', 'cluster_slots_assigned', 'cluster_slots_ok', 'cluster_known_nodes', 'cluster_size'))
+
+    def describe_group(self, items: list):
+        group = super().describe_group(items)
+        shards = sum(1 for node in group['nodes'] if node['role'] == 'master') or 1
+        group.update(shards=shards, replicas=len(group['nodes']) // shards - 1)
+        return group
+
+    def describe_node(self, item: dict):
+        # the role a node was provisioned with, failovers may have swapped it since
+        return dict(super().describe_node(item), shard=int(item['Labels'].get('bk.shard') or 0))
+
+    def get_node_count(self, config: dict):
+        if not config.get('shards'):
+            return 1
+        return config['shards'] * ((config.get('replicas') or 0) + 1)
+
+    def ensure_standalone(self, container):
+        # a single node only holds the slots of its shard
+        if container.labels.get('bk.group'):
+            raise ServiceException('集群实例不支持该操作')
+
+    def get_config_path(self, container):
         for item in container.attrs['Mounts']:
             if item['Destination'] == '/opt':
-                config_path = f"{item['Source']}/redis.conf"
-                break
-        if config_path is None:
-            raise ServiceException('容器实例中未发现配置文件')
+                return f"{item['Source']}/redis.conf"
+        raise ServiceException('容器实例中未发现配置文件')
+
+    def read_config(self, container):
+        return self.parse_config_file(self.get_config_path(container))
 
+    def parse_config_file(self, config_path: str):
         with open(config_path, 'r') as fp:
             content = fp.read()
 
@@ -42,70 +125,481 @@ class RedisManager(BaseManager):
 
         return config_info
 
-    def generate_config_file(self, config: dict, volume_path: str):
-        template_dir = os.path.realpath(os.path.join(os.path.dirname(__file__), os.pardir, 'templates'))
-        jinja2_env = jinja2.Environment(loader=jinja2.FileSystemLoader(template_dir), autoescape=True)
-        template = jinja2_env.get_template('redis.conf')
-        with open(f'{volume_path}/redis.conf', 'w') as fp:
-            fp.write(template.render(**config))
+    def load_config(self, volume_path: str):
+        config = dict(self.default_config)
+        try:
+            config_info = self.parse_config_file(f'{volume_path}/redis.conf')
+        except FileNotFoundError:
+            return config
 
-    def create(self, config: dict = dict()):
-        password = self.generate_random_password()
-        config['password'] = password
+        for key, value in self.default_config.items():
+            if key in config_info:
+                config[key] = type(value)(config_info[key])
+        config.update(self.load_profile(volume_path))
+        return config
+
+    @contextlib.contextmanager
+    def consistent_point(self, container):
+        client = self.open_client(container)
+        try:
+            try:
+                client.bgsave()
+            except redis.exceptions.ResponseError:
+                # a background save is already running, wait for it instead
+                pass
+
+            deadline = time.monotonic() + settings.SNAPSHOT_TIMEOUT
+            while True:
+                persistence = client.info('persistence')
+                if not persistence['rdb_bgsave_in_progress']:
+                    break
+                if time.monotonic() > deadline:
+                    raise ServiceException('实例数据持久化超时')
+                time.sleep(0.1)
+
+            if persistence['rdb_last_bgsave_status'] != 'ok':
+                raise ServiceException('实例数据持久化失败')
+            metadata = {'rdb_last_save_time': persistence['rdb_last_save_time']}
+        except redis.exceptions.RedisError as e:
+            raise ServiceException(f'实例数据持久化失败: {e}')
+        finally:
+            client.close()
+
+        yield metadata
+
+    def write_config(self, container, changes: dict):
+        config_path = self.get_config_path(container)
+        with open(config_path, 'r') as fp:
+            lines = fp.read().split('\n')
+
+        # replace the directive in place to keep the template layout, append otherwise
+        pending = dict(changes)
+        for index, line in enumerate(lines):
+            segments = line.strip().split()
+            if segments and not segments[0].startswith('#') and segments[0] in pending:
+                lines[index] = f'{segments[0]} {pending.pop(segments[0])}'
+        lines.extend(f'{key} {value}' for key, value in pending.items())
 
-        max_tries = 3
-        while True:
-            max_tries -= 1
-            if max_tries == 0:
-                raise ServiceException('容器实例存储目录创建失败')
-            volume_name = self.generate_random_volume()
-            volume_path = f'{settings.DOCKER_VOLUME_ROOT}/redis/{volume_name}'
-            if not os.path.exists(volume_path):
-                break
+        with open(config_path, 'w') as fp:
+            fp.write('\n'.join(lines))
+        self.invalidate_config(container.short_id)
+        self.notify(container.short_id, WatchEvent.CONFIG_CHANGED)
 
+    def update_config(self, container_id: str, changes: dict):
+        container = self.get(container_id)
+        # every node of a cluster runs the same configuration
+        return self.apply_to_group(container, lambda member: {
+            'applied': list(self.set_config(member, changes)), 'restarted': [], 'pending': [],
+        })
+
+    def set_config(self, container, changes: dict):
+        client = self.open_client(container)
+        applied = {}
         try:
-            os.makedirs(volume_path)
-            os.chmod(volume_path, stat.S_IRWXU | stat.S_IRWXG | stat.S_IRWXO)
-        except PermissionError:
-            raise ServiceException('容器实例存储目录创建失败')
+            for key, value in changes.items():
+                client.config_set(key, value)
+                applied[key] = value
+        except redis.exceptions.RedisError as e:
+            raise ServiceException(f'配置修改失败: {e}')
+        finally:
+            client.close()
+            if applied:
+                self.write_config(container, applied)
+        return applied
 
-        self.generate_config_file(config, volume_path)
+    def get_connection(self, container):
+        config_info = self.read_config(container)
+        connection = RedisConnection(
+                        host=settings.DOCKER_HOST_IP,
+                        port=self.get_host_port(container),
+                        password=config_info.get('requirepass', ''))
+        group = container.labels.get('bk.group')
+        if group:
+            connection.nodes = [
+                f"{settings.DOCKER_HOST_IP}:{item['Labels']['bk.port']}" for item in self.list_group(group)
+            ]
+        return connection
+
+    def open_client(self, container, proxy: bool = False, db: int = 0):
+        connection = self.get_connection(container)
+        host, port, username = connection.host, connection.port, None
+        if proxy:
+            # the proxy routes on the instance id given as the AUTH username
+            (host, port), username = self.get_proxy_address(), container.short_id
+        return redis.Redis(
+                    host=host,
+                    port=port,
+                    username=username,
+                    password=connection.password,
+                    db=db,
+                    socket_timeout=settings.STORAGE_CLIENT_TIMEOUT,
+                    socket_connect_timeout=settings.STORAGE_CLIENT_TIMEOUT)
+
+    def count_commands(self, container):
+        client = self.open_client(container)
+        try:
+            return client.info('stats')['total_commands_processed']
+        finally:
+            client.close()
+
+    def run_benchmark(self, container, recorder, proxy: bool = False):
+        self.ensure_standalone(container)
+        # a db of its own keeps the test keys out of the tenant's keyspace, though not out of its
+        # memory: under an allkeys-* maxmemory policy they may still evict tenant data
+        client = self.open_client(container, proxy, db=settings.BENCHMARK_REDIS_DB)
+        keys = [f'bk:benchmark:{uuid.uuid4().hex[:8]}:{i}' for i in range(settings.BENCHMARK_KEYSPACE)]
+        value = os.urandom(settings.BENCHMARK_VALUE_SIZE)
+        depth = settings.BENCHMARK_PIPELINE
+        # keys left behind by an interrupted run expire on their own
+        expire = int(recorder.duration) + 60
+        try:
+            # seed the keyspace so that every GET hits
+            for start in range(0, len(keys), 1000):
+                pipe = client.pipeline(transaction=False)
+                for key in keys[start:start + 1000]:
+                    pipe.set(key, value, ex=expire)
+                pipe.execute()
+
+            # each pipelined batch is all GETs or all SETs, mixed at BENCHMARK_WRITE_RATIO
+            while recorder.running():
+                operation = 'set' if random.random() < settings.BENCHMARK_WRITE_RATIO else 'get'
+                pipe = client.pipeline(transaction=False)
+                for key in random.choices(keys, k=depth):
+                    if operation == 'set':
+                        pipe.set(key, value, ex=expire)
+                    else:
+                        pipe.get(key)
+                started_at = time.perf_counter()
+                pipe.execute()
+                recorder.record(operation, time.perf_counter() - started_at, count=depth)
+        except redis.RedisError as e:
+            raise ServiceException(f'性能测试失败: {e}')
+        finally:
+            try:
+                for start in range(0, len(keys), 1000):
+                    client.unlink(*keys[start:start + 1000])
+            except redis.RedisError:
+                pass
+            client.close()
+
+    def collect_insights(self, container, state: dict):
+        client = self.open_client(container)
+        cursor = state['cursor']
+        try:
+            # AUTH, SLOWLOG GET and LATENCY LATEST, kept out of the hibernation idle check
+            self.hibernation.account(container.short_id, 3)
+            # slowlog ids only grow, everything up to the cursor has been seen already
+            entries = client.slowlog_get(settings.INSIGHTS_SLOWLOG_BATCH)
+            last_id = cursor.get('slowlog', -1)
+            if entries and entries[0]['id'] < last_id:
+                # the server restarted and numbers from zero again
+                last_id = -1
+            for entry in reversed(entries):
+                if entry['id'] <= last_id:
+                    continue
+                command = entry['command']
+                if isinstance(command, bytes):
+                    command = command.decode(errors='replace')
+                name = command.split(' ', 1)[0].upper() or '?'
+                offender = state['offenders'].setdefault(name, {
+                    'command': name, 'count': 0, 'total_ms': 0, 'max_ms': 0, 'example': None, 'last_seen': None,
+                })
+                duration_ms = entry['duration'] / 1000
+                offender['count'] += 1
+                offender['total_ms'] = round(offender['total_ms'] + duration_ms, 3)
+                offender['max_ms'] = max(offender['max_ms'], duration_ms)
+                offender['example'] = command[:128]
+                offender['last_seen'] = entry['start_time']
+            if entries:
+                cursor['slowlog'] = max(last_id, entries[0]['id'])
+
+            # only events with a spike newer than their cursor have history worth fetching
+            since_map = cursor.setdefault('latency', {})
+            for event, timestamp, latest, maximum in client.execute_command('LATENCY', 'LATEST'):
+                event = event.decode() if isinstance(event, bytes) else event
+                since = since_map.get(event, 0)
+                if timestamp <= since:
+                    continue
+                record = state['events'].setdefault(event, {
+                    'event': event, 'latest_ms': 0, 'max_ms': 0, 'last_seen': None,
+                    'samples': deque(maxlen=settings.INSIGHTS_MAX_SAMPLES),
+                })
+                self.hibernation.account(container.short_id, 1)
+                for sample_at, latency in client.execute_command('LATENCY', 'HISTORY', event):
+                    if sample_at > since:
+                        record['samples'].append((sample_at, latency))
+                record.update(latest_ms=latest, max_ms=maximum, last_seen=timestamp)
+                since_map[event] = timestamp
+        except redis.RedisError as e:
+            raise ServiceException(f'实例诊断数据采集失败: {e}')
+        finally:
+            client.close()
+
+    def memory_report(self, container_id: str, sample_ratio: float, max_keys: int = 0,
+                      depth: int = 3, limit: int = 20):
+        # checked before the response starts streaming
+        container = self.get(container_id)
+        self.ensure_standalone(container)
+        with self._report_mutex:
+            if container.short_id in self._reporting:
+                raise ServiceException('该实例正在进行内存分析')
+            if len(self._reporting) >= settings.MEMORY_REPORT_CONCURRENCY:
+                raise ServiceException('进行中的内存分析过多，请稍后重试')
+            self._reporting.add(container.short_id)
+
+        try:
+            client = self.open_client(container)
+        except BaseException:
+            with self._report_mutex:
+                self._reporting.discard(container.short_id)
+            raise
 
+        def generate():
+            try:
+                yield from self.scan_keyspace(client, sample_ratio, max_keys, depth, limit)
+            finally:
+                client.close()
+                with self._report_mutex:
+                    self._reporting.discard(container.short_id)
+
+        return generate()
+
+    def scan_keyspace(self, client, sample_ratio: float, max_keys: int, depth: int, limit: int):
+        aggregator = KeyspaceAggregator(settings.MEMORY_REPORT_MAX_PATTERNS, limit, depth)
+        started_at = time.monotonic()
+        reported_at = started_at
+        scanned = 0
+        cursor = 0
         try:
-            image = self.docker_client.images.get(self.image_tag)
+            total_keys = client.dbsize()
+            while True:
+                # SCAN walks the keyspace in small steps, the server never stalls on it
+                cursor, keys = client.scan(cursor, count=settings.MEMORY_REPORT_BATCH)
+                sampled = [key for key in keys if random.random() < sample_ratio]
+                scanned += len(keys)
+
+                if sampled:
+                    pipe = client.pipeline(transaction=False)
+                    for key in sampled:
+                        pipe.memory_usage(key, samples=settings.MEMORY_REPORT_USAGE_SAMPLES)
+                        pipe.type(key)
+                        pipe.ttl(key)
+                    replies = pipe.execute()
+                    for index, key in enumerate(sampled):
+                        size, key_type, ttl = replies[index * 3:index * 3 + 3]
+                        # keys expiring between SCAN and MEMORY USAGE report nothing
+                        if size is None:
+                            continue
+                        aggregator.add(key.decode(errors='replace'), size, key_type.decode(), ttl)
+
+                if cursor == 0 or (max_keys and scanned >= max_keys):
+                    break
+
+                now = time.monotonic()
+                if now - reported_at >= settings.MEMORY_REPORT_PROGRESS_INTERVAL:
+                    reported_at = now
+                    yield {
+                        'event': 'progress',
+                        'scanned': scanned,
+                        'sampled': aggregator.sampled,
+                        'total_keys': total_keys,
+                    }
+
+                # hold the scan to MEMORY_REPORT_RATE keys per second
+                delay = scanned / settings.MEMORY_REPORT_RATE - (now - started_at)
+                if delay > 0:
+                    time.sleep(delay)
+        except redis.RedisError as e:
+            yield {'event': 'error', 'msg': f'内存分析失败: {e}'}
+            return
+
+        report = aggregator.report(scanned, total_keys, limit)
+        report.update(event='report', sample_ratio=sample_ratio, elapsed=round(time.monotonic() - started_at, 3))
+        yield report
+
+    async def ping(self, host: str, port: int, password: str = ''):
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            # AUTH and PING pipelined, a loading or blocked server fails either one
+            commands = [encode_resp_command('AUTH', password)] if password else []
+            commands.append(encode_resp_command('PING'))
+            writer.write(b''.join(commands))
+            for _ in commands:
+                reply = await read_resp_reply(reader)
+                if reply.startswith(b'-'):
+                    raise ProtocolError(reply[1:].decode(errors='replace'))
+        finally:
+            writer.close()
+
+    def generate_config_file(self, config: dict, volume_path: str, config_dir: str = None):
+        # cluster nodes keep their own redis.conf next to the shared profile
+        template_dir = os.path.realpath(os.path.join(os.path.dirname(__file__), os.pardir, 'templates'))
+        jinja2_env = jinja2.Environment(loader=jinja2.FileSystemLoader(template_dir), autoescape=True)
+        template = jinja2_env.get_template('redis.conf')
+        with open(f'{config_dir or volume_path}/redis.conf', 'w') as fp:
+            fp.write(template.render(**dict(config, **tune_redis(config))))
+        self.write_profile(config, volume_path)
+
+    def get_image(self):
+        try:
+            return self.docker.get_image(self.image_tag)
         except docker.errors.ImageNotFound:
             raise ServiceException('存储资源类型镜像不存在')
 
-        port = self.pick_random_port()
-        if port == 0:
-            raise ServiceException('宿主机暂无可用端口')
-
+    def run_container(self, image, config: dict, config_dir: str, ports: dict, labels: dict):
         command = 'redis-server /opt/redis.conf'
         options = dict(
-            ports={'6379/tcp': port},
+            ports=ports,
             volumes={
-                volume_path: {'bind': '/opt', 'mode': 'rw'},
+                config_dir: {'bind': '/opt', 'mode': 'rw'},
             },
+            labels=labels,
+            **self.make_resource_limits(config),
             #auto_remove=True,
             detach=True,
             tty=True,
             stdin_open=True)
+        tmpfs_size = get_tmpfs_size(config)
+        if tmpfs_size:
+            options['tmpfs'] = {'/data': f'size={tmpfs_size},mode=1777'}
         container = self.docker_client.containers.create(image, command=command, **options)
         container.start()
+        return container
+
+    def provision(self, config: dict, volume_path: str, seeded: bool = False):
+        if config.get('shards'):
+            if seeded:
+                raise ServiceException('集群实例不支持从快照创建')
+            return self.provision_cluster(config, volume_path)
+
+        password = self.generate_random_password()
+        config['password'] = password
+
+        self.generate_config_file(config, volume_path)
+        image = self.get_image()
+
+        port = self.pick_random_port()
+        if port == 0:
+            raise ServiceException('宿主机暂无可用端口')
+
+        container = self.run_container(
+                        image, config, volume_path, {'6379/tcp': port}, self.make_labels(volume_path, config))
         time.sleep(3)
 
         container = self.get(container.short_id)
         if ContainerStatus(container.status) == ContainerStatus.CREATED:
             raise ServiceException('容器实例启动失败')
 
-        instance = ContainerInstance(
-                    id=container.short_id,
-                    name=container.name,
-                    ports=container.ports,
-                    status=ContainerStatus(container.status))
+        instance = self.make_instance(container)
 
         connection = RedisConnection(
                         host=settings.DOCKER_HOST_IP,
                         port=port,
                         password=password)
         return instance, connection
+
+    def provision_cluster(self, config: dict, volume_path: str):
+        shards, replicas = config['shards'], config.get('replicas') or 0
+        if not 1 <= shards <= settings.REDIS_CLUSTER_MAX_SHARDS:
+            raise ServiceException(f'集群分片数须在1~{settings.REDIS_CLUSTER_MAX_SHARDS}之间')
+        if not 0 <= replicas <= settings.REDIS_CLUSTER_MAX_REPLICAS:
+            raise ServiceException(f'集群副本数须在0~{settings.REDIS_CLUSTER_MAX_REPLICAS}之间')
+
+        password = self.generate_random_password()
+        config['password'] = password
+        image = self.get_image()
+
+        # nodes share the volume (and its bk.volume label, so a failed create cleans up every node),
+        # each mounts its own directory for redis.conf, nodes.conf and data
+        group = uuid.uuid4().hex[:12]
+        nodes = []
+        for index in range(shards * (replicas + 1)):
+            port, bus_port = self.pick_random_port(), self.pick_random_port()
+            if port == 0 or bus_port == 0:
+                raise ServiceException('宿主机暂无可用端口')
+
+            config_dir = os.path.join(volume_path, f'node-{index}')
+            os.mkdir(config_dir)
+            os.chmod(config_dir, stat.S_IRWXU | stat.S_IRWXG | stat.S_IRWXO)
+            # peers and clients reach the node through the host, announce the published ports
+            self.generate_config_file(dict(
+                config,
+                cluster_enabled=True,
+                cluster_node_timeout=settings.REDIS_CLUSTER_NODE_TIMEOUT,
+                cluster_announce_ip=settings.DOCKER_HOST_IP,
+                cluster_announce_port=port,
+                cluster_announce_bus_port=bus_port), volume_path, config_dir)
+
+            labels = dict(self.make_labels(volume_path, config), **{
+                'bk.group': group,
+                'bk.node': str(index),
+                'bk.role': 'master' if index < shards else 'replica',
+                'bk.shard': str(index % shards),
+                'bk.port': str(port),
+            })
+            container = self.run_container(
+                            image, config, config_dir, {'6379/tcp': port, '16379/tcp': bus_port}, labels)
+            nodes.append({'id': container.short_id, 'port': port, 'bus_port': bus_port})
+        time.sleep(3)
+
+        for node in nodes:
+            container = self.get(node['id'])
+            if ContainerStatus(container.status) == ContainerStatus.CREATED:
+                raise ServiceException('容器实例启动失败')
+        self.form_cluster(nodes, shards, password)
+
+        leader = self.get(nodes[0]['id'])
+        instance = self.make_instance(leader)
+
+        connection = RedisConnection(
+                        host=settings.DOCKER_HOST_IP,
+                        port=nodes[0]['port'],
+                        password=password,
+                        nodes=[f"{settings.DOCKER_HOST_IP}:{node['port']}" for node in nodes])
+        return instance, connection
+
+    def form_cluster(self, nodes: list, shards: int, password: str):
+        host = settings.DOCKER_HOST_IP
+        clients = [
+            redis.Redis(
+                host=host,
+                port=node['port'],
+                password=password,
+                socket_timeout=settings.STORAGE_CLIENT_TIMEOUT,
+                socket_connect_timeout=settings.STORAGE_CLIENT_TIMEOUT)
+            for node in nodes
+        ]
+        deadline = time.monotonic() + settings.REDIS_CLUSTER_FORM_TIMEOUT
+        try:
+            node_ids = [decode_reply(client.execute_command('CLUSTER', 'MYID')) for client in clients]
+
+            # the first node introduces every other one, gossip spreads the rest
+            for node in nodes[1:]:
+                clients[0].execute_command('CLUSTER', 'MEET', host, node['port'], node['bus_port'])
+
+            # the 16384 hash slots are split evenly across the masters
+            for shard in range(shards):
+                first, last = CLUSTER_SLOTS * shard // shards, CLUSTER_SLOTS * (shard + 1) // shards - 1
+                clients[shard].execute_command('CLUSTER', 'ADDSLOTSRANGE', first, last)
+
+            # a replica can only follow a master that gossip has told it about
+            for index in range(shards, len(nodes)):
+                while True:
+                    try:
+                        clients[index].execute_command('CLUSTER', 'REPLICATE', node_ids[index % shards])
+                        break
+                    except redis.exceptions.ResponseError:
+                        if time.monotonic() > deadline:
+                            raise ServiceException('集群组建超时')
+                        time.sleep(0.2)
+
+            for client in clients:
+                while parse_cluster_info(client.execute_command('CLUSTER', 'INFO')).get('cluster_state') != 'ok':
+                    if time.monotonic() > deadline:
+                        raise ServiceException('集群组建超时')
+                    time.sleep(0.2)
+        except redis.RedisError as e:
+            raise ServiceException(f'集群组建失败: {e}')
+        finally:
+            for client in clients:
+                client.close()
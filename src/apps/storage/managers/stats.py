@@ -0,0 +1,182 @@
+# coding=utf-8
+
+import time
+import threading
+from collections import deque
+
+import docker
+import requests
+
+from framework.cgroup import find_container_cgroup, read_cgroup_stats
+from framework.conf import settings
+from framework.docker import DockerManager
+from framework.exception import ServiceException
+from framework.utils import read_net_dev
+
+
+class StatsManager:
+
+    _mutex = threading.Lock()
+    _instance = None
+
+    rate_fields = (
+        ('io_read_bytes', 'io_read_bps'),
+        ('io_write_bytes', 'io_write_bps'),
+        ('io_read_ops', 'io_read_iops'),
+        ('io_write_ops', 'io_write_iops'),
+        ('net_rx_bytes', 'net_rx_bps'),
+        ('net_tx_bytes', 'net_tx_bps'),
+    )
+
+    def __new__(cls, logger, *args, **kwargs):
+        with cls._mutex:
+            if cls._instance is None:
+                cls._instance = object.__new__(cls, *args, **kwargs)
+        return cls._instance
+
+    @classmethod
+    def init(cls, logger=None):
+        cls._instance = cls(logger)
+
+    @classmethod
+    def instance(cls):
+        return cls._instance
+
+    def __init__(self, logger):
+        self.logger = logger
+        self.docker = DockerManager.instance()
+        self.managers = []
+        self.targets = {}
+        self.samples = {}
+        self.history = {}
+        self._collect_mutex = threading.Lock()
+        self.docker.subscribe(self.on_docker_event)
+
+        self._sampler = threading.Thread(target=self.run_sampler, name='stats-sampler', daemon=True)
+        self._sampler.start()
+
+    def register(self, manager):
+        self.managers.append(manager)
+
+    def on_docker_event(self, event: dict):
+        # a restarted container runs under a new pid and cgroup, check StartedAt on the next sample
+        if event.get('Type') != 'container' or event.get('Action') != 'start':
+            return
+        target = self.targets.get((event.get('Actor') or {}).get('ID', ''))
+        if target is not None:
+            target['generation'] = None
+
+    def get_target(self, container_id: str, storage_type: str):
+        # a cached target is trusted until a start event, without a live event
+        # stream the StartedAt of the container is checked on every sample instead
+        target = self.targets.get(container_id)
+        generation = self.docker.events_generation
+        if target is not None and self.docker.events_live and target['generation'] == generation:
+            return target
+
+        state = self.docker.get_client().api.inspect_container(container_id)['State']
+        if target is None or target['started_at'] != state['StartedAt']:
+            if target is not None:
+                # counters restart with the container, no rate across the restart
+                self.samples.pop(container_id[:12], None)
+            target = {
+                'type': storage_type,
+                'pid': state['Pid'],
+                'cgroup': find_container_cgroup(container_id, state['Pid']),
+                'started_at': state['StartedAt'],
+            }
+        target['generation'] = generation
+        self.targets[container_id] = target
+        return target
+
+    def read_sample(self, target: dict):
+        sample = read_cgroup_stats(target['cgroup'])
+        try:
+            sample['net_rx_bytes'], sample['net_tx_bytes'] = read_net_dev(target['pid'])
+        except (OSError, ValueError):
+            sample['net_rx_bytes'], sample['net_tx_bytes'] = None, None
+        sample['timestamp'] = time.time()
+        return sample
+
+    def compute_rates(self, previous: dict, current: dict):
+        entry = dict(current)
+        if previous is None:
+            return entry
+
+        elapsed = current['timestamp'] - previous['timestamp']
+        if elapsed <= 0:
+            return entry
+
+        entry['cpu_percent'] = round((current['cpu_usec'] - previous['cpu_usec']) / (elapsed * 1e6) * 100, 2)
+        for counter, rate in self.rate_fields:
+            if current[counter] is not None and previous[counter] is not None:
+                entry[rate] = round((current[counter] - previous[counter]) / elapsed, 2)
+        return entry
+
+    def collect(self):
+        with self._collect_mutex:
+            alive = set()
+            client = self.docker.get_client()
+            for manager in self.managers:
+                # container summaries only, no per-container inspect
+                filters = {'ancestor': manager.image_tag, 'status': 'running'}
+                for item in client.api.containers(filters=filters):
+                    container_id = item['Id']
+                    short_id = container_id[:12]
+                    alive.add(short_id)
+                    try:
+                        target = self.get_target(container_id, manager.storage_type)
+                        if target['cgroup'] is None:
+                            continue
+                        current = self.read_sample(target)
+                    except (OSError, ValueError, docker.errors.NotFound):
+                        self.targets.pop(container_id, None)
+                        continue
+
+                    entry = self.compute_rates(self.samples.get(short_id), current)
+                    entry['id'] = short_id
+                    entry['type'] = manager.storage_type
+                    labels = item.get('Labels') or {}
+                    if labels.get('bk.group'):
+                        entry['group'] = labels['bk.group']
+                        entry['node'] = labels.get('bk.node')
+                    self.samples[short_id] = current
+                    if short_id not in self.history:
+                        self.history[short_id] = deque(maxlen=settings.STATS_HISTORY_SIZE)
+                    self.history[short_id].append(entry)
+
+            for short_id in list(self.samples):
+                if short_id not in alive:
+                    self.samples.pop(short_id, None)
+                    self.history.pop(short_id, None)
+            for container_id in list(self.targets):
+                if container_id[:12] not in alive:
+                    self.targets.pop(container_id, None)
+
+    def run_sampler(self):
+        while True:
+            try:
+                self.collect()
+            except ServiceException:
+                pass
+            except (docker.errors.DockerException, requests.exceptions.RequestException) as e:
+                self.logger.error(f'Stats collection fails: {e}')
+            time.sleep(settings.STATS_SAMPLE_INTERVAL)
+
+    def report(self, storage_type: str):
+        # the sampler mutates the history, readers copy it under the same mutex
+        with self._collect_mutex:
+            histories = list(self.history.values())
+            return [
+                history[-1] for history in histories
+                if history and history[-1]['type'] == storage_type
+            ]
+
+    def get(self, container_id: str, history: bool = False):
+        with self._collect_mutex:
+            entries = self.history.get(container_id)
+            if not entries:
+                return None
+            if history:
+                return list(entries)
+            return entries[-1]
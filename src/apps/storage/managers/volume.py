@@ -0,0 +1,251 @@
+# coding=utf-8
+
+import os
+import enum
+import stat
+import time
+import uuid
+import shutil
+import threading
+import contextlib
+
+import docker
+import requests
+
+from framework.conf import settings
+from framework.docker import DockerManager
+from framework.exception import ServiceException
+
+
+class VolumePolicy:
+    DELETE = 'delete'
+    ARCHIVE = 'archive'
+
+
+class StorageTier(str, enum.Enum):
+    DISK = 'disk'
+    TMPFS = 'tmpfs'
+    FAST_DISK = 'fast-disk'
+
+
+class VolumeManager:
+
+    _mutex = threading.Lock()
+    _instance = None
+
+    storage_types = ('mysql', 'redis')
+
+    def __new__(cls, logger, *args, **kwargs):
+        with cls._mutex:
+            if cls._instance is None:
+                cls._instance = object.__new__(cls, *args, **kwargs)
+        return cls._instance
+
+    @classmethod
+    def init(cls, logger=None):
+        cls._instance = cls(logger)
+
+    @classmethod
+    def instance(cls):
+        return cls._instance
+
+    def __init__(self, logger):
+        self.logger = logger
+        self.docker = DockerManager.instance()
+        self.usage = {}
+        # staging directories still held by a request, an export may stream far past the grace period
+        self.staging_paths = set()
+        self.staging_mutex = threading.Lock()
+
+        self._reclaimer = threading.Thread(target=self.run_reclaimer, name='volume-reclaimer', daemon=True)
+        self._reclaimer.start()
+
+    @property
+    def root(self):
+        return os.path.realpath(settings.DOCKER_VOLUME_ROOT)
+
+    @property
+    def roots(self):
+        roots = [self.root]
+        if settings.STORAGE_FAST_DISK_ROOT:
+            roots.append(os.path.realpath(settings.STORAGE_FAST_DISK_ROOT))
+        return roots
+
+    def get_root(self, tier: str = None):
+        if tier == StorageTier.FAST_DISK:
+            if not settings.STORAGE_FAST_DISK_ROOT:
+                raise ServiceException('未配置高速磁盘存储目录')
+            return os.path.realpath(settings.STORAGE_FAST_DISK_ROOT)
+        # tmpfs instances keep their config files on disk, only the data lives in memory
+        return self.root
+
+    def find_root(self, path: str):
+        path = os.path.realpath(path)
+        for root in self.roots:
+            if path == root or path.startswith(root + os.sep):
+                return root
+        return None
+
+    def allocate(self, storage_type: str, tier: str = None):
+        type_root = os.path.join(self.get_root(tier), storage_type)
+        try:
+            os.makedirs(type_root, exist_ok=True)
+        except PermissionError:
+            raise ServiceException('容器实例存储目录创建失败')
+
+        # mkdir is atomic, so a name collision simply picks another id
+        while True:
+            volume_path = os.path.join(type_root, uuid.uuid4().hex[:16])
+            try:
+                os.mkdir(volume_path)
+                os.chmod(volume_path, stat.S_IRWXU | stat.S_IRWXG | stat.S_IRWXO)
+            except FileExistsError:
+                continue
+            except PermissionError:
+                raise ServiceException('容器实例存储目录创建失败')
+            return volume_path
+
+    @contextlib.contextmanager
+    def staging(self, volume_path: str = None):
+        # scratch directory on the same filesystem as the volume, so clones can reflink
+        root = (volume_path and self.find_root(volume_path)) or self.root
+        staging_path = os.path.join(root, '.staging', uuid.uuid4().hex)
+        try:
+            os.makedirs(staging_path)
+            os.chmod(staging_path, stat.S_IRWXU | stat.S_IRWXG | stat.S_IRWXO)
+        except PermissionError:
+            raise ServiceException('临时存储目录创建失败')
+        with self.staging_mutex:
+            self.staging_paths.add(staging_path)
+        try:
+            yield staging_path
+        finally:
+            shutil.rmtree(staging_path, ignore_errors=True)
+            with self.staging_mutex:
+                self.staging_paths.discard(staging_path)
+
+    def resolve(self, path: str):
+        # map any path inside a volume to the volume directory itself
+        path = os.path.realpath(path)
+        for root in self.roots:
+            segments = os.path.relpath(path, root).split(os.sep)
+            if len(segments) < 2 or segments[0] not in self.storage_types or segments[1].startswith('.'):
+                continue
+            return os.path.join(root, segments[0], segments[1])
+        return None
+
+    def release(self, volume_path: str, policy: str = None):
+        volume_path = self.resolve(volume_path)
+        if volume_path is None or not os.path.isdir(volume_path):
+            return False
+
+        policy = policy or settings.VOLUME_RETENTION_POLICY
+        if policy == VolumePolicy.ARCHIVE:
+            storage_type, volume_name = volume_path.split(os.sep)[-2:]
+            archive_dir = os.path.join(self.find_root(volume_path), '.archive', storage_type)
+            os.makedirs(archive_dir, exist_ok=True)
+            archive_path = os.path.join(archive_dir, f'{volume_name}.{int(time.time())}')
+            shutil.move(volume_path, archive_path)
+            os.utime(archive_path)
+            self.logger.info(f'Volume {volume_path} archived to {archive_path}.')
+        else:
+            shutil.rmtree(volume_path, ignore_errors=True)
+            self.logger.info(f'Volume {volume_path} deleted.')
+
+        self.usage.pop(volume_path, None)
+        return True
+
+    def list_volumes(self):
+        volumes = []
+        for root in self.roots:
+            for storage_type in self.storage_types:
+                type_root = os.path.join(root, storage_type)
+                if not os.path.isdir(type_root):
+                    continue
+                for entry in os.scandir(type_root):
+                    if entry.is_dir(follow_symlinks=False) and not entry.name.startswith('.'):
+                        volumes.append((storage_type, entry.path))
+        return volumes
+
+    def list_mounted_volumes(self):
+        mounted = {}
+        for item in self.docker.get_client().api.containers(all=True):
+            for mount in item.get('Mounts') or []:
+                volume_path = self.resolve(mount.get('Source', ''))
+                if volume_path:
+                    mounted[volume_path] = item['Id'][:12]
+        return mounted
+
+    def compute_disk_usage(self, path: str):
+        total = 0
+        stack = [path]
+        while stack:
+            try:
+                entries = list(os.scandir(stack.pop()))
+            except OSError:
+                continue
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        stack.append(entry.path)
+                    else:
+                        total += entry.stat(follow_symlinks=False).st_blocks * 512
+                except OSError:
+                    continue
+        return total
+
+    def reclaim(self):
+        mounted = self.list_mounted_volumes()
+        now = time.time()
+
+        usage = {}
+        for storage_type, volume_path in self.list_volumes():
+            instance_id = mounted.get(volume_path)
+            # leave fresh directories alone, a create may still be populating them
+            if instance_id is None and now - os.stat(volume_path).st_mtime > settings.VOLUME_ORPHAN_GRACE:
+                self.logger.warning(f'Volume {volume_path} is orphaned.')
+                self.release(volume_path)
+                continue
+
+            usage[volume_path] = {
+                'type': storage_type,
+                'volume': os.path.basename(volume_path),
+                'root': self.find_root(volume_path),
+                'instance': instance_id,
+                'size': self.compute_disk_usage(volume_path),
+            }
+        self.usage = usage
+
+        for root in self.roots:
+            # staging directories outlive their request only if the service crashed
+            staging_root = os.path.join(root, '.staging')
+            if os.path.isdir(staging_root):
+                with self.staging_mutex:
+                    staging_paths = set(self.staging_paths)
+                for entry in os.scandir(staging_root):
+                    if entry.path in staging_paths:
+                        continue
+                    if now - entry.stat(follow_symlinks=False).st_mtime > settings.VOLUME_ORPHAN_GRACE:
+                        shutil.rmtree(entry.path, ignore_errors=True)
+
+            archive_root = os.path.join(root, '.archive')
+            if os.path.isdir(archive_root):
+                expire_time = now - settings.VOLUME_ARCHIVE_DAYS * 86400
+                for storage_type in os.listdir(archive_root):
+                    for entry in os.scandir(os.path.join(archive_root, storage_type)):
+                        if entry.stat(follow_symlinks=False).st_mtime < expire_time:
+                            shutil.rmtree(entry.path, ignore_errors=True)
+                            self.logger.info(f'Archived volume {entry.path} purged.')
+
+    def run_reclaimer(self):
+        while True:
+            try:
+                self.reclaim()
+            except ServiceException:
+                pass
+            except (OSError, docker.errors.DockerException, requests.exceptions.RequestException) as e:
+                self.logger.error(f'Volume reclaim fails: {e}')
+            time.sleep(settings.VOLUME_RECLAIM_INTERVAL)
+
+    def report(self):
+        return sorted(self.usage.values(), key=lambda item: item['size'], reverse=True)
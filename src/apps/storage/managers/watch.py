@@ -0,0 +1,165 @@
+# coding=utf-8
+
+import time
+import uuid
+import asyncio
+import itertools
+import threading
+from collections import deque
+
+from framework.conf import settings
+from ..models.container import format_timestamp
+
+
+class WatchEvent:
+    CREATED = 'created'
+    RUNNING = 'running'
+    EXITED = 'exited'
+    PAUSED = 'paused'
+    HIBERNATED = 'hibernated'
+    REMOVED = 'removed'
+    EXPIRED = 'expired'
+    HEALTHY = 'healthy'
+    UNHEALTHY = 'unhealthy'
+    CONFIG_CHANGED = 'config_changed'
+    # control messages, not tied to an instance
+    RESET = 'reset'
+    OVERFLOW = 'overflow'
+
+
+class WatchSubscriber:
+
+    def __init__(self, loop, types=None, ids=None, events=None):
+        self.loop = loop
+        self.types = set(types or [])
+        self.ids = set(ids or [])
+        self.events = set(events or [])
+        self.queue = asyncio.Queue(maxsize=settings.WATCH_CLIENT_BUFFER)
+        self.overflowed = False
+
+    def matches(self, event: dict):
+        if self.types and event['type'] not in self.types:
+            return False
+        if self.ids and event['instance'] not in self.ids:
+            return False
+        if self.events and event['event'] not in self.events:
+            return False
+        return True
+
+    def deliver(self, event: dict):
+        # runs on the subscriber's loop; once a slow client falls behind it gets
+        # no more events and is told to reconnect with its last event id
+        if self.overflowed:
+            return
+        try:
+            self.queue.put_nowait(event)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+
+class WatchManager:
+
+    _mutex = threading.Lock()
+    _instance = None
+
+    def __new__(cls, logger, *args, **kwargs):
+        with cls._mutex:
+            if cls._instance is None:
+                cls._instance = object.__new__(cls, *args, **kwargs)
+        return cls._instance
+
+    @classmethod
+    def init(cls, logger=None):
+        cls._instance = cls(logger)
+
+    @classmethod
+    def instance(cls):
+        return cls._instance
+
+    def __init__(self, logger):
+        self.logger = logger
+        # event ids only have to be resumable within one process
+        self.epoch = uuid.uuid4().hex[:8]
+        self.sequence = itertools.count(1)
+        self.history = deque(maxlen=settings.WATCH_HISTORY_SIZE)
+        self.subscribers = set()
+        self._publish_mutex = threading.Lock()
+
+    def publish(self, storage_type: str, instance_id: str, event_type: str):
+        with self._publish_mutex:
+            sequence = next(self.sequence)
+            event = {
+                'id': f'{self.epoch}-{sequence}',
+                'type': storage_type,
+                'instance': instance_id,
+                'event': event_type,
+                'time': format_timestamp(time.time()),
+            }
+            self.history.append((sequence, event))
+            subscribers = [subscriber for subscriber in self.subscribers if subscriber.matches(event)]
+
+        for subscriber in subscribers:
+            try:
+                subscriber.loop.call_soon_threadsafe(subscriber.deliver, event)
+            except RuntimeError:
+                # the subscriber's loop is already closed
+                self.subscribers.discard(subscriber)
+
+    def replay(self, subscriber: WatchSubscriber, last_event_id: str = None):
+        if not last_event_id:
+            return [], True
+
+        try:
+            epoch, sequence = last_event_id.rsplit('-', 1)
+            sequence = int(sequence)
+        except ValueError:
+            return [], False
+
+        # events the client missed are gone, it has to resync from the list endpoint
+        oldest = self.history[0][0] if self.history else None
+        if epoch != self.epoch or (oldest is not None and sequence < oldest - 1):
+            return [], False
+
+        backlog = [event for seq, event in self.history if seq > sequence and subscriber.matches(event)]
+        return backlog, True
+
+    def subscribe(self, types=None, ids=None, events=None, last_event_id: str = None):
+        subscriber = WatchSubscriber(asyncio.get_running_loop(), types, ids, events)
+        # replay and registration under one lock, so no event falls in between
+        with self._publish_mutex:
+            backlog, complete = self.replay(subscriber, last_event_id)
+            self.subscribers.add(subscriber)
+        return subscriber, backlog, complete
+
+    def unsubscribe(self, subscriber: WatchSubscriber):
+        with self._publish_mutex:
+            self.subscribers.discard(subscriber)
+
+    async def watch(self, types=None, ids=None, events=None, last_event_id: str = None):
+        """Yields events, control messages, and None whenever a heartbeat is due."""
+        subscriber, backlog, complete = self.subscribe(types, ids, events, last_event_id)
+        try:
+            if not complete:
+                yield {'event': WatchEvent.RESET}
+            for event in backlog:
+                yield event
+
+            while True:
+                try:
+                    event = await asyncio.wait_for(subscriber.queue.get(), settings.WATCH_HEARTBEAT_INTERVAL)
+                except asyncio.TimeoutError:
+                    yield None
+                    continue
+
+                yield event
+                if subscriber.overflowed and subscriber.queue.empty():
+                    yield {'event': WatchEvent.OVERFLOW}
+                    return
+        finally:
+            self.unsubscribe(subscriber)
+
+    def report(self):
+        return {
+            'subscribers': len(self.subscribers),
+            'history': len(self.history),
+        }
@@ -1,6 +1,7 @@
 # coding=utf-8
 
-from dataclasses import dataclass, asdict
+from dataclasses import dataclass, asdict, field
+from typing import List
 
 
 @dataclass
@@ -9,6 +10,8 @@ class RedisConnection:
     host: str = ''
     port: int = 0
     password: str = ''
+    # host:port of every cluster node, masters first; empty for a standalone instance
+    nodes: List[str] = field(default_factory=list)
 
     def to_json(self):
         return asdict(self)
@@ -21,6 +24,13 @@ class MySQLConnection:
     port: int = 0
     username: str = ''
     password: str = ''
+    # host:port endpoints, writes go to the primary and reads may go to any replica
+    writer: str = ''
+    readers: List[str] = field(default_factory=list)
+
+    def __post_init__(self):
+        if not self.writer:
+            self.writer = f'{self.host}:{self.port}'
 
     def to_json(self):
         return asdict(self)
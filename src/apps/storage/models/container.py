@@ -1,6 +1,8 @@
 # coding=utf-8
 
 import enum
+import calendar
+import datetime
 from typing import Dict
 
 
@@ -9,6 +11,22 @@ class ContainerStatus(enum.Enum):
     RUNNING = 'running'
     CREATED = 'created'
     EXITED = 'exited'
+    PAUSED = 'paused'
+    RESTARTING = 'restarting'
+    REMOVING = 'removing'
+    DEAD = 'dead'
+    HIBERNATED = 'hibernated'
+
+
+def format_timestamp(value):
+    if value is None:
+        return None
+    return datetime.datetime.fromtimestamp(value).isoformat(timespec='seconds')
+
+
+def parse_docker_time(value: str):
+    # docker reports UTC with nanoseconds, e.g. 2021-10-01T08:00:00.123456789Z
+    return calendar.timegm(datetime.datetime.strptime(value[:19], '%Y-%m-%dT%H:%M:%S').timetuple())
 
 
 class ContainerInstance:
@@ -18,6 +36,18 @@ class ContainerInstance:
         self.name = kwargs.get('name')
         self.ports = kwargs.get('ports')
         self.status = kwargs.get('status')
+        self.hibernated_at = kwargs.get('hibernated_at')
+        self.created_at = kwargs.get('created_at')
+        self.expire_at = kwargs.get('expire_at')
+        self.health = kwargs.get('health')
+        self.group = kwargs.get('group')
+
+    def has_host_port(self, port: int):
+        for value in self.ports.values():
+            for item in value or []:
+                if str(item['HostPort']) == str(port):
+                    return True
+        return False
 
     def to_json(self):
         ports = {}
@@ -34,4 +64,9 @@ class ContainerInstance:
             'name': self.name,
             'ports': ports,
             'status': self.status.value,
+            'hibernated_at': format_timestamp(self.hibernated_at),
+            'created_at': format_timestamp(self.created_at),
+            'expire_at': format_timestamp(self.expire_at),
+            'health': self.health,
+            'group': self.group,
         }
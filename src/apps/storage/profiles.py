@@ -0,0 +1,196 @@
+# coding=utf-8
+
+import enum
+
+from framework.conf import settings
+from .managers.volume import StorageTier
+
+
+MB = 1024 * 1024
+
+
+class WorkloadProfile(str, enum.Enum):
+    CACHE = 'cache'
+    OLTP_SMALL = 'oltp-small'
+    OLTP_LARGE = 'oltp-large'
+    BULK_LOAD = 'bulk-load'
+    DURABLE = 'durable'
+
+
+# maxmemory_ratio leaves headroom in the container for fork copy-on-write
+# during BGSAVE and AOF rewrites, which is why the persistent profiles keep more
+REDIS_PROFILES = {
+    None: dict(
+        save=['900 1', '300 10', '60 10000'], appendonly='yes', appendfsync='everysec',
+        no_appendfsync_on_rewrite='no', aof_rewrite_min_size='64mb', hz=10,
+        maxmemory_ratio=0.75, maxmemory_policy='noeviction', ziplist_entries=512, ziplist_value=64),
+    WorkloadProfile.CACHE: dict(
+        save=[], appendonly='no', appendfsync='no',
+        no_appendfsync_on_rewrite='yes', aof_rewrite_min_size='64mb', hz=20,
+        maxmemory_ratio=0.85, maxmemory_policy='allkeys-lru', ziplist_entries=512, ziplist_value=64),
+    WorkloadProfile.OLTP_SMALL: dict(
+        save=['900 1', '300 10'], appendonly='yes', appendfsync='everysec',
+        no_appendfsync_on_rewrite='no', aof_rewrite_min_size='64mb', hz=10,
+        maxmemory_ratio=0.7, maxmemory_policy='noeviction', ziplist_entries=512, ziplist_value=64),
+    WorkloadProfile.OLTP_LARGE: dict(
+        save=['900 1'], appendonly='yes', appendfsync='everysec',
+        no_appendfsync_on_rewrite='yes', aof_rewrite_min_size='512mb', hz=20,
+        maxmemory_ratio=0.7, maxmemory_policy='noeviction', ziplist_entries=128, ziplist_value=64),
+    WorkloadProfile.BULK_LOAD: dict(
+        save=[], appendonly='yes', appendfsync='no',
+        no_appendfsync_on_rewrite='yes', aof_rewrite_min_size='1gb', hz=10,
+        maxmemory_ratio=0.6, maxmemory_policy='noeviction', ziplist_entries=512, ziplist_value=64),
+    WorkloadProfile.DURABLE: dict(
+        save=['900 1', '300 10', '60 10000'], appendonly='yes', appendfsync='always',
+        no_appendfsync_on_rewrite='no', aof_rewrite_min_size='64mb', hz=10,
+        maxmemory_ratio=0.5, maxmemory_policy='noeviction', ziplist_entries=512, ziplist_value=64),
+}
+
+# innodb_flush_log_at_trx_commit: 1 flushes the redo log on every commit, 2 writes
+# on commit but flushes once a second, 0 leaves both to the background thread
+MYSQL_PROFILES = {
+    WorkloadProfile.CACHE: dict(
+        buffer_pool_ratio=0.6, flush_log_at_trx_commit=2, sync_binlog=0,
+        doublewrite='ON', io_capacity=200, flush_method=None, log_buffer_mb=16),
+    WorkloadProfile.OLTP_SMALL: dict(
+        buffer_pool_ratio=0.5, flush_log_at_trx_commit=1, sync_binlog=1,
+        doublewrite='ON', io_capacity=200, flush_method=None, log_buffer_mb=16),
+    WorkloadProfile.OLTP_LARGE: dict(
+        buffer_pool_ratio=0.7, flush_log_at_trx_commit=1, sync_binlog=1,
+        doublewrite='ON', io_capacity=1000, flush_method='O_DIRECT', log_buffer_mb=32),
+    WorkloadProfile.BULK_LOAD: dict(
+        buffer_pool_ratio=0.6, flush_log_at_trx_commit=0, sync_binlog=0,
+        doublewrite='OFF', io_capacity=2000, flush_method='O_DIRECT', log_buffer_mb=64),
+    WorkloadProfile.DURABLE: dict(
+        buffer_pool_ratio=0.5, flush_log_at_trx_commit=1, sync_binlog=1,
+        doublewrite='ON', io_capacity=200, flush_method='O_DIRECT', log_buffer_mb=16),
+}
+
+
+# conservative throughput floors (ops/sec) of the built-in benchmark, a single client
+# on the service host; per-write fsync dominates what the durable profiles can do
+BENCHMARK_BASELINES = {
+    'redis': {
+        None: {'get': 50000, 'set': 30000},
+        WorkloadProfile.CACHE: {'get': 80000, 'set': 80000},
+        WorkloadProfile.OLTP_SMALL: {'get': 50000, 'set': 30000},
+        WorkloadProfile.OLTP_LARGE: {'get': 50000, 'set': 30000},
+        WorkloadProfile.BULK_LOAD: {'get': 50000, 'set': 60000},
+        WorkloadProfile.DURABLE: {'get': 50000, 'set': 2000},
+    },
+    'mysql': {
+        None: {'select': 2000, 'insert': 300},
+        WorkloadProfile.CACHE: {'select': 3000, 'insert': 1500},
+        WorkloadProfile.OLTP_SMALL: {'select': 2000, 'insert': 300},
+        WorkloadProfile.OLTP_LARGE: {'select': 3000, 'insert': 300},
+        WorkloadProfile.BULK_LOAD: {'select': 2000, 'insert': 2000},
+        WorkloadProfile.DURABLE: {'select': 2000, 'insert': 200},
+    },
+}
+
+
+def get_benchmark_baseline(storage_type: str, profile: dict):
+    baselines = BENCHMARK_BASELINES[storage_type]
+    baseline = dict(baselines.get(profile.get('profile')) or baselines[None])
+    # writes to tmpfs are never fsync bound
+    if profile.get('tier') == StorageTier.TMPFS:
+        cache = baselines[WorkloadProfile.CACHE]
+        for operation in ('set', 'insert'):
+            if operation in baseline:
+                baseline[operation] = max(baseline[operation], cache[operation])
+    return baseline
+
+
+def get_tmpfs_size(config: dict):
+    if config.get('tier') != StorageTier.TMPFS:
+        return 0
+    memory = config.get('memory') or settings.PROFILE_DEFAULT_MEMORY
+    return int(memory * settings.STORAGE_TMPFS_RATIO)
+
+
+def get_budget(config: dict):
+    # tmpfs pages are charged to the container, so they come out of the same budget
+    memory = (config.get('memory') or settings.PROFILE_DEFAULT_MEMORY) - get_tmpfs_size(config)
+    cpus = config.get('cpus') or settings.PROFILE_DEFAULT_CPUS
+    return memory, cpus
+
+
+def tune_redis(config: dict):
+    profile = REDIS_PROFILES[config.get('profile')]
+    memory, cpus = get_budget(config)
+
+    # an explicit maxmemory wins, otherwise size it from the container budget
+    maxmemory = config.get('maxmemory') or 0
+    if not maxmemory and (config.get('memory') or config.get('profile') == WorkloadProfile.CACHE):
+        maxmemory = int(memory * profile['maxmemory_ratio'])
+
+    # threaded I/O only pays off with spare cores, keep one for the main thread
+    io_threads = min(int(cpus) - 1, 7) if cpus >= 4 else 1
+
+    # nothing written to tmpfs survives a restart, persisting there only costs memory
+    tmpfs = config.get('tier') == StorageTier.TMPFS
+
+    return {
+        'dir': '/data/' if tmpfs else '/opt/',
+        'save': [] if tmpfs else profile['save'],
+        'appendonly': 'no' if tmpfs else profile['appendonly'],
+        'appendfsync': config.get('appendfsync') or profile['appendfsync'],
+        'no_appendfsync_on_rewrite': profile['no_appendfsync_on_rewrite'],
+        'auto_aof_rewrite_min_size': profile['aof_rewrite_min_size'],
+        'hz': profile['hz'],
+        'maxmemory': maxmemory,
+        'maxmemory_policy': profile['maxmemory_policy'],
+        'ziplist_entries': profile['ziplist_entries'],
+        'ziplist_value': profile['ziplist_value'],
+        'io_threads': io_threads,
+        'latency_monitor_threshold': settings.INSIGHTS_LATENCY_THRESHOLD,
+    }
+
+
+def tune_mysql(config: dict):
+    tuning = {}
+    if config.get('profile'):
+        tuning.update(tune_mysql_profile(config))
+
+    if config.get('tier') == StorageTier.TMPFS:
+        # flushing to memory buys no durability, and tmpfs rejects O_DIRECT
+        tuning.update({
+            'innodb_flush_log_at_trx_commit': 2,
+            'sync_binlog': 0,
+            'innodb_doublewrite': 'OFF',
+        })
+        tuning.pop('innodb_flush_method', None)
+    return tuning
+
+
+def tune_mysql_profile(config: dict):
+    profile = MYSQL_PROFILES[config['profile']]
+    memory, cpus = get_budget(config)
+    memory_mb = memory // MB
+
+    buffer_pool_mb = max(32, int(memory_mb * profile['buffer_pool_ratio']))
+    # InnoDB rejects a redo capacity below 8M
+    redo_mb = max(8, min(buffer_pool_mb // 4, 16 * 1024))
+    if config['profile'] == WorkloadProfile.BULK_LOAD:
+        redo_mb = max(8, min(buffer_pool_mb // 2, 16 * 1024))
+    # roughly 4M of per-session buffers for every connection outside the pool
+    max_connections = max(20, min((memory_mb - buffer_pool_mb) // 4, 2000))
+    io_threads = max(4, min(int(cpus), 64))
+
+    tuning = {
+        'innodb_buffer_pool_size': f'{buffer_pool_mb}M',
+        'innodb_buffer_pool_instances': max(1, min(8, buffer_pool_mb // 1024)),
+        'innodb_redo_log_capacity': f'{redo_mb}M',
+        'innodb_log_buffer_size': f"{profile['log_buffer_mb']}M",
+        'innodb_flush_log_at_trx_commit': profile['flush_log_at_trx_commit'],
+        'sync_binlog': profile['sync_binlog'],
+        'innodb_doublewrite': profile['doublewrite'],
+        'innodb_io_capacity': profile['io_capacity'],
+        'innodb_io_capacity_max': profile['io_capacity'] * 2,
+        'innodb_read_io_threads': io_threads,
+        'innodb_write_io_threads': io_threads,
+        'max_connections': max_connections,
+    }
+    if profile['flush_method']:
+        tuning['innodb_flush_method'] = profile['flush_method']
+    return tuning
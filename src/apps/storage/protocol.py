@@ -0,0 +1,312 @@
+# coding=utf-8
+
+import os
+import struct
+
+from pymysql import _auth as mysql_auth
+
+
+##############################
+# Redis RESP
+##############################
+class ProtocolError(Exception):
+    pass
+
+
+async def read_resp_line(reader):
+    line = await reader.readline()
+    if not line:
+        return None
+    if not line.endswith(b'\r\n'):
+        raise ProtocolError('truncated line')
+    return line[:-2]
+
+
+async def read_resp_command(reader):
+    line = await read_resp_line(reader)
+    if line is None:
+        return None
+
+    # inline commands, e.g. typed through telnet
+    if not line.startswith(b'*'):
+        return line.split()
+
+    command = []
+    for _ in range(int(line[1:])):
+        header = await read_resp_line(reader)
+        if header is None or not header.startswith(b'$'):
+            raise ProtocolError('invalid bulk string')
+        data = await reader.readexactly(int(header[1:]) + 2)
+        command.append(data[:-2])
+    return command
+
+
+async def read_resp_reply(reader):
+    line = await read_resp_line(reader)
+    if line is None:
+        raise ProtocolError('connection closed')
+
+    prefix, payload = line[:1], line[1:]
+    if prefix in (b'+', b'-', b':'):
+        return line
+    if prefix == b'$':
+        length = int(payload)
+        if length >= 0:
+            await reader.readexactly(length + 2)
+        return line
+    if prefix == b'*':
+        for _ in range(max(int(payload), 0)):
+            await read_resp_reply(reader)
+        return line
+    raise ProtocolError(f'unexpected reply {line[:32]!r}')
+
+
+def encode_resp_command(*args):
+    chunks = [b'*%d\r\n' % len(args)]
+    for arg in args:
+        if not isinstance(arg, bytes):
+            arg = str(arg).encode()
+        chunks.append(b'$%d\r\n%s\r\n' % (len(arg), arg))
+    return b''.join(chunks)
+
+
+##############################
+# MySQL client/server protocol
+##############################
+CLIENT_LONG_PASSWORD = 1
+CLIENT_FOUND_ROWS = 1 << 1
+CLIENT_LONG_FLAG = 1 << 2
+CLIENT_CONNECT_WITH_DB = 1 << 3
+CLIENT_LOCAL_FILES = 1 << 7
+CLIENT_PROTOCOL_41 = 1 << 9
+CLIENT_INTERACTIVE = 1 << 10
+CLIENT_SSL = 1 << 11
+CLIENT_TRANSACTIONS = 1 << 13
+CLIENT_SECURE_CONNECTION = 1 << 15
+CLIENT_MULTI_STATEMENTS = 1 << 16
+CLIENT_MULTI_RESULTS = 1 << 17
+CLIENT_PS_MULTI_RESULTS = 1 << 18
+CLIENT_PLUGIN_AUTH = 1 << 19
+CLIENT_CONNECT_ATTRS = 1 << 20
+CLIENT_PLUGIN_AUTH_LENENC_CLIENT_DATA = 1 << 21
+CLIENT_SESSION_TRACK = 1 << 23
+CLIENT_DEPRECATE_EOF = 1 << 24
+
+# capabilities every supported server offers; no TLS and no compression, so the
+# session can be relayed byte for byte once authentication is done
+PROXY_CAPABILITIES = (
+    CLIENT_LONG_PASSWORD | CLIENT_FOUND_ROWS | CLIENT_LONG_FLAG | CLIENT_CONNECT_WITH_DB |
+    CLIENT_LOCAL_FILES | CLIENT_PROTOCOL_41 | CLIENT_INTERACTIVE | CLIENT_TRANSACTIONS |
+    CLIENT_SECURE_CONNECTION | CLIENT_MULTI_STATEMENTS | CLIENT_MULTI_RESULTS |
+    CLIENT_PS_MULTI_RESULTS | CLIENT_PLUGIN_AUTH | CLIENT_CONNECT_ATTRS |
+    CLIENT_PLUGIN_AUTH_LENENC_CLIENT_DATA | CLIENT_SESSION_TRACK | CLIENT_DEPRECATE_EOF
+)
+
+# what the health probe asks for, just enough to log in and quit
+PROBE_CAPABILITIES = (
+    CLIENT_LONG_PASSWORD | CLIENT_PROTOCOL_41 | CLIENT_TRANSACTIONS | CLIENT_SECURE_CONNECTION |
+    CLIENT_PLUGIN_AUTH | CLIENT_PLUGIN_AUTH_LENENC_CLIENT_DATA
+)
+
+NATIVE_PASSWORD = b'mysql_native_password'
+CACHING_SHA2_PASSWORD = b'caching_sha2_password'
+
+
+async def read_mysql_packet(reader):
+    header = await reader.readexactly(4)
+    length = header[0] | header[1] << 8 | header[2] << 16
+    payload = await reader.readexactly(length)
+    return header[3], payload
+
+
+def encode_mysql_packet(sequence_id, payload):
+    return struct.pack('<I', len(payload))[:3] + bytes([sequence_id & 0xff]) + payload
+
+
+def read_lenenc_int(data, offset):
+    first = data[offset]
+    if first < 0xfb:
+        return first, offset + 1
+    if first == 0xfc:
+        return struct.unpack_from('<H', data, offset + 1)[0], offset + 3
+    if first == 0xfd:
+        return int.from_bytes(data[offset + 1:offset + 4], 'little'), offset + 4
+    return struct.unpack_from('<Q', data, offset + 1)[0], offset + 9
+
+
+def encode_lenenc_int(value):
+    if value < 0xfb:
+        return bytes([value])
+    if value < 1 << 16:
+        return b'\xfc' + struct.pack('<H', value)
+    if value < 1 << 24:
+        return b'\xfd' + value.to_bytes(3, 'little')
+    return b'\xfe' + struct.pack('<Q', value)
+
+
+def read_null_string(data, offset):
+    end = data.index(b'\x00', offset)
+    return data[offset:end], end + 1
+
+
+def generate_scramble(length=20):
+    # printable, NUL free bytes like the server itself produces
+    return bytes(byte % 94 + 33 for byte in os.urandom(length))
+
+
+def encode_handshake(connection_id, scramble, server_version=b'8.0.0-proxy'):
+    capabilities = PROXY_CAPABILITIES
+    return b''.join([
+        b'\x0a',
+        server_version + b'\x00',
+        struct.pack('<I', connection_id),
+        scramble[:8] + b'\x00',
+        struct.pack('<H', capabilities & 0xffff),
+        b'\xff',
+        struct.pack('<H', 0x0002),
+        struct.pack('<H', capabilities >> 16),
+        bytes([len(scramble) + 1]),
+        b'\x00' * 10,
+        scramble[8:] + b'\x00',
+        CACHING_SHA2_PASSWORD + b'\x00',
+    ])
+
+
+def parse_handshake(payload):
+    offset = 1
+    server_version, offset = read_null_string(payload, offset)
+    offset += 4
+    scramble = payload[offset:offset + 8]
+    offset += 9
+    capabilities = struct.unpack_from('<H', payload, offset)[0]
+    offset += 2
+    charset = payload[offset]
+    offset += 3
+    capabilities |= struct.unpack_from('<H', payload, offset)[0] << 16
+    offset += 2
+    scramble_length = payload[offset]
+    offset += 11
+    part_length = max(13, scramble_length - 8)
+    scramble += payload[offset:offset + part_length].rstrip(b'\x00')
+    offset += part_length
+    plugin = b''
+    if capabilities & CLIENT_PLUGIN_AUTH and offset < len(payload):
+        plugin, offset = read_null_string(payload + b'\x00', offset)
+    return dict(server_version=server_version, capabilities=capabilities,
+                charset=charset, scramble=scramble, plugin=plugin)
+
+
+def parse_handshake_response(payload):
+    capabilities, max_packet_size, charset = struct.unpack_from('<IIB', payload, 0)
+    offset = 32
+    username, offset = read_null_string(payload, offset)
+    if capabilities & CLIENT_PLUGIN_AUTH_LENENC_CLIENT_DATA:
+        length, offset = read_lenenc_int(payload, offset)
+    elif capabilities & CLIENT_SECURE_CONNECTION:
+        length, offset = payload[offset], offset + 1
+    else:
+        length = payload.index(b'\x00', offset) - offset
+    auth_response = payload[offset:offset + length]
+    offset += length
+    if not capabilities & (CLIENT_PLUGIN_AUTH_LENENC_CLIENT_DATA | CLIENT_SECURE_CONNECTION):
+        offset += 1
+
+    database = b''
+    if capabilities & CLIENT_CONNECT_WITH_DB and offset < len(payload):
+        database, offset = read_null_string(payload, offset)
+
+    plugin = b''
+    if capabilities & CLIENT_PLUGIN_AUTH and offset < len(payload):
+        plugin, offset = read_null_string(payload, offset)
+
+    attributes = b''
+    if capabilities & CLIENT_CONNECT_ATTRS and offset < len(payload):
+        length, start = read_lenenc_int(payload, offset)
+        attributes = payload[offset:start + length]
+
+    return dict(capabilities=capabilities, max_packet_size=max_packet_size, charset=charset,
+                username=username, auth_response=auth_response, database=database,
+                plugin=plugin, attributes=attributes)
+
+
+def encode_handshake_response(capabilities, max_packet_size, charset, username,
+                              auth_response, database=b'', plugin=b'', attributes=b''):
+    payload = [
+        struct.pack('<IIB', capabilities, max_packet_size, charset),
+        b'\x00' * 23,
+        username + b'\x00',
+    ]
+    if capabilities & CLIENT_PLUGIN_AUTH_LENENC_CLIENT_DATA:
+        payload.append(encode_lenenc_int(len(auth_response)) + auth_response)
+    else:
+        payload.append(bytes([len(auth_response)]) + auth_response)
+    if capabilities & CLIENT_CONNECT_WITH_DB:
+        payload.append(database + b'\x00')
+    if capabilities & CLIENT_PLUGIN_AUTH:
+        payload.append(plugin + b'\x00')
+    if capabilities & CLIENT_CONNECT_ATTRS:
+        payload.append(attributes or b'\x00')
+    return b''.join(payload)
+
+
+def scramble_password(plugin, scramble, password):
+    if plugin == NATIVE_PASSWORD:
+        return mysql_auth.scramble_native_password(password, scramble)
+    return mysql_auth.scramble_caching_sha2(password, scramble)
+
+
+async def authenticate(reader, writer, username, password, capabilities, max_packet_size=1 << 24,
+                       charset=None, database=b'', attributes=b''):
+    """Logs in to the server whose greeting comes next, returns its final OK or error packet."""
+    _, payload = await read_mysql_packet(reader)
+    if payload[:1] == b'\xff':
+        return payload
+    handshake = parse_handshake(payload)
+
+    plugin = handshake['plugin'] or NATIVE_PASSWORD
+    scramble = handshake['scramble'][:20]
+    capabilities &= handshake['capabilities']
+    charset = handshake['charset'] if charset is None else charset
+    writer.write(encode_mysql_packet(1, encode_handshake_response(
+        capabilities, max_packet_size, charset, username,
+        scramble_password(plugin, scramble, password), database, plugin, attributes)))
+
+    while True:
+        sequence_id, payload = await read_mysql_packet(reader)
+        marker = payload[:1]
+        if marker in (b'\x00', b'\xff'):
+            return payload
+
+        if marker == b'\xfe':
+            # auth switch request
+            plugin, offset = read_null_string(payload, 1)
+            scramble = payload[offset:].rstrip(b'\x00')[:20]
+            auth_data = scramble_password(plugin, scramble, password)
+        elif payload == b'\x01\x03':
+            # caching_sha2_password fast path succeeded, OK packet follows
+            continue
+        elif payload == b'\x01\x04':
+            # full authentication without TLS, ask for the server public key
+            auth_data = b'\x02'
+        elif marker == b'\x01':
+            try:
+                auth_data = mysql_auth.sha2_rsa_encrypt(password, scramble, payload[1:])
+            except RuntimeError:
+                return encode_error(1045, 'cannot perform full authentication')
+        else:
+            raise ProtocolError('unexpected authentication packet')
+
+        writer.write(encode_mysql_packet(sequence_id + 1, auth_data))
+
+
+def parse_error(payload):
+    # errors sent before the handshake carry no sql state marker
+    code = struct.unpack_from('<H', payload, 1)[0]
+    offset = 9 if payload[3:4] == b'#' else 3
+    return code, payload[offset:].decode(errors='replace')
+
+
+def encode_error(code, message, state=b'HY000'):
+    if isinstance(message, str):
+        message = message.encode()
+    return b'\xff' + struct.pack('<H', code) + b'#' + state + message
@@ -0,0 +1,170 @@
+# coding=utf-8
+
+import io
+import os
+import stat
+import contextlib
+import zlib
+import shutil
+import asyncio
+import tarfile
+
+from framework.conf import settings
+from framework.exception import ServiceException
+
+
+def iter_tar_members(path: str):
+    for dirpath, dirnames, filenames in os.walk(path):
+        dirnames.sort()
+        for name in dirnames + sorted(filenames):
+            full_path = os.path.join(dirpath, name)
+            yield full_path, os.path.relpath(full_path, path)
+
+
+def iter_snapshot(path: str, compression: str = 'none'):
+    # tar headers are built by hand so file bodies are read from the descriptor in
+    # large chunks without tarfile's intermediate buffering; this is not zero-copy,
+    # StreamingResponse only carries bytes, so every chunk passes through user space once
+    compressor = None
+    if compression == 'gzip':
+        compressor = zlib.compressobj(settings.SNAPSHOT_COMPRESS_LEVEL, zlib.DEFLATED, 31)
+
+    def emit(data):
+        if compressor is None:
+            return data
+        return compressor.compress(data)
+
+    for full_path, arcname in iter_tar_members(path):
+        st = os.lstat(full_path)
+        info = tarfile.TarInfo(arcname)
+        info.mode = stat.S_IMODE(st.st_mode)
+        info.mtime = int(st.st_mtime)
+        if stat.S_ISDIR(st.st_mode):
+            info.type = tarfile.DIRTYPE
+        elif stat.S_ISREG(st.st_mode):
+            info.type = tarfile.REGTYPE
+            info.size = st.st_size
+        else:
+            continue
+
+        chunk = emit(info.tobuf(format=tarfile.PAX_FORMAT))
+        if chunk:
+            yield chunk
+        if info.type != tarfile.REGTYPE:
+            continue
+
+        remaining = info.size
+        fd = os.open(full_path, os.O_RDONLY)
+        try:
+            while remaining > 0:
+                data = os.read(fd, min(settings.SNAPSHOT_CHUNK_SIZE, remaining))
+                if not data:
+                    raise ServiceException(f'快照文件读取失败: {arcname}')
+                remaining -= len(data)
+                chunk = emit(data)
+                if chunk:
+                    yield chunk
+        finally:
+            os.close(fd)
+
+        padding = -info.size % tarfile.BLOCKSIZE
+        if padding:
+            chunk = emit(b'\0' * padding)
+            if chunk:
+                yield chunk
+
+    chunk = emit(b'\0' * tarfile.BLOCKSIZE * 2)
+    if compressor is not None:
+        chunk += compressor.flush()
+    yield chunk
+
+
+class SnapshotReader(io.RawIOBase):
+
+    def __init__(self, loop, queue):
+        self.loop = loop
+        self.queue = queue
+        self.buffer = memoryview(b'')
+        self.eof = False
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while not self.buffer:
+            if self.eof:
+                return 0
+            # blocks the worker thread, never the event loop
+            chunk = asyncio.run_coroutine_threadsafe(self.queue.get(), self.loop).result()
+            if chunk is None:
+                self.eof = True
+                return 0
+            self.buffer = memoryview(chunk)
+
+        size = min(len(buffer), len(self.buffer))
+        buffer[:size] = self.buffer[:size]
+        self.buffer = self.buffer[size:]
+        return size
+
+
+def extract_snapshot(fileobj, path: str):
+    # bounded by the configured cap and by what the volume filesystem can still hold
+    limit = min(settings.SNAPSHOT_MAX_SIZE, shutil.disk_usage(path).free)
+    total = 0
+    try:
+        with tarfile.open(fileobj=fileobj, mode='r|*') as tar:
+            for member in tar:
+                name = os.path.normpath(member.name)
+                if os.path.isabs(name) or name == '..' or name.startswith('../'):
+                    raise ServiceException(f'快照文件路径非法: {member.name}')
+
+                target = os.path.join(path, name)
+                if member.isdir():
+                    os.makedirs(target, exist_ok=True)
+                    os.chmod(target, stat.S_IRWXU | stat.S_IRWXG | stat.S_IRWXO)
+                elif member.isfile():
+                    total += member.size
+                    if total > limit:
+                        raise ServiceException('快照文件超过大小限制')
+                    os.makedirs(os.path.dirname(target), exist_ok=True)
+                    with tar.extractfile(member) as src, open(target, 'wb') as dst:
+                        while True:
+                            data = src.read(settings.SNAPSHOT_CHUNK_SIZE)
+                            if not data:
+                                break
+                            dst.write(data)
+                    # the storage process runs under its own uid inside the container
+                    os.chmod(target, 0o666)
+    except (tarfile.TarError, zlib.error, EOFError) as e:
+        raise ServiceException(f'快照文件解析失败: {e}')
+
+
+async def receive_snapshot(stream, path: str):
+    loop = asyncio.get_running_loop()
+    queue = asyncio.Queue(maxsize=settings.SNAPSHOT_QUEUE_SIZE)
+    extract_task = loop.run_in_executor(None, extract_snapshot, SnapshotReader(loop, queue), path)
+
+    async def feed(chunk):
+        # stop feeding once the extractor gave up, otherwise a full queue would block forever
+        put_task = asyncio.ensure_future(queue.put(chunk))
+        await asyncio.wait([put_task, extract_task], return_when=asyncio.FIRST_COMPLETED)
+        if not put_task.done():
+            put_task.cancel()
+
+    received = 0
+    async for chunk in stream:
+        if extract_task.done():
+            break
+        received += len(chunk)
+        if received > settings.SNAPSHOT_MAX_SIZE:
+            # let the extractor stop on the truncated stream before giving up
+            await feed(None)
+            with contextlib.suppress(ServiceException):
+                await extract_task
+            raise ServiceException('快照文件超过大小限制')
+        if chunk:
+            await feed(chunk)
+
+    if not extract_task.done():
+        await feed(None)
+    await extract_task
@@ -3,3 +3,111 @@
 DOCKER_BASE_URL = 'unix:///var/run/docker.sock'
 DOCKER_VOLUME_ROOT = '/tmp/bk-interview'
 DOCKER_HOST_IP = '127.0.0.1'
+DOCKER_TIMEOUT = 60
+DOCKER_MAX_POOL_SIZE = 32
+DOCKER_RETRY_MIN_DELAY = 1
+DOCKER_RETRY_MAX_DELAY = 60
+
+VOLUME_RETENTION_POLICY = 'delete'
+VOLUME_ARCHIVE_DAYS = 7
+VOLUME_RECLAIM_INTERVAL = 600
+VOLUME_ORPHAN_GRACE = 3600
+
+STORAGE_CLIENT_TIMEOUT = 5
+
+HIBERNATION_ENABLED = True
+HIBERNATION_MODE = 'pause'
+HIBERNATION_IDLE_TIMEOUT = 60 * 60 * 2
+HIBERNATION_SAMPLE_INTERVAL = 60
+HIBERNATION_NET_THRESHOLD = 16 * 1024
+
+STATS_SAMPLE_INTERVAL = 10
+STATS_HISTORY_SIZE = 360
+
+SNAPSHOT_TIMEOUT = 300
+SNAPSHOT_CHUNK_SIZE = 1024 * 1024
+SNAPSHOT_QUEUE_SIZE = 16
+SNAPSHOT_COMPRESS_LEVEL = 1
+SNAPSHOT_MAX_SIZE = 8 * 1024 * 1024 * 1024
+
+STORAGE_FAST_DISK_ROOT = ''
+STORAGE_TMPFS_RATIO = 0.25
+
+PROFILE_DEFAULT_MEMORY = 512 * 1024 * 1024
+PROFILE_DEFAULT_CPUS = 1
+
+WATCH_HISTORY_SIZE = 10000
+WATCH_CLIENT_BUFFER = 256
+WATCH_HEARTBEAT_INTERVAL = 15
+
+IDEMPOTENCY_TTL = 60 * 60 * 24
+
+LIST_MAX_LIMIT = 1000
+
+SINGLEFLIGHT_TTL = 0.2
+
+CLONE_MAX_COUNT = 16
+CLONE_CONCURRENCY = 4
+
+QUOTA_MAX_INSTANCES = 0
+QUOTA_MAX_MEMORY = 0
+
+LEASE_MAX_TTL = 60 * 60 * 24 * 7
+LEASE_RETRY_DELAY = 60
+
+HEALTH_ENABLED = True
+HEALTH_INTERVAL = 10
+HEALTH_JITTER = 0.5
+HEALTH_PROBE_TIMEOUT = 2
+HEALTH_MAX_CONCURRENCY = 256
+HEALTH_FAILURE_THRESHOLD = 3
+HEALTH_START_GRACE = 120
+HEALTH_RESTART_POLICY = 'on-failure'
+HEALTH_RESTART_TIMEOUT = 10
+
+BENCHMARK_MAX_DURATION = 10
+BENCHMARK_MAX_OPS = 200000
+BENCHMARK_CONCURRENCY = 2
+BENCHMARK_PIPELINE = 16
+BENCHMARK_KEYSPACE = 10000
+BENCHMARK_VALUE_SIZE = 128
+BENCHMARK_WRITE_RATIO = 0.2
+BENCHMARK_REDIS_DB = 15
+
+INSIGHTS_ENABLED = True
+INSIGHTS_INTERVAL = 60
+INSIGHTS_MAX_CONNECTIONS = 8
+INSIGHTS_MAX_ENTRIES = 100
+INSIGHTS_MAX_SAMPLES = 32
+INSIGHTS_SLOWLOG_BATCH = 128
+INSIGHTS_DIGEST_BATCH = 500
+INSIGHTS_LATENCY_THRESHOLD = 100
+
+MEMORY_REPORT_SAMPLE_RATIO = 0.1
+MEMORY_REPORT_BATCH = 500
+MEMORY_REPORT_RATE = 5000
+MEMORY_REPORT_USAGE_SAMPLES = 5
+MEMORY_REPORT_MAX_PATTERNS = 1000
+MEMORY_REPORT_PROGRESS_INTERVAL = 1
+MEMORY_REPORT_CONCURRENCY = 2
+
+REDIS_CLUSTER_MAX_SHARDS = 16
+REDIS_CLUSTER_MAX_REPLICAS = 2
+REDIS_CLUSTER_NODE_TIMEOUT = 5000
+REDIS_CLUSTER_FORM_TIMEOUT = 30
+
+PROXY_ENABLED = False
+PROXY_HOST = '0.0.0.0'
+PROXY_REDIS_PORT = 6379
+PROXY_MYSQL_PORT = 3306
+PROXY_BUFFER_SIZE = 64 * 1024
+PROXY_ROUTE_TTL = 30
+
+MYSQL_TEMPLATE_TIMEOUT = 120
+MYSQL_MAX_REPLICAS = 5
+MYSQL_REPLICATION_USER = 'repl'
+MYSQL_REPLICA_PARALLEL_WORKERS = 4
+MYSQL_REPLICATION_TIMEOUT = 120
+
+# alias -> redis:// URL or connection keywords, e.g. {'session': 'redis://127.0.0.1:6379/0'}
+REDIS = {}
@@ -0,0 +1,60 @@
+# coding=utf-8
+
+import os
+
+
+CGROUP_ROOT = '/sys/fs/cgroup'
+
+
+def find_container_cgroup(container_id, pid=None):
+    candidates = []
+    if pid:
+        try:
+            with open(f'/proc/{pid}/cgroup', 'r') as fp:
+                for line in fp:
+                    # cgroup v2 unified hierarchy: "0::/system.slice/docker-<id>.scope"
+                    if line.startswith('0::'):
+                        candidates.append(CGROUP_ROOT + line[3:].strip())
+        except OSError:
+            pass
+
+    # systemd and cgroupfs drivers respectively
+    candidates.append(f'{CGROUP_ROOT}/system.slice/docker-{container_id}.scope')
+    candidates.append(f'{CGROUP_ROOT}/docker/{container_id}')
+    for path in candidates:
+        if os.path.exists(f'{path}/memory.current'):
+            return path
+    return None
+
+
+def read_cgroup_stats(path):
+    with open(f'{path}/memory.current', 'r') as fp:
+        memory = int(fp.read())
+
+    cpu_usec = 0
+    with open(f'{path}/cpu.stat', 'r') as fp:
+        for line in fp:
+            key, value = line.split()
+            if key == 'usage_usec':
+                cpu_usec = int(value)
+                break
+
+    io = {'rbytes': 0, 'wbytes': 0, 'rios': 0, 'wios': 0}
+    try:
+        with open(f'{path}/io.stat', 'r') as fp:
+            for line in fp:
+                for field in line.split()[1:]:
+                    key, _, value = field.partition('=')
+                    if key in io:
+                        io[key] += int(value)
+    except FileNotFoundError:
+        pass
+
+    return {
+        'memory': memory,
+        'cpu_usec': cpu_usec,
+        'io_read_bytes': io['rbytes'],
+        'io_write_bytes': io['wbytes'],
+        'io_read_ops': io['rios'],
+        'io_write_ops': io['wios'],
+    }
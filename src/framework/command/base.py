@@ -42,7 +42,7 @@ class Manager:
 
         subparser = self.parser.add_subparsers(dest='cmd')
 
-        cmd_module_names = ['fastapi', 'clean']
+        cmd_module_names = ['fastapi', 'clean', 'session']
         for cmd in cmd_module_names:
             cmd_module = import_module(f'framework.command.{cmd}')
             cmd_class = getattr(cmd_module, 'Command', None)
@@ -0,0 +1,91 @@
+# coding=utf-8
+
+from framework.command.base import BaseCommand
+
+
+class Command(BaseCommand):
+
+    def register(self, subparser):
+        parser = subparser.add_parser('session', help='check the redis session store against a redis server')
+        parser.add_argument('--url',
+                            type=str, dest='url', default='redis://127.0.0.1:6379/15',
+                            help='specify the redis server, its keys under the session prefix are written')
+        parser.add_argument('--lazy',
+                            action='store_true', dest='lazy', default=False,
+                            help='check with SESSION_LAZY_LOAD enabled')
+
+    def invoke(self, args):
+        import sys
+        import types
+        import asyncio
+        from importlib import import_module
+        import loguru
+        from attrdict import AttrDict
+        from framework.conf import settings
+        from framework.fastapi.middlewares import RedisSessionMiddleware, get_session
+
+        default_config = import_module('framework.fastapi.config')
+        config = AttrDict(dict(
+            (setting, getattr(default_config, setting)) for setting in dir(default_config) if setting.isupper()))
+        config.SESSION_LAZY_LOAD = args.lazy
+        # every request below must reach redis
+        config.SESSION_LOCAL_TTL = 0
+        settings.REDIS = dict(getattr(settings, 'REDIS', None) or {}, **{config.SESSION_REDIS_ALIAS: args.url})
+
+        async def app(scope, receive, send):
+            # the handler of a request: a plain synchronous session access, like any starlette handler
+            request = types.SimpleNamespace(scope=scope)
+            if args.lazy:
+                await get_session(request)
+            session = scope['session']
+            action = scope['path'].strip('/')
+            if action == 'set':
+                session['user'] = 'bk'
+            elif action == 'clear':
+                session.clear()
+            body = str(session.get('user')).encode()
+            await send({'type': 'http.response.start', 'status': 200, 'headers': []})
+            await send({'type': 'http.response.body', 'body': body})
+
+        middleware = RedisSessionMiddleware(app, config=config, logger=loguru.logger)
+
+        async def request(path: str, cookie: str = None):
+            headers = [(b'cookie', f'{config.SESSION_COOKIE_NAME}={cookie}'.encode())] if cookie else []
+            scope = {'type': 'http', 'method': 'GET', 'path': path, 'headers': headers}
+            messages = []
+
+            async def receive():
+                return {'type': 'http.request', 'body': b''}
+
+            async def send(message):
+                messages.append(message)
+
+            await middleware(scope, receive, send)
+            set_cookie = None
+            for name, value in messages[0]['headers']:
+                if name == b'set-cookie':
+                    set_cookie = value.decode().split(';', 1)[0].split('=', 1)[1]
+            return messages[1]['body'].decode(), set_cookie
+
+        async def check():
+            redis = middleware.redis_mgr.get(config.SESSION_REDIS_ALIAS)
+            try:
+                body, session_id = await request('/set')
+                assert body == 'bk' and session_id, 'a new session is written and its cookie is set'
+                assert await redis.ttl(f'{config.SESSION_KEY_PREFIX}{session_id}') > 0, 'the session key expires'
+
+                body, _ = await request('/get', session_id)
+                assert body == 'bk', 'the session is read back from redis'
+
+                body, cleared = await request('/clear', session_id)
+                assert body == 'None' and cleared == 'None', 'a cleared session drops its cookie'
+                assert not await redis.exists(f'{config.SESSION_KEY_PREFIX}{session_id}'), 'and its key'
+            finally:
+                await middleware.redis_mgr.close()
+
+        try:
+            asyncio.run(check())
+        except AssertionError as e:
+            print(f'session check fails: {e}')
+            sys.exit(1)
+        print('session check passes')
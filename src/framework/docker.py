@@ -0,0 +1,135 @@
+# coding=utf-8
+
+import time
+import threading
+
+import docker
+import requests
+
+from framework.conf import settings
+from framework.exception import ServiceException
+
+
+class DockerManager:
+
+    _mutex = threading.Lock()
+    _instance = None
+
+    def __new__(cls, logger, *args, **kwargs):
+        with cls._mutex:
+            if cls._instance is None:
+                cls._instance = object.__new__(cls, *args, **kwargs)
+        return cls._instance
+
+    @classmethod
+    def init(cls, logger=None):
+        cls._instance = cls(logger)
+
+    @classmethod
+    def instance(cls):
+        return cls._instance
+
+    def __init__(self, logger):
+        self.logger = logger
+        self.client = None
+        self.images = {}
+        self.listeners = []
+        self._client_mutex = threading.Lock()
+        self._retry_at = 0
+        self._retry_delay = 0
+        self._events_thread = None
+        # bumped on every (re)subscription, state derived from events is only
+        # trustworthy while the stream is live and within one generation
+        self.events_live = False
+        self.events_generation = 0
+
+        try:
+            self.connect()
+        except ServiceException:
+            pass
+
+        self._events_thread = threading.Thread(target=self.watch_events, name='docker-events', daemon=True)
+        self._events_thread.start()
+
+    def next_delay(self, delay):
+        return min(max(delay * 2, settings.DOCKER_RETRY_MIN_DELAY), settings.DOCKER_RETRY_MAX_DELAY)
+
+    def connect(self):
+        with self._client_mutex:
+            if self.client is not None:
+                return self.client
+
+            # back off between reconnect attempts while the daemon is down
+            if time.monotonic() < self._retry_at:
+                raise ServiceException('Docker服务连接失败')
+
+            try:
+                client = docker.DockerClient(
+                    base_url=settings.DOCKER_BASE_URL,
+                    timeout=settings.DOCKER_TIMEOUT,
+                    max_pool_size=settings.DOCKER_MAX_POOL_SIZE)
+                client.ping()
+            except (docker.errors.DockerException, requests.exceptions.RequestException):
+                self._retry_delay = self.next_delay(self._retry_delay)
+                self._retry_at = time.monotonic() + self._retry_delay
+                self.logger.error(f'Docker client connection fails, retry in {self._retry_delay}s.')
+                raise ServiceException('Docker服务连接失败')
+
+            self._retry_delay = 0
+            self._retry_at = 0
+            self.images.clear()
+            self.client = client
+            self.logger.info('Docker client connected.')
+            return client
+
+    def get_client(self):
+        return self.client or self.connect()
+
+    def get_image(self, tag: str):
+        image = self.images.get(tag)
+        if image is None:
+            image = self.get_client().images.get(tag)
+            self.images[tag] = image
+        return image
+
+    def subscribe(self, listener):
+        self.listeners.append(listener)
+
+    def dispatch(self, event: dict):
+        if event.get('Type') == 'image':
+            self.images.clear()
+
+        for listener in self.listeners:
+            try:
+                listener(event)
+            except Exception as e:
+                self.logger.error(f'Docker event listener fails: {e}')
+
+    def watch_events(self):
+        # a single event subscription shared by every manager, reconnecting with backoff
+        delay = 0
+        while True:
+            try:
+                client = self.get_client()
+                events = client.events(decode=True)
+                self.events_generation += 1
+                self.events_live = True
+                for event in events:
+                    delay = 0
+                    self.dispatch(event)
+            except ServiceException:
+                pass
+            except (docker.errors.DockerException, requests.exceptions.RequestException) as e:
+                self.logger.warning(f'Docker event stream interrupted: {e}')
+
+            # image handles may be stale once the stream was lost
+            self.events_live = False
+            self.images.clear()
+            delay = self.next_delay(delay)
+            time.sleep(delay)
+
+    def close(self):
+        with self._client_mutex:
+            if self.client is not None:
+                self.client.close()
+                self.client = None
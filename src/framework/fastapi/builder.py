@@ -10,7 +10,6 @@ import loguru
 from attrdict import AttrDict
 from starlette.requests import Request
 from starlette.exceptions import HTTPException
-from starlette.middleware.gzip import GZipMiddleware
 from starlette.middleware.cors import CORSMiddleware
 from starlette.middleware.sessions import SessionMiddleware
 from uvicorn.middleware.proxy_headers import ProxyHeadersMiddleware
@@ -24,7 +23,8 @@ from fastapi.staticfiles import StaticFiles
 from framework.conf import settings
 from framework.exception import ServiceException
 from framework.jinja2 import FILTERS, TESTS
-from framework.fastapi.middlewares import RequestMiddleware, RedisSessionMiddleware
+from framework.fastapi.middlewares import RequestMiddleware, RedisSessionMiddleware, StreamingGZipMiddleware, \
+    RateLimitMiddleware
 
 
 class FastAPIBuilder:
@@ -151,7 +151,7 @@ class FastAPIBuilder:
 
     def setup_middlewares(self):
         if self.config.ENABLE_GZIP:
-            self.app.add_middleware(GZipMiddleware, minimum_size=1000)
+            self.app.add_middleware(StreamingGZipMiddleware, minimum_size=1000)
 
         if self.config.ENABLE_CORS:
             self.app.add_middleware(CORSMiddleware,
@@ -168,6 +168,10 @@ class FastAPIBuilder:
                 self.app.add_middleware(SessionMiddleware, secret_key=self.config.SESSION_SECRET_KEY)
 
         self.app.add_middleware(ProxyHeadersMiddleware, trusted_hosts=['*'])
+
+        # added after ProxyHeadersMiddleware so it sees the actual peer, not a forwarded address
+        if self.config.ENABLE_RATE_LIMIT:
+            self.app.add_middleware(RateLimitMiddleware, config=self.config, logger=self.logger)
         self.app.add_middleware(RequestMiddleware, config=self.config)
 
     def setup_exception_handlers(self):
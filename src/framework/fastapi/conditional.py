@@ -0,0 +1,38 @@
+# coding=utf-8
+
+import email.utils
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+
+def make_cache_headers(etag: str, last_modified: float = None):
+    if not etag:
+        return None
+    # clients may keep the payload but have to revalidate it on every use
+    headers = {'ETag': etag, 'Cache-Control': 'no-cache'}
+    if last_modified:
+        headers['Last-Modified'] = email.utils.formatdate(last_modified, usegmt=True)
+    return headers
+
+
+def is_not_modified(request: Request, etag: str):
+    if not etag:
+        return False
+
+    header = request.headers.get('if-none-match')
+    if not header:
+        return False
+    if header.strip() == '*':
+        return True
+
+    # If-None-Match uses the weak comparison function
+    def opaque(tag):
+        tag = tag.strip()
+        return tag[2:] if tag.startswith('W/') else tag
+
+    return opaque(etag) in [opaque(tag) for tag in header.split(',')]
+
+
+def not_modified_response(etag: str, last_modified: float = None):
+    return Response(status_code=304, headers=make_cache_headers(etag, last_modified))
@@ -15,6 +15,7 @@ ACCESS_CONTROL_MAX_AGE = 60
 ENABLE_GZIP = False
 ENABLE_CORS = False
 ENABLE_SESSION = False
+ENABLE_RATE_LIMIT = False
 
 SESSION_SECRET_KEY = 'session_secret_key'
 SESSION_COOKIE_NAME = 'sessionid'
@@ -26,3 +27,15 @@ SESSION_COOKIE_DOMAIN = None
 
 SESSION_KEY_PREFIX = 'session:'
 SESSION_REDIS_ALIAS = 'session'
+SESSION_LOCAL_TTL = 5                       # seconds a hot session is served from memory
+SESSION_LOCAL_MAXSIZE = 10000
+SESSION_LAZY_LOAD = False                   # handlers must await request.session.load() when enabled
+
+RATE_LIMIT_CALLER_HEADER = 'X-Client-Id'    # falls back to the client address
+RATE_LIMIT_TRUSTED_PROXIES = ['127.0.0.1']  # peers allowed to name the caller, by header or X-Forwarded-For
+RATE_LIMIT_REDIS_ALIAS = 'ratelimit'        # shared buckets when configured in settings.REDIS
+RATE_LIMIT_RULES = [
+    # (method, path regex, burst, tokens per second)
+    ('POST', r'^/api/storage/[a-z]+/instances(/restore|/[0-9a-f]{12}/clone)?$', 10, 0.2),
+    ('*', r'^/api/', 100, 20),
+]
@@ -2,6 +2,8 @@
 
 import re
 import json
+import time
+from collections.abc import MutableMapping
 from importlib import import_module
 
 import loguru
@@ -10,14 +12,19 @@ from bson import ObjectId
 from attrdict import AttrDict
 from itsdangerous import TimestampSigner
 from starlette.requests import HTTPConnection
+from starlette.datastructures import Headers
+from starlette.middleware.gzip import GZipMiddleware
 from starlette.requests import Request
-from starlette.responses import Response
+from starlette.responses import Response, JSONResponse
 from starlette.datastructures import UploadFile
 from starlette.datastructures import MutableHeaders
 from starlette.types import Message
 from starlette.middleware.base import BaseHTTPMiddleware
 from fastapi import status
 
+from framework.conf import settings
+from framework.ratelimit import LocalTokenBuckets, RedisTokenBuckets, format_retry_after
+
 
 class RequestMiddleware(BaseHTTPMiddleware):
 
@@ -86,6 +93,151 @@ class RequestMiddleware(BaseHTTPMiddleware):
         return matcher is not None
 
 
+class StreamingGZipMiddleware(GZipMiddleware):
+
+    async def __call__(self, scope, receive, send):
+        # the gzip stream holds small chunks back, which would stall server-sent events
+        if scope['type'] == 'http' and 'text/event-stream' in Headers(scope=scope).get('accept', ''):
+            await self.app(scope, receive, send)
+            return
+        await super().__call__(scope, receive, send)
+
+
+class RateLimitMiddleware:
+    """Token bucket per caller and matching rule, answered with 429 once drained.
+
+    Rules are (method, path regex, burst, tokens per second), the first match wins.
+    Buckets live in process memory, or in Redis when RATE_LIMIT_REDIS_ALIAS is
+    configured so that every worker draws from the same bucket.
+    """
+
+    def __init__(self, app, config: AttrDict, logger):
+        self.app = app
+        self.config = config
+        self.logger = logger
+        self.rules = [
+            (method.upper(), re.compile(pattern), burst, rate)
+            for method, pattern, burst, rate in config.RATE_LIMIT_RULES
+        ]
+        self.trusted_proxies = set(config.RATE_LIMIT_TRUSTED_PROXIES)
+        self.buckets = None
+        if not self.use_redis():
+            self.buckets = LocalTokenBuckets()
+
+    def use_redis(self):
+        alias = self.config.RATE_LIMIT_REDIS_ALIAS
+        return bool(alias and alias in (getattr(settings, 'REDIS', None) or {}))
+
+    def get_buckets(self):
+        if self.buckets is None:
+            redis_cls = getattr(import_module('framework.redis'), 'RedisManager')
+            if redis_cls.instance() is None:
+                redis_cls.init(self.logger)
+            self.buckets = RedisTokenBuckets(redis_cls.instance().get(self.config.RATE_LIMIT_REDIS_ALIAS))
+        return self.buckets
+
+    def get_caller(self, scope):
+        # runs outside ProxyHeadersMiddleware, so the client is the actual peer; anyone else
+        # could pick a fresh bucket (and quota owner) with every request
+        peer = scope['client'][0] if scope.get('client') else None
+        if peer in self.trusted_proxies:
+            headers = Headers(scope=scope)
+            caller = headers.get(self.config.RATE_LIMIT_CALLER_HEADER)
+            if not caller and headers.get('x-forwarded-for'):
+                # the entry appended by the trusted proxy itself
+                caller = headers['x-forwarded-for'].split(',')[-1].strip()
+            if caller:
+                return caller[:64]
+        return peer or 'anonymous'
+
+    def match(self, scope):
+        for index, (method, pattern, burst, rate) in enumerate(self.rules):
+            if method in ('*', scope['method']) and pattern.match(scope['path']):
+                return index, burst, rate
+        return None
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            await self.app(scope, receive, send)
+            return
+
+        caller = self.get_caller(scope)
+        # also picked up by the handlers, e.g. for per-caller quotas
+        scope.setdefault('state', {})['caller'] = caller
+
+        rule = self.match(scope)
+        if rule is not None:
+            index, burst, rate = rule
+            allowed, retry_after = await self.get_buckets().acquire(f'{caller}:{index}', burst, rate)
+            if not allowed:
+                response = JSONResponse(
+                    status_code=status.HTTP_429_TOO_MANY_REQUESTS,
+                    content=dict(err=1, msg='请求过于频繁，请稍后重试'),
+                    headers={'Retry-After': format_retry_after(retry_after)})
+                await response(scope, receive, send)
+                return
+
+        await self.app(scope, receive, send)
+
+
+class RedisSession(MutableMapping):
+    """Session data backed by Redis.
+
+    By default the middleware loads it before the handler runs, so it behaves like any
+    Starlette session. With SESSION_LAZY_LOAD it is only fetched once a handler awaits
+    load() (or depends on get_session); a session served from the local cache or a brand
+    new one is usable right away either way.
+    """
+
+    def __init__(self, loader=None, payload: str = None):
+        self.loader = loader
+        self.payload = payload
+        self.data = None if payload is None else json.loads(payload)
+        self.fetched = False
+
+    @property
+    def loaded(self):
+        return self.data is not None
+
+    async def load(self):
+        if self.data is None:
+            self.payload = await self.loader()
+            self.data = json.loads(self.payload)
+            self.fetched = True
+        return self
+
+    def ensure(self):
+        if self.data is None:
+            raise RuntimeError('session is not loaded, SESSION_LAZY_LOAD requires awaiting request.session.load() first')
+        return self.data
+
+    def clear(self):
+        # dropping a session needs nothing from Redis
+        self.data = {}
+
+    def __getitem__(self, key):
+        return self.ensure()[key]
+
+    def __setitem__(self, key, value):
+        self.ensure()[key] = value
+
+    def __delitem__(self, key):
+        del self.ensure()[key]
+
+    def __iter__(self):
+        return iter(self.ensure())
+
+    def __len__(self):
+        return len(self.ensure())
+
+
+async def get_session(request: Request):
+    session = request.scope['session']
+    if isinstance(session, RedisSession):
+        await session.load()
+    return session
+
+
 class RedisSessionMiddleware:
 
     def __init__(self, app, config: AttrDict, logger):
@@ -94,9 +246,32 @@ class RedisSessionMiddleware:
         self.logger = logger
         self.signer = TimestampSigner(config.SESSION_SECRET_KEY)
 
-        redis_mgr = import_module('framework.redis').getattr('RedisManager').instance()
-        redis_mgr.init_redis(config.SESSION_REDIS_ALIAS)
-        self.redis = redis_mgr.get(config.SESSION_REDIS_ALIAS)
+        redis_cls = getattr(import_module('framework.redis'), 'RedisManager')
+        if redis_cls.instance() is None:
+            redis_cls.init(logger)
+        self.redis_mgr = redis_cls.instance()
+        self.redis_mgr.init_redis(config.SESSION_REDIS_ALIAS)
+        # session id -> (expire_at, payload), saves a round trip for hot sessions
+        self.cache = {}
+
+    def get_cached(self, session_id: str):
+        entry = self.cache.get(session_id)
+        if entry is None:
+            return None
+        if entry[0] < time.monotonic():
+            self.cache.pop(session_id, None)
+            return None
+        return entry[1]
+
+    def set_cached(self, session_id: str, payload: str):
+        if not self.config.SESSION_LOCAL_TTL:
+            return
+        if len(self.cache) >= self.config.SESSION_LOCAL_MAXSIZE:
+            now = time.monotonic()
+            self.cache = dict((key, entry) for key, entry in self.cache.items() if entry[0] > now)
+            if len(self.cache) >= self.config.SESSION_LOCAL_MAXSIZE:
+                self.cache.pop(next(iter(self.cache)))
+        self.cache[session_id] = (time.monotonic() + self.config.SESSION_LOCAL_TTL, payload)
 
     async def __call__(self, scope, receive, send):
         if scope['type'] not in ('http', 'websocket'):  # pragma: no cover
@@ -104,30 +279,51 @@ class RedisSessionMiddleware:
             return
 
         connection = HTTPConnection(scope)
-        is_empty_session = True
+        redis = self.redis_mgr.get(self.config.SESSION_REDIS_ALIAS)
+        session_id = connection.cookies.get(self.config.SESSION_COOKIE_NAME)
 
-        scope['session'] = {}
-        if self.config.SESSION_COOKIE_NAME in connection.cookies:
-            session_id = connection.cookies[self.config.SESSION_COOKIE_NAME]
+        if session_id:
             redis_key = f'{self.config.SESSION_KEY_PREFIX}{session_id}'
-            scope['session'] = json.loads(self.redis.get(redis_key))
-            scope['session_id'] = session_id
-            is_empty_session = False
 
-        async def send_wrapper(message: Message, **kwargs) -> None:
-            if message['type'] == 'http.response.start':
-                session_id = scope.pop('session_id', str(ObjectId()))
-                redis_key = f'{self.config.SESSION_KEY_PREFIX}{session_id}'
-
-                if scope['session']:
-                    self.redis.set(redis_key, json.dumps(scope['session']))
-                    self.redis.expire(redis_key, self.config.SESSION_COOKIE_MAXAGE)
-                    headers = MutableHeaders(scope=message)
-                    header_value = self._construct_cookie(session_id=session_id, clear=False)
-                    headers.append('Set-Cookie', header_value)
+            async def loader():
+                payload = await redis.get(redis_key)
+                if payload is None:
+                    return '{}'
+                payload = payload.decode()
+                self.set_cached(session_id, payload)
+                return payload
+
+            session = RedisSession(loader, self.get_cached(session_id))
+            # plain request.session access cannot wait for Redis, unless handlers opted in to load() it themselves
+            if not self.config.SESSION_LAZY_LOAD:
+                await session.load()
+        else:
+            session = RedisSession(payload='{}')
+        scope['session'] = session
 
-                elif not is_empty_session:
-                    self.redis.delete(redis_key)
+        async def send_wrapper(message: Message, **kwargs) -> None:
+            # an untouched session costs no Redis round trip at all
+            if message['type'] == 'http.response.start' and session.loaded:
+                payload = json.dumps(session.data)
+                if session.data:
+                    new_session_id = session_id or str(ObjectId())
+                    redis_key = f'{self.config.SESSION_KEY_PREFIX}{new_session_id}'
+                    changed = payload != session.payload
+                    if changed or session.fetched:
+                        # SET and the sliding EXPIRE go out in one round trip
+                        async with redis.pipeline(transaction=True) as pipe:
+                            if changed:
+                                pipe.set(redis_key, payload)
+                            pipe.expire(redis_key, self.config.SESSION_COOKIE_MAXAGE)
+                            await pipe.execute()
+                        self.set_cached(new_session_id, payload)
+                        headers = MutableHeaders(scope=message)
+                        header_value = self._construct_cookie(session_id=new_session_id, clear=False)
+                        headers.append('Set-Cookie', header_value)
+
+                elif session_id:
+                    await redis.delete(f'{self.config.SESSION_KEY_PREFIX}{session_id}')
+                    self.cache.pop(session_id, None)
                     headers = MutableHeaders(scope=message)
                     header_value = self._construct_cookie(clear=True)
                     headers.append('Set-Cookie', header_value)
@@ -0,0 +1,69 @@
+# coding=utf-8
+
+import math
+import time
+
+
+class LocalTokenBuckets:
+    """Token buckets kept in process memory, two floats per caller and rule."""
+
+    def __init__(self, purge_interval: float = 60):
+        self.buckets = {}
+        self.purge_interval = purge_interval
+        self._purged_at = time.monotonic()
+
+    def purge(self, now: float):
+        # a bucket idle long enough to be full again is the same as no bucket
+        self._purged_at = now
+        self.buckets = dict((key, bucket) for key, bucket in self.buckets.items() if bucket[2] > now)
+
+    async def acquire(self, key: str, capacity: int, rate: float, cost: int = 1):
+        now = time.monotonic()
+        if now - self._purged_at > self.purge_interval:
+            self.purge(now)
+
+        bucket = self.buckets.get(key)
+        tokens = capacity if bucket is None else min(capacity, bucket[0] + (now - bucket[1]) * rate)
+        allowed = tokens >= cost
+        if allowed:
+            tokens -= cost
+        self.buckets[key] = [tokens, now, now + (capacity - tokens) / rate]
+        return allowed, 0 if allowed else (cost - tokens) / rate
+
+
+class RedisTokenBuckets:
+    """Token buckets shared by every worker through one Redis hash per caller and rule."""
+
+    script = '''
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local now = tonumber(ARGV[3])
+local cost = tonumber(ARGV[4])
+local state = redis.call('HMGET', KEYS[1], 't', 's')
+local tokens = tonumber(state[1]) or capacity
+local stamp = tonumber(state[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - stamp) * rate)
+local allowed = 0
+if tokens >= cost then
+    tokens = tokens - cost
+    allowed = 1
+end
+redis.call('HSET', KEYS[1], 't', tostring(tokens), 's', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil((capacity - tokens) / rate * 1000) + 1000)
+return {allowed, tostring(tokens)}
+'''
+
+    def __init__(self, redis, prefix: str = 'ratelimit:'):
+        self.prefix = prefix
+        # EVALSHA with the script cached server side, one round trip per request
+        self.acquire_script = redis.register_script(self.script)
+
+    async def acquire(self, key: str, capacity: int, rate: float, cost: int = 1):
+        allowed, tokens = await self.acquire_script(
+                                keys=[f'{self.prefix}{key}'], args=[capacity, rate, time.time(), cost])
+        tokens = float(tokens)
+        return bool(allowed), 0 if allowed else (cost - tokens) / rate
+
+
+def format_retry_after(seconds: float):
+    return str(max(1, math.ceil(seconds)))
@@ -0,0 +1,65 @@
+# coding=utf-8
+
+import threading
+
+import redis.asyncio as aioredis
+
+from framework.conf import settings
+
+
+class RedisManager:
+    """Pooled asyncio Redis clients, one per alias in settings.REDIS.
+
+    An alias is either a redis:// URL or a dict of connection keywords:
+
+        REDIS = {
+            'session': {'host': '127.0.0.1', 'port': 6379, 'db': 0, 'max_connections': 32},
+        }
+    """
+
+    _mutex = threading.Lock()
+    _instance = None
+
+    def __new__(cls, logger, *args, **kwargs):
+        with cls._mutex:
+            if cls._instance is None:
+                cls._instance = object.__new__(cls, *args, **kwargs)
+        return cls._instance
+
+    @classmethod
+    def init(cls, logger=None):
+        cls._instance = cls(logger)
+
+    @classmethod
+    def instance(cls):
+        return cls._instance
+
+    def __init__(self, logger):
+        self.logger = logger
+        self.configs = {}
+        self.clients = {}
+
+    def init_redis(self, alias: str):
+        config = (getattr(settings, 'REDIS', None) or {}).get(alias)
+        if config is None:
+            raise KeyError(f'redis alias {alias} is not configured')
+        self.configs[alias] = config
+
+    def get(self, alias: str):
+        # built on first use, so the pool belongs to the loop serving requests
+        client = self.clients.get(alias)
+        if client is None:
+            if alias not in self.configs:
+                self.init_redis(alias)
+            config = self.configs[alias]
+            if isinstance(config, str):
+                pool = aioredis.ConnectionPool.from_url(config)
+            else:
+                pool = aioredis.ConnectionPool(**config)
+            client = self.clients[alias] = aioredis.Redis(connection_pool=pool)
+        return client
+
+    async def close(self):
+        clients, self.clients = self.clients, {}
+        for client in clients.values():
+            await client.connection_pool.disconnect()
@@ -0,0 +1,70 @@
+# coding=utf-8
+
+import time
+import threading
+from concurrent.futures import Future
+
+
+class SingleFlight:
+    """Collapses concurrent calls for the same key into one backend call.
+
+    With a ttl, a finished result is also served to later callers for that long.
+    """
+
+    def __init__(self, ttl: float = 0, max_entries: int = 1024):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.calls = {}
+        self.cache = {}
+        self.counters = {'calls': 0, 'executed': 0, 'collapsed': 0, 'cached': 0}
+        self._mutex = threading.Lock()
+
+    def do(self, key, func):
+        with self._mutex:
+            self.counters['calls'] += 1
+            if self.ttl:
+                cached = self.cache.get(key)
+                if cached and cached[0] > time.monotonic():
+                    self.counters['cached'] += 1
+                    return cached[1]
+
+            future = self.calls.get(key)
+            owner = future is None
+            if owner:
+                future = self.calls[key] = Future()
+            else:
+                self.counters['collapsed'] += 1
+
+        if not owner:
+            return future.result()
+
+        try:
+            result = func()
+        except BaseException as e:
+            with self._mutex:
+                self.calls.pop(key, None)
+            future.set_exception(e)
+            raise
+
+        with self._mutex:
+            self.calls.pop(key, None)
+            self.counters['executed'] += 1
+            if self.ttl:
+                if len(self.cache) >= self.max_entries:
+                    now = time.monotonic()
+                    self.cache = dict((k, v) for k, v in self.cache.items() if v[0] > now)
+                if len(self.cache) < self.max_entries:
+                    self.cache[key] = (time.monotonic() + self.ttl, result)
+        future.set_result(result)
+        return result
+
+    def forget(self, key=None):
+        with self._mutex:
+            if key is None:
+                self.cache.clear()
+            else:
+                self.cache.pop(key, None)
+
+    def report(self):
+        with self._mutex:
+            return dict(self.counters)
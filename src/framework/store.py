@@ -0,0 +1,63 @@
+# coding=utf-8
+
+import os
+import json
+import threading
+
+from framework.conf import settings
+
+
+class FileStore:
+
+    def __init__(self, name: str):
+        self.path = os.path.join(settings.WORKSPACE, settings.STORE_FOLDER, f'{name}.json')
+        self._mutex = threading.RLock()
+        self.data = self.load()
+
+    def load(self):
+        try:
+            with open(self.path, 'r') as fp:
+                return json.load(fp)
+        except (FileNotFoundError, ValueError):
+            return {}
+
+    def save(self):
+        # write to a temporary file first so a crash never leaves a truncated store
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        tmp_path = f'{self.path}.tmp'
+        with open(tmp_path, 'w') as fp:
+            json.dump(self.data, fp, separators=(',', ':'))
+        os.replace(tmp_path, self.path)
+
+    def get(self, key: str, default=None):
+        return self.data.get(key, default)
+
+    def set(self, key: str, value):
+        with self._mutex:
+            self.data[key] = value
+            self.save()
+
+    def pop(self, key: str, default=None):
+        with self._mutex:
+            if key not in self.data:
+                return default
+            value = self.data.pop(key)
+            self.save()
+            return value
+
+    def update(self, changes: dict):
+        # many keys at once, written out once; a None value removes the key
+        with self._mutex:
+            for key, value in changes.items():
+                if value is None:
+                    self.data.pop(key, None)
+                else:
+                    self.data[key] = value
+            self.save()
+
+    def items(self):
+        with self._mutex:
+            return list(self.data.items())
+
+    def __contains__(self, key: str):
+        return key in self.data
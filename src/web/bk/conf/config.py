@@ -3,3 +3,4 @@
 FASTAPI_DEBUG = True
 FASTAPI_ENABLE_GZIP = True
 FASTAPI_ENABLE_CORS = True
+FASTAPI_ENABLE_RATE_LIMIT = True
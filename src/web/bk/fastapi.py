@@ -3,15 +3,53 @@
 from importlib import import_module
 
 from framework.conf import settings
+from framework.docker import DockerManager
+from framework.redis import RedisManager as RedisRegistry
 from framework.fastapi.builder import FastAPIBuilder
 from apps.storage.managers.redis import RedisManager
 from apps.storage.managers.mysql import MySQLManager
+from apps.storage.managers.volume import VolumeManager
+from apps.storage.managers.hibernation import HibernationManager
+from apps.storage.managers.proxy import ProxyManager
+from apps.storage.managers.stats import StatsManager
+from apps.storage.managers.watch import WatchManager
+from apps.storage.managers.idempotency import IdempotencyManager
+from apps.storage.managers.lease import LeaseManager
+from apps.storage.managers.health import HealthManager
+from apps.storage.managers.insights import InsightsManager
 
 
 class Builder(FastAPIBuilder):
 
-    def on_startup(self):
+    async def on_startup(self):
         self.logger.info('Services init.')
+        DockerManager.init(self.logger)
+        VolumeManager.init(self.logger)
+        HibernationManager.init(self.logger)
+        StatsManager.init(self.logger)
+        WatchManager.init(self.logger)
+        IdempotencyManager.init(self.logger)
+        LeaseManager.init(self.logger)
+        HealthManager.init(self.logger)
+        InsightsManager.init(self.logger)
         RedisManager.init(self.logger)
         MySQLManager.init(self.logger)
+
+        if settings.HEALTH_ENABLED:
+            await HealthManager.instance().start()
+
+        if settings.PROXY_ENABLED:
+            ProxyManager.init(self.logger)
+            ProxyManager.instance().register(RedisManager.instance())
+            ProxyManager.instance().register(MySQLManager.instance())
+            await ProxyManager.instance().start()
         self.logger.info('Services ready.')
+
+    async def on_shutdown(self):
+        if HealthManager.instance():
+            await HealthManager.instance().stop()
+        if ProxyManager.instance():
+            await ProxyManager.instance().stop()
+        if RedisRegistry.instance():
+            await RedisRegistry.instance().close()
+        DockerManager.instance().close()
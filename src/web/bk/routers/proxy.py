@@ -0,0 +1,29 @@
+# coding=utf-8
+
+from fastapi import APIRouter
+
+from apps.storage.managers.proxy import ProxyManager
+from ..schemas.base import BaseResponse
+
+
+router = APIRouter(
+    prefix='/api/storage/proxy',
+    tags=['proxy'],
+    responses={
+        404: dict(description='Not found'),
+    },
+)
+
+
+@router.get('/routes', response_model=BaseResponse, response_model_exclude_unset=True)
+async def list_routes():
+    proxy = ProxyManager.instance()
+    if proxy is None:
+        return dict(err=1, msg='代理服务未开启')
+
+    routes = proxy.report()
+    return dict(err=0, data={
+        'total': len(routes),
+        'active': sum(route['active'] for route in routes),
+        'routes': routes,
+    })
@@ -1,10 +1,22 @@
 # coding=utf-8
 
-from fastapi import APIRouter, Query
+import datetime
+from typing import Optional
+
+import orjson
+from fastapi import APIRouter, Header, Query, Request
+from fastapi.responses import ORJSONResponse, Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+
+from framework.conf import settings
+from framework.fastapi.conditional import is_not_modified, make_cache_headers, not_modified_response
+from apps.storage.models.container import ContainerStatus
 
 from apps.storage.managers.redis import RedisManager
-from ..schemas.base import BaseResponse
-from ..schemas.redis import RedisConfig
+from apps.storage.managers.volume import VolumeManager
+from apps.storage.snapshot import receive_snapshot
+from ..schemas.base import BaseResponse, SnapshotCompression
+from ..schemas.redis import RedisConfig, RedisConfigPatch
 
 
 router = APIRouter(
@@ -17,35 +29,218 @@ router = APIRouter(
 
 
 @router.get('/instances', response_model=BaseResponse, response_model_exclude_unset=True)
-async def list_instances():
-    instances = RedisManager.instance().list()
-    return dict(err=0, data={
-        'total': len(instances),
+async def list_instances(request: Request,
+                         status: Optional[ContainerStatus] = Query(None),
+                         port: Optional[int] = Query(None, gt=0, lt=65536),
+                         created_after: Optional[datetime.datetime] = Query(None),
+                         cursor: Optional[str] = Query(None),
+                         limit: Optional[int] = Query(None, ge=1, le=settings.LIST_MAX_LIMIT)):
+    manager = RedisManager.instance()
+    # taken before the query, so a change racing with it only costs a refetch
+    etag, last_modified = manager.get_list_etag(request.url.query)
+    if is_not_modified(request, etag):
+        return not_modified_response(etag, last_modified)
+
+    # in the threadpool, so identical concurrent queries can share one docker call
+    total, instances, next_cursor = await run_in_threadpool(
+        manager.query, cursor=cursor, limit=limit, status=status, port=port,
+        created_after=created_after and created_after.timestamp())
+    # the payload is plain JSON already, skip re-validating it against BaseResponse
+    return ORJSONResponse(dict(err=0, data={
+        'total': total,
         'instances': [instance.to_json() for instance in instances],
+        'next_cursor': next_cursor,
+    }), headers=make_cache_headers(etag, last_modified))
+
+
+@router.get('/instances/stream')
+async def stream_instances(status: Optional[ContainerStatus] = Query(None),
+                           port: Optional[int] = Query(None, gt=0, lt=65536),
+                           created_after: Optional[datetime.datetime] = Query(None)):
+    instances = RedisManager.instance().iter_instances(
+        status=status, port=port, created_after=created_after and created_after.timestamp())
+    content = (orjson.dumps(instance.to_json()) + b'\n' for instance in instances)
+    return StreamingResponse(content, media_type='application/x-ndjson')
+
+
+@router.get('/instances/stats', response_model=BaseResponse, response_model_exclude_unset=True)
+async def list_instance_stats():
+    stats = await run_in_threadpool(RedisManager.instance().list_stats)
+    return dict(err=0, data={
+        'total': len(stats),
+        'instances': stats,
     })
 
 
+@router.get('/coalescing', response_model=BaseResponse, response_model_exclude_unset=True)
+async def get_coalescing_stats():
+    return dict(err=0, data=RedisManager.instance().flight_stats())
+
+
+@router.get('/instances/{instance_id}/stats', response_model=BaseResponse, response_model_exclude_unset=True)
+async def get_instance_stats(instance_id: str = Query(None, regex=r'[0-9a-f]{12}'),
+                             history: bool = Query(False)):
+    stats = await run_in_threadpool(RedisManager.instance().stats, instance_id, history)
+    if stats is None:
+        return dict(err=1, msg='暂无统计数据')
+    return dict(err=0, data=stats)
+
+
+@router.get('/instances/{instance_id}/cluster', response_model=BaseResponse, response_model_exclude_unset=True)
+async def get_instance_cluster(instance_id: str = Query(None, regex=r'[0-9a-f]{12}')):
+    cluster = await run_in_threadpool(RedisManager.instance().cluster, instance_id)
+    return dict(err=0, data=cluster)
+
+
 @router.get('/instances/{instance_id}/config', response_model=BaseResponse, response_model_exclude_unset=True)
-async def get_instance_config(instance_id: str = Query(None, regex=r'[0-9a-f]{12}')):
-    config = RedisManager.instance().info(instance_id)
+async def get_instance_config(request: Request, instance_id: str = Query(None, regex=r'[0-9a-f]{12}')):
+    manager = RedisManager.instance()
+    etag, last_modified = manager.get_config_etag(instance_id)
+    if is_not_modified(request, etag):
+        return not_modified_response(etag, last_modified)
+
+    config = await run_in_threadpool(manager.info, instance_id)
     if config is None:
         return dict(err=1, msg='查询失败')
-    return dict(err=0, data=config)
+    content = orjson.dumps(dict(err=0, data=config))
+    etag, last_modified = manager.set_config_etag(instance_id, content)
+    return Response(content, media_type='application/json', headers=make_cache_headers(etag, last_modified))
+
+
+@router.patch('/instances/{instance_id}/config', response_model=BaseResponse, response_model_exclude_unset=True)
+async def update_instance_config(config: RedisConfigPatch,
+                                 instance_id: str = Query(None, regex=r'[0-9a-f]{12}')):
+    changes = config.dict()
+    if not changes:
+        return dict(err=1, msg='未指定配置项')
+    result = await run_in_threadpool(RedisManager.instance().update_config, instance_id, changes)
+    if any('error' in node for node in result.get('nodes', [])):
+        return dict(err=1, msg='部分节点修改失败', data=result)
+    return dict(err=0, msg='修改成功', data=result)
 
 
 @router.post('/instances', response_model=BaseResponse, response_model_exclude_unset=True)
-async def create_instance(config: RedisConfig):
+async def create_instance(request: Request, config: RedisConfig,
+                          idempotency_key: Optional[str] = Header(None, alias='Idempotency-Key', max_length=255)):
     config_dict = config.dict()
-    instance, connection = RedisManager.instance().create(config_dict)
+    # quotas are counted per caller, as identified by the rate limiter
+    config_dict['owner'] = getattr(request.state, 'caller', None)
+    if idempotency_key:
+        # a retry can attach to the create still running
+        instance, connection = await run_in_threadpool(
+            RedisManager.instance().create_once, idempotency_key, config_dict)
+    else:
+        instance, connection = await run_in_threadpool(RedisManager.instance().create, config_dict)
     return dict(err=0, msg='创建成功', data={
         'instance': instance.to_json(),
         'connection': connection.to_json(),
     })
 
 
+@router.post('/instances/{instance_id}/resume', response_model=BaseResponse, response_model_exclude_unset=True)
+async def resume_instance(instance_id: str = Query(None, regex=r'[0-9a-f]{12}')):
+    instance = await run_in_threadpool(RedisManager.instance().resume, instance_id)
+    return dict(err=0, msg='唤醒成功', data=instance.to_json())
+
+
+@router.post('/instances/{instance_id}/renew', response_model=BaseResponse, response_model_exclude_unset=True)
+async def renew_instance(instance_id: str = Query(None, regex=r'[0-9a-f]{12}'),
+                         ttl: int = Query(..., gt=0, le=settings.LEASE_MAX_TTL)):
+    instance = await run_in_threadpool(RedisManager.instance().renew, instance_id, ttl)
+    return dict(err=0, msg='续租成功', data=instance.to_json())
+
+
+@router.post('/instances/{instance_id}/extend', response_model=BaseResponse, response_model_exclude_unset=True)
+async def extend_instance(instance_id: str = Query(None, regex=r'[0-9a-f]{12}'),
+                          seconds: int = Query(..., gt=0, le=settings.LEASE_MAX_TTL)):
+    instance = await run_in_threadpool(RedisManager.instance().extend, instance_id, seconds)
+    return dict(err=0, msg='延长租约成功', data=instance.to_json())
+
+
+@router.post('/instances/{instance_id}/clone', response_model=BaseResponse, response_model_exclude_unset=True)
+async def clone_instance(request: Request,
+                         instance_id: str = Query(None, regex=r'[0-9a-f]{12}'), count: int = Query(1, ge=1),
+                         ttl: Optional[int] = Query(None, gt=0, le=settings.LEASE_MAX_TTL)):
+    # a checkpoint plus N creates, keep them off the event loop
+    results = await run_in_threadpool(
+                    RedisManager.instance().clone, instance_id, count, owner=getattr(request.state, 'caller', None), ttl=ttl)
+    return dict(err=0, msg='克隆成功', data={
+        'total': len(results),
+        'instances': [
+            {'instance': instance.to_json(), 'connection': connection.to_json()}
+            for instance, connection in results
+        ],
+    })
+
+
+@router.get('/instances/{instance_id}/insights', response_model=BaseResponse, response_model_exclude_unset=True)
+async def get_instance_insights(instance_id: str = Query(None, regex=r'[0-9a-f]{12}'),
+                                limit: int = Query(10, ge=1, le=settings.INSIGHTS_MAX_ENTRIES)):
+    insights = await run_in_threadpool(RedisManager.instance().get_insights, instance_id, limit)
+    if insights is None:
+        return dict(err=1, msg='暂无诊断数据')
+    return dict(err=0, data=insights)
+
+
+@router.post('/instances/{instance_id}/benchmark', response_model=BaseResponse, response_model_exclude_unset=True)
+async def benchmark_instance(instance_id: str = Query(None, regex=r'[0-9a-f]{12}'),
+                             duration: float = Query(3, gt=0, le=settings.BENCHMARK_MAX_DURATION),
+                             proxy: bool = Query(False)):
+    # seconds of blocking client I/O, keep it off the event loop
+    result = await run_in_threadpool(RedisManager.instance().benchmark, instance_id, duration, proxy)
+    return dict(err=0, msg='测试完成', data=result)
+
+
+@router.get('/instances/{instance_id}/benchmark', response_model=BaseResponse, response_model_exclude_unset=True)
+async def get_instance_benchmark(instance_id: str = Query(None, regex=r'[0-9a-f]{12}')):
+    result = await run_in_threadpool(RedisManager.instance().get_benchmark, instance_id)
+    if result is None:
+        return dict(err=1, msg='暂无测试结果')
+    return dict(err=0, data=result)
+
+
+@router.get('/instances/{instance_id}/memory-report')
+async def get_instance_memory_report(instance_id: str = Query(None, regex=r'[0-9a-f]{12}'),
+                                     sample: float = Query(settings.MEMORY_REPORT_SAMPLE_RATIO, gt=0, le=1),
+                                     max_keys: int = Query(0, ge=0),
+                                     depth: int = Query(3, ge=1, le=8),
+                                     limit: int = Query(20, ge=1, le=100)):
+    # a sync generator, so the scan runs in the threadpool as the response streams
+    messages = await run_in_threadpool(
+                    RedisManager.instance().memory_report, instance_id, sample, max_keys, depth, limit)
+    content = (orjson.dumps(message) + b'\n' for message in messages)
+    return StreamingResponse(content, media_type='application/x-ndjson')
+
+
+@router.post('/instances/{instance_id}/snapshot')
+async def export_instance_snapshot(instance_id: str = Query(None, regex=r'[0-9a-f]{12}'),
+                                   compression: SnapshotCompression = Query(SnapshotCompression.NONE)):
+    content = await run_in_threadpool(RedisManager.instance().export_snapshot, instance_id, compression.value)
+    if compression == SnapshotCompression.GZIP:
+        media_type, filename = 'application/gzip', f'{instance_id}.tar.gz'
+    else:
+        media_type, filename = 'application/x-tar', f'{instance_id}.tar'
+    headers = {'Content-Disposition': f'attachment; filename="{filename}"'}
+    return StreamingResponse(content, media_type=media_type, headers=headers)
+
+
+@router.post('/instances/restore', response_model=BaseResponse, response_model_exclude_unset=True)
+async def restore_instance(request: Request,
+                           ttl: Optional[int] = Query(None, gt=0, le=settings.LEASE_MAX_TTL)):
+    with VolumeManager.instance().staging() as staging_path:
+        await receive_snapshot(request.stream(), staging_path)
+        instance, connection = await run_in_threadpool(
+                                    RedisManager.instance().restore,
+                                    staging_path, owner=getattr(request.state, 'caller', None), ttl=ttl)
+    return dict(err=0, msg='恢复成功', data={
+        'instance': instance.to_json(),
+        'connection': connection.to_json(),
+    })
+
+
 @router.delete('/instances/{instance_id}', response_model=BaseResponse, response_model_exclude_unset=True)
 async def remove_instance(instance_id: str = Query(None, regex=r'[0-9a-f]{12}')):
-    flag = RedisManager.instance().remove(instance_id)
+    flag = await run_in_threadpool(RedisManager.instance().remove, instance_id)
     if not flag:
 	    return dict(err=1, msg='删除失败')
     return dict(err=0, msg='删除成功')
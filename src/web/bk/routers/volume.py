@@ -0,0 +1,25 @@
+# coding=utf-8
+
+from fastapi import APIRouter
+
+from apps.storage.managers.volume import VolumeManager
+from ..schemas.base import BaseResponse
+
+
+router = APIRouter(
+    prefix='/api/storage/volumes',
+    tags=['volume'],
+    responses={
+        404: dict(description='Not found'),
+    },
+)
+
+
+@router.get('', response_model=BaseResponse, response_model_exclude_unset=True)
+async def list_volumes():
+    volumes = VolumeManager.instance().report()
+    return dict(err=0, data={
+        'total': len(volumes),
+        'size': sum(item['size'] for item in volumes),
+        'volumes': volumes,
+    })
@@ -0,0 +1,66 @@
+# coding=utf-8
+
+from typing import List, Optional
+
+import orjson
+from fastapi import APIRouter, Header, Query, WebSocket, WebSocketDisconnect
+from fastapi.responses import StreamingResponse
+
+from apps.storage.managers.watch import WatchManager
+
+
+router = APIRouter(
+    prefix='/api/storage/watch',
+    tags=['watch'],
+    responses={
+        404: dict(description='Not found'),
+    },
+)
+
+
+def format_sse(message: dict):
+    if message is None:
+        return b': heartbeat\n\n'
+
+    lines = []
+    if 'id' in message:
+        lines.append(f"id: {message['id']}")
+    lines.append(f"event: {message['event']}")
+    return '\n'.join(lines).encode() + b'\ndata: ' + orjson.dumps(message) + b'\n\n'
+
+
+@router.get('')
+async def watch_events(types: Optional[List[str]] = Query(None, alias='type'),
+                       ids: Optional[List[str]] = Query(None, alias='id'),
+                       events: Optional[List[str]] = Query(None, alias='event'),
+                       last_event_id: Optional[str] = Query(None),
+                       last_event_id_header: Optional[str] = Header(None, alias='Last-Event-ID')):
+    # EventSource sends Last-Event-ID by itself when it reconnects
+    messages = WatchManager.instance().watch(types, ids, events, last_event_id_header or last_event_id)
+
+    async def content():
+        async for message in messages:
+            yield format_sse(message)
+
+    headers = {'Cache-Control': 'no-cache', 'X-Accel-Buffering': 'no'}
+    return StreamingResponse(content(), media_type='text/event-stream', headers=headers)
+
+
+@router.websocket('/ws')
+async def watch_events_ws(websocket: WebSocket,
+                          types: Optional[List[str]] = Query(None, alias='type'),
+                          ids: Optional[List[str]] = Query(None, alias='id'),
+                          events: Optional[List[str]] = Query(None, alias='event'),
+                          last_event_id: Optional[str] = Query(None)):
+    await websocket.accept()
+    messages = WatchManager.instance().watch(types, ids, events, last_event_id)
+    try:
+        async for message in messages:
+            if message is None:
+                message = {'event': 'heartbeat'}
+            await websocket.send_text(orjson.dumps(message).decode())
+        await websocket.close()
+    except WebSocketDisconnect:
+        pass
+    finally:
+        await messages.aclose()
@@ -1,11 +1,21 @@
 # coding=utf-8
 
+import enum
 from typing import Optional, Union, Any
 
 from pydantic import BaseModel, Field
 
+# defined next to the code that acts on them, so the accepted values cannot drift apart
+from apps.storage.managers.volume import StorageTier
+from apps.storage.profiles import WorkloadProfile
+
 
 class BaseResponse(BaseModel):
     err: int = 0
     msg: Optional[str] = ''
     data: Optional[Union[dict, list, None]] = Field(None, example='null')
+
+
+class SnapshotCompression(enum.Enum):
+    NONE = 'none'
+    GZIP = 'gzip'
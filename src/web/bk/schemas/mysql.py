@@ -5,6 +5,9 @@ from typing import Optional
 
 from pydantic import BaseModel, Field
 
+from framework.conf import settings
+from .base import StorageTier, WorkloadProfile
+
 
 class MySQLBinlogFormat(enum.Enum):
     STATEMENT = 'STATEMENT'
@@ -24,9 +27,51 @@ class MySQLConfig(BaseModel):
     binlog_format: Optional[MySQLBinlogFormat] = Field(
                     MySQLBinlogFormat.STATEMENT, example='STATEMENT',
                     description='Supported Binary Log Formats.')
+    autoinc_lock_mode: Optional[int] = Field(
+                    2, ge=0, le=2, example=1,
+                    description='innodb_autoinc_lock_mode, 1 keeps auto-increment ids safe for statement-based binlogs.')
+    profile: Optional[WorkloadProfile] = Field(
+                    None, example='oltp-small',
+                    description='Workload profile used to derive the performance-relevant settings.')
+    memory: Optional[int] = Field(
+                    0, ge=0, example=536870912,
+                    description='Memory budget of the instance in bytes, 0 means unlimited.')
+    cpus: Optional[float] = Field(
+                    0, ge=0, example=2,
+                    description='CPU budget of the instance in cores, 0 means unlimited.')
+    tier: Optional[StorageTier] = Field(
+                    StorageTier.DISK, example='disk',
+                    description='Where the instance data lives: disk, tmpfs (memory) or fast-disk.')
+    ttl: Optional[int] = Field(
+                    None, gt=0, le=settings.LEASE_MAX_TTL, example=3600,
+                    description='Lease in seconds, the instance is removed once it expires.')
+    replicas: Optional[int] = Field(
+                    0, ge=0, example=2,
+                    description='Number of read replicas following the primary, 0 provisions a standalone instance.')
 
     def dict(self):
         data = super().dict()
-        data['charset'] = data['charset'].value
-        data['binlog_format'] = data['binlog_format'].value
+        for key, value in data.items():
+            if isinstance(value, enum.Enum):
+                data[key] = value.value
+        return data
+
+
+class MySQLConfigPatch(BaseModel):
+    charset: Optional[MySQLCharset] = Field(
+                    None, example='utf8mb4',
+                    description='The servers default character set.')
+    binlog_format: Optional[MySQLBinlogFormat] = Field(
+                    None, example='ROW',
+                    description='Supported Binary Log Formats.')
+    autoinc_lock_mode: Optional[int] = Field(
+                    None, ge=0, le=2, example=1,
+                    description='innodb_autoinc_lock_mode, 1 keeps auto-increment ids safe for statement-based binlogs; '
+                                'static, applied by restarting the instance.')
+
+    def dict(self):
+        data = super().dict(exclude_none=True)
+        for key, value in data.items():
+            if isinstance(value, enum.Enum):
+                data[key] = value.value
         return data
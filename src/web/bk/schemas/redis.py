@@ -5,6 +5,9 @@ from typing import Optional
 
 from pydantic import BaseModel, Field
 
+from framework.conf import settings
+from .base import StorageTier, WorkloadProfile
+
 
 class RedisAppendFSync(enum.Enum):
     ALWAYS = 'always'
@@ -20,10 +23,52 @@ class RedisConfig(BaseModel):
                     10000, gt=0, example=100,
                     description="Set the max number of connected clients at the same time.")
     appendfsync: Optional[RedisAppendFSync] = Field(
-                    RedisAppendFSync.EVERYSEC, example='everysec',
-                    description='The fsync() call tells the Operating System to actually write data on disk.')
+                    None, example='everysec',
+                    description='The fsync() call tells the Operating System to actually write data on disk, '
+                                'defaults to what the workload profile prescribes.')
+    profile: Optional[WorkloadProfile] = Field(
+                    None, example='oltp-small',
+                    description='Workload profile used to derive the performance-relevant settings.')
+    memory: Optional[int] = Field(
+                    0, ge=0, example=536870912,
+                    description='Memory budget of the instance in bytes, 0 means unlimited.')
+    cpus: Optional[float] = Field(
+                    0, ge=0, example=2,
+                    description='CPU budget of the instance in cores, 0 means unlimited.')
+    tier: Optional[StorageTier] = Field(
+                    StorageTier.DISK, example='disk',
+                    description='Where the instance data lives: disk, tmpfs (memory) or fast-disk.')
+    ttl: Optional[int] = Field(
+                    None, gt=0, le=settings.LEASE_MAX_TTL, example=3600,
+                    description='Lease in seconds, the instance is removed once it expires.')
+    shards: Optional[int] = Field(
+                    0, ge=0, example=3,
+                    description='Number of Redis Cluster masters, 0 provisions a standalone instance.')
+    replicas: Optional[int] = Field(
+                    0, ge=0, example=1,
+                    description='Number of replicas per Redis Cluster master.')
 
     def dict(self):
         data = super().dict()
-        data['appendfsync'] = data['appendfsync'].value
+        for key, value in data.items():
+            if isinstance(value, enum.Enum):
+                data[key] = value.value
+        return data
+
+
+class RedisConfigPatch(BaseModel):
+    maxmemory: Optional[int] = Field(
+                    None, ge=0, example=1000,
+                    description="Don't use more memory than the specified amount of bytes.")
+    maxclients: Optional[int] = Field(
+                    None, gt=0, example=100,
+                    description="Set the max number of connected clients at the same time.")
+    appendfsync: Optional[RedisAppendFSync] = Field(
+                    None, example='everysec',
+                    description='The fsync() call tells the Operating System to actually write data on disk.')
+
+    def dict(self):
+        data = super().dict(exclude_none=True)
+        if 'appendfsync' in data:
+            data['appendfsync'] = data['appendfsync'].value
         return data